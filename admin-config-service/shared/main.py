@@ -9,6 +9,7 @@ import os
 import crud
 import models
 from database import get_db, init_db
+from messaging import async_publisher
 
 # Локальные заглушки вместо общего shared модуля
 class AuthUtils:
@@ -411,6 +412,9 @@ async def startup_event():
     init_db()
     print("Database initialized")
     
+    # События публикуются в фоне, запрос не ждёт RabbitMQ
+    async_publisher.start()
+    
     # Subscribe to config events from other services
     from crud import message_broker  # Добавляем импорт здесь
     message_broker.subscribe_to_events(
@@ -418,6 +422,12 @@ async def startup_event():
         routing_keys=["config.*"],
         callback=lambda event: print(f"Config event received: {event['event_type']}")
     )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from crud import message_broker
+    message_broker.close()
+    await async_publisher.stop()
     
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel, Field
+
+from breaker import CircuitOpenError
+from proxy import HOP_BY_HOP_HEADERS
+from routing import RouteTable
+from shared.auth import IDENTITY_HEADERS
+from upstreams import UpstreamRegistry, UpstreamSaturatedError
+
+BATCH_MAX_REQUESTS = int(os.getenv("GATEWAY_BATCH_MAX_REQUESTS", "20"))
+# Sub-requests of one batch sent at the same time
+BATCH_CONCURRENCY = int(os.getenv("GATEWAY_BATCH_CONCURRENCY", "10"))
+
+BATCH_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH")
+
+# Never taken from a sub-request, the gateway sets or computes them
+_SKIP_HEADERS = HOP_BY_HOP_HEADERS | set(IDENTITY_HEADERS) | {"host", "content-length", "authorization"}
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    headers: Dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
+class BatchExecutor:
+    """Runs the sub-requests of a batch concurrently over the pooled upstream clients.
+
+    Every item gets its own status; one failing call does not fail the batch.
+    """
+
+    def __init__(self, registry: UpstreamRegistry, concurrency: int = BATCH_CONCURRENCY):
+        self.registry = registry
+        self.concurrency = concurrency
+        self.batches = 0
+        self.items = 0
+
+    @staticmethod
+    def _result(item_id: str, status: int, body: Any, headers: Optional[Dict[str, str]] = None,
+                started: Optional[float] = None) -> dict:
+        return {
+            "id": item_id,
+            "status": status,
+            "headers": headers or {},
+            "body": body,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2) if started else None,
+        }
+
+    @staticmethod
+    def _decode(response: httpx.Response) -> Any:
+        """JSON bodies are embedded as JSON, anything else as text"""
+        if not response.content:
+            return None
+        if "json" in response.headers.get("content-type", ""):
+            try:
+                return response.json()
+            except ValueError:
+                pass
+        return response.text
+
+    async def _run_one(self, index: int, item: BatchItem, routes: RouteTable,
+                       identity: Optional[Dict[str, str]], semaphore: asyncio.Semaphore) -> dict:
+        item_id = item.id if item.id is not None else str(index)
+        method = item.method.upper()
+        if method not in BATCH_METHODS:
+            return self._result(item_id, 405, {"detail": f"Method {method} not allowed"})
+
+        path, _, query = item.path.lstrip("/").partition("?")
+        route, target_path = routes.match(path)
+        if route is None:
+            return self._result(item_id, 404, {"detail": f"No service found for path: {path}"})
+        if route.auth_required and identity is None:
+            return self._result(item_id, 401, {"detail": "Authentication required"})
+
+        headers = [(key, value) for key, value in item.headers.items() if key.lower() not in _SKIP_HEADERS]
+        if identity:
+            headers.extend(identity.items())
+        kwargs = {"headers": headers, "params": query}
+        if item.body is not None:
+            kwargs["json"] = item.body
+        if route.timeout is not None:
+            kwargs["timeout"] = route.timeout
+
+        upstream = self.registry.get(route.upstream)
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                response = await upstream.request(method, target_path, **kwargs)
+        except CircuitOpenError:
+            return self._result(item_id, 503, {"detail": f"Service temporarily unavailable: {route.upstream}"}, started=started)
+        except UpstreamSaturatedError:
+            return self._result(item_id, 503, {"detail": f"Service overloaded: {route.upstream}"}, started=started)
+        except httpx.TimeoutException:
+            return self._result(item_id, 504, {"detail": f"Service timeout: {route.upstream}"}, started=started)
+        except Exception as e:
+            return self._result(item_id, 502, {"detail": f"Service error: {str(e)}"}, started=started)
+
+        response_headers = {}
+        for key in ("content-type", "etag", "location", "retry-after"):
+            if key in response.headers:
+                response_headers[key] = response.headers[key]
+        return self._result(item_id, response.status_code, self._decode(response), response_headers, started)
+
+    async def run(self, batch: BatchRequest, routes: RouteTable,
+                  identity: Optional[Dict[str, str]] = None) -> List[dict]:
+        """Results in the order of the sub-requests"""
+        self.batches += 1
+        self.items += len(batch.requests)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(
+            self._run_one(index, item, routes, identity, semaphore)
+            for index, item in enumerate(batch.requests)
+        ))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "max_requests": BATCH_MAX_REQUESTS,
+            "concurrency": self.concurrency,
+        }
@@ -0,0 +1,139 @@
+import os
+import time
+from collections import deque
+from typing import Optional
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "10"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+# Adaptive timeout: observed p99 latency times a multiplier, clamped to
+# [BREAKER_MIN_TIMEOUT, upstream timeout]
+BREAKER_TIMEOUT_MULTIPLIER = float(os.getenv("BREAKER_TIMEOUT_MULTIPLIER", "3"))
+BREAKER_MIN_TIMEOUT = float(os.getenv("BREAKER_MIN_TIMEOUT", "5"))
+BREAKER_LATENCY_WINDOW = int(os.getenv("BREAKER_LATENCY_WINDOW", "200"))
+BREAKER_MIN_SAMPLES = int(os.getenv("BREAKER_MIN_SAMPLES", "20"))
+
+# Upstream answers that count as failures; other 5xx are application errors
+FAILURE_STATUSES = (502, 503, 504)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Circuit open for {upstream}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker with a latency-derived timeout for one upstream.
+
+    After BREAKER_FAILURE_THRESHOLD consecutive failures the circuit opens and calls
+    fail fast for BREAKER_OPEN_SECONDS. Then up to BREAKER_HALF_OPEN_CALLS trial calls
+    are let through: a success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, name: str, max_timeout: float,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_in_flight = 0
+
+        self.latencies = deque(maxlen=BREAKER_LATENCY_WINDOW)
+        self._p99: Optional[float] = None
+        self._samples_since_p99 = 0
+
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.half_open_in_flight = 0
+        self.times_opened += 1
+        print(f"Circuit breaker for {self.name} opened after {self.consecutive_failures} failures")
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError"""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self.state = HALF_OPEN
+            self.half_open_in_flight = 0
+
+        if self.state == HALF_OPEN:
+            if self.half_open_in_flight >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self.half_open_in_flight += 1
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+        self._samples_since_p99 += 1
+        if self.state != CLOSED:
+            print(f"Circuit breaker for {self.name} closed")
+            self.state = CLOSED
+            self.opened_at = None
+            self.half_open_in_flight = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    def p99(self) -> Optional[float]:
+        """p99 of recent successful call latencies, recomputed every few samples"""
+        if len(self.latencies) < BREAKER_MIN_SAMPLES:
+            return None
+        if self._p99 is None or self._samples_since_p99 >= BREAKER_MIN_SAMPLES:
+            ordered = sorted(self.latencies)
+            self._p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            self._samples_since_p99 = 0
+        return self._p99
+
+    def timeout(self) -> float:
+        """Adaptive request timeout for this upstream"""
+        p99 = self.p99()
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(BREAKER_MIN_TIMEOUT, p99 * BREAKER_TIMEOUT_MULTIPLIER))
+
+    def stats(self) -> dict:
+        p99 = self.p99()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 3) if self.state == OPEN else None,
+            "p99_latency_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "timeout": round(self.timeout(), 3),
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
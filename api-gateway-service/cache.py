@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from fastapi.responses import Response
+
+from shared.messaging import MessageBroker
+
+# Cacheable GET path prefixes and their TTL in seconds,
+# overridable with GATEWAY_CACHE_TTLS="vehicles=60,pricing=30,reports/quick=30"
+DEFAULT_CACHE_TTLS = {
+    "vehicles": 60.0,
+    "pricing": 30.0,
+    "reports/quick": 30.0,
+}
+
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+CACHE_EVENTS = os.getenv("GATEWAY_CACHE_EVENTS", "true").lower() == "true"
+
+# Change events that invalidate cached prefixes: exchange -> routing key prefix -> cache prefixes.
+# Only events some service actually publishes; an empty cache prefix drops everything.
+INVALIDATION_RULES = {
+    # inventory-service: inventory.vehiclereserved, inventory.vehiclesold, ...
+    "inventory_events": {
+        "inventory": ["vehicles"],
+    },
+    # sales-service outbox: order.ordercreated, order.orderconfirmed, ...
+    "order_events": {
+        "order": ["reports/quick"],
+    },
+    # payment-service outbox: payment.created, payment.succeeded, ...
+    "autosalon": {
+        "payment": ["reports/quick"],
+    },
+    # admin-config-service: tariff.created, setting.updated, ...
+    "config": {
+        "tariff": ["pricing"],
+        "setting": [""],
+    },
+}
+
+# Upstream headers that are recomputed by the gateway for cached bodies
+_UNCACHED_HEADERS = {"content-length", "content-encoding", "set-cookie"}
+
+
+def load_cache_ttls() -> Dict[str, float]:
+    ttls = dict(DEFAULT_CACHE_TTLS)
+    for item in os.getenv("GATEWAY_CACHE_TTLS", "").split(","):
+        if "=" in item:
+            prefix, ttl = item.split("=", 1)
+            ttls[prefix.strip().strip("/")] = float(ttl)
+    return {prefix: ttl for prefix, ttl in ttls.items() if ttl > 0}
+
+
+class CachedResponse:
+    """Buffered upstream response held in the cache"""
+
+    def __init__(self, status_code: int, headers: List[Tuple[str, str]], body: bytes,
+                 etag: str, ttl: float, prefix: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.prefix = prefix
+        self.expires_at = time.monotonic() + ttl
+        self.size = len(body) + sum(len(key) + len(value) for key, value in headers)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def to_response(self, request: Request, cache_status: str) -> Response:
+        """Full response, or 304 if the client already has this version"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etag in [tag.strip() for tag in if_none_match.split(",")]):
+            response = Response(status_code=304)
+        else:
+            response = Response(content=self.body, status_code=self.status_code)
+            for key, value in self.headers:
+                response.headers.append(key, value)
+        response.headers["etag"] = self.etag
+        response.headers["x-cache"] = cache_status
+        return response
+
+
+class ResponseCache:
+    """In-process cache for idempotent GET responses.
+
+    Entries are evicted least-recently-used once CACHE_MAX_BYTES is exceeded.
+    Concurrent misses for the same key share one upstream call.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_bytes: int = CACHE_MAX_BYTES,
+                 max_entry_bytes: int = CACHE_MAX_ENTRY_BYTES):
+        self.ttls = ttls if ttls is not None else load_cache_ttls()
+        self._max_depth = max((prefix.count("/") + 1 for prefix in self.ttls), default=0)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def rule_for(self, path: str) -> Optional[Tuple[str, float]]:
+        """Longest cacheable prefix of the path and its TTL"""
+        segments = path.strip("/").split("/", self._max_depth)
+        for depth in range(min(len(segments), self._max_depth), 0, -1):
+            prefix = "/".join(segments[:depth])
+            if prefix in self.ttls:
+                return prefix, self.ttls[prefix]
+        return None
+
+    @staticmethod
+    def make_key(request: Request, path: str, identity: Optional[Dict[str, str]]) -> str:
+        """Path, sorted query and caller, so per-user responses are never shared"""
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        user_id = identity.get("x-user-id", "") if identity else ""
+        return f"{path.strip('/')}?{query}|{user_id}"
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not entry.is_fresh():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _store(self, key: str, entry: CachedResponse):
+        self._remove(key)
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _build_entry(self, response: httpx.Response, headers: List[Tuple[str, str]],
+                     prefix: str, ttl: float) -> Optional[CachedResponse]:
+        """Cache entry for a successful, public response of acceptable size"""
+        if response.status_code != 200:
+            return None
+        cache_control = response.headers.get("cache-control", "").lower()
+        if "no-store" in cache_control or "private" in cache_control or "set-cookie" in response.headers:
+            return None
+        body = response.content
+        if len(body) > self.max_entry_bytes:
+            return None
+
+        etag = response.headers.get("etag") or '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        headers = [(key, value) for key, value in headers
+                   if key.lower() not in _UNCACHED_HEADERS and key.lower() != "etag"]
+        return CachedResponse(response.status_code, headers, body, etag, ttl, prefix)
+
+    async def serve(self, request: Request, path: str, identity: Optional[Dict[str, str]],
+                    fetch: Callable[[], Awaitable[Tuple[httpx.Response, List[Tuple[str, str]]]]]) -> Optional[Response]:
+        """Serve a cacheable GET from cache or through a single shared upstream fetch.
+
+        fetch must not forward the caller's validators: its result is shared with
+        every coalesced caller, and each caller's If-None-Match is answered here
+        against the entry's ETag. Returns None if the path is not cacheable.
+        """
+        rule = self.rule_for(path)
+        if rule is None:
+            return None
+        prefix, ttl = rule
+        key = self.make_key(request, path, identity)
+
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry.to_response(request, "HIT")
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Same key is already being fetched
+            self.coalesced += 1
+            response, headers, entry = await asyncio.shield(pending)
+        else:
+            self.misses += 1
+            pending = asyncio.get_running_loop().create_future()
+            self._pending[key] = pending
+            generation = self.generation
+            try:
+                response, headers = await fetch()
+                entry = self._build_entry(response, headers, prefix, ttl)
+                # Skip storing if an invalidation arrived while the fetch was in flight
+                if entry is not None and generation == self.generation:
+                    self._store(key, entry)
+                pending.set_result((response, headers, entry))
+            except Exception as e:
+                pending.set_exception(e)
+                # Mark the exception retrieved in case nobody else is waiting
+                pending.exception()
+                raise
+            finally:
+                self._pending.pop(key, None)
+
+        if entry is None:
+            uncached = Response(content=response.content, status_code=response.status_code)
+            for header, value in headers:
+                if header.lower() not in _UNCACHED_HEADERS:
+                    uncached.headers.append(header, value)
+            return uncached
+        return entry.to_response(request, "MISS")
+
+    def invalidate(self, prefix: str = "") -> int:
+        """Drop all entries under a cache prefix ("" drops everything)"""
+        keys = [key for key, entry in self._entries.items()
+                if not prefix or entry.prefix == prefix or entry.prefix.startswith(prefix + "/")]
+        for key in keys:
+            self._remove(key)
+        self.generation += 1
+        self.invalidations += 1
+        return len(keys)
+
+    def handle_event(self, exchange: str, event: dict):
+        """Invalidate the prefixes affected by a change event"""
+        event_type = event.get("event_type", "")
+        rules = INVALIDATION_RULES.get(exchange, {})
+        for prefix in rules.get(event_type.split(".")[0], []):
+            self.invalidate(prefix)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "ttls": self.ttls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+async def subscribe_to_invalidation_events(cache: ResponseCache):
+    """Invalidate the cache on change events from RabbitMQ.
+
+    Each exchange gets its own consumer connection; events are handled on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    broker = MessageBroker()
+    for exchange in INVALIDATION_RULES:
+        async def on_event(event: dict, exchange: str = exchange):
+            cache.handle_event(exchange, event)
+
+        broker.subscribe_to_events(exchange, ["#"], on_event, loop=loop)
+    return broker
+
+
+# Global response cache
+response_cache = ResponseCache()
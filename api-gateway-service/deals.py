@@ -0,0 +1,109 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from batch import BatchExecutor, BatchItem, BatchRequest
+from routing import RouteTable
+from upstreams import UpstreamRegistry
+
+DEAL_CACHE_TTL = float(os.getenv("GATEWAY_DEAL_CACHE_TTL", "5"))
+DEAL_CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_DEAL_CACHE_MAX_ENTRIES", "10000"))
+
+# Parts of a deal and the gateway paths they are read from
+# (the gateway strips the route prefix: sales/orders/42 -> sales-service /orders/42)
+DEAL_SOURCES = {
+    "order": "sales/orders/{order_id}",
+    "payments": "payment/orders/{order_id}/payments",
+    "financing": "financing/orders/{order_id}/applications",
+    "insurance": "insurance/orders/{order_id}/policies",
+}
+
+
+class DealAggregator:
+    """Composed read model of an order with its payments, financing and insurance.
+
+    The parts are fetched in parallel; a part that fails is reported in
+    "errors" and left empty instead of failing the whole deal. Complete deals
+    are cached briefly per order and caller.
+    """
+
+    def __init__(self, registry: UpstreamRegistry, ttl: float = DEAL_CACHE_TTL,
+                 max_entries: int = DEAL_CACHE_MAX_ENTRIES):
+        self.executor = BatchExecutor(registry, concurrency=len(DEAL_SOURCES))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.partial = 0
+
+    def _get(self, key: Tuple[int, str]) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, deal = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return deal
+
+    def _store(self, key: Tuple[int, str], deal: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, deal)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_deal(self, order_id: int, routes: RouteTable,
+                       identity: Dict[str, str]) -> Tuple[int, dict]:
+        """Return (status, deal); 404 when the order itself does not exist"""
+        key = (order_id, identity.get("x-user-id", ""))
+        deal = self._get(key)
+        if deal is not None:
+            self.hits += 1
+            return 200, dict(deal, cached=True)
+        self.misses += 1
+
+        batch = BatchRequest(requests=[
+            BatchItem(id=name, path=path.format(order_id=order_id))
+            for name, path in DEAL_SOURCES.items()
+        ])
+        results = {result["id"]: result for result in await self.executor.run(batch, routes, identity)}
+
+        order = results["order"]
+        if order["status"] == 404:
+            return 404, {"detail": f"Order {order_id} not found"}
+
+        deal = {"order_id": order_id, "errors": {}}
+        for name, result in results.items():
+            if result["status"] == 200:
+                deal[name] = result["body"]
+            else:
+                deal[name] = None if name == "order" else []
+                deal["errors"][name] = {"status": result["status"], "detail": result["body"]}
+        deal["partial"] = bool(deal["errors"])
+
+        if deal["partial"]:
+            self.partial += 1
+        elif self.ttl > 0:
+            self._store(key, deal)
+        return 200, dict(deal, cached=False)
+
+    def invalidate(self, order_id: Optional[int] = None) -> int:
+        """Drop cached deals of one order, or all of them"""
+        keys = [key for key in self._entries if order_id is None or key[0] == order_id]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "partial": self.partial,
+        }
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from upstreams import Upstream, UpstreamRegistry
+
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", "5"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "15"))
+
+
+class HealthMonitor:
+    """Probes all upstream /health endpoints concurrently and caches the results.
+
+    A background task keeps the snapshot warm, so readers never wait on probes
+    unless the snapshot is older than the TTL (e.g. the refresher is stuck).
+    """
+
+    def __init__(self, registry: UpstreamRegistry, probe_timeout: float = HEALTH_PROBE_TIMEOUT,
+                 refresh_interval: float = HEALTH_REFRESH_INTERVAL, ttl: float = HEALTH_CACHE_TTL):
+        self.registry = registry
+        self.probe_timeout = probe_timeout
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self.results: Dict[str, dict] = {}
+        self.updated_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe(self, upstream: Upstream) -> dict:
+        """Check one upstream within the probe deadline"""
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                upstream.request("GET", "health", guarded=False, timeout=self.probe_timeout),
+                timeout=self.probe_timeout
+            )
+            status = "healthy" if response.status_code == 200 else "unhealthy"
+            error = None
+        except asyncio.TimeoutError:
+            status = "unavailable"
+            error = f"No response within {self.probe_timeout}s"
+        except Exception as e:
+            status = "unavailable"
+            error = str(e) or type(e).__name__
+
+        return {
+            "url": upstream.base_url,
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "checked_at": datetime.utcnow().isoformat(),
+            "error": error,
+        }
+
+    async def refresh(self) -> Dict[str, dict]:
+        """Probe every upstream at once; the slowest probe bounds the total time"""
+        async with self._lock:
+            upstreams = list(self.registry.upstreams.values())
+            results = await asyncio.gather(*(self.probe(upstream) for upstream in upstreams))
+            self.results = {upstream.name: result for upstream, result in zip(upstreams, results)}
+            self.updated_at = time.monotonic()
+            return self.results
+
+    def is_fresh(self) -> bool:
+        return self.updated_at is not None and time.monotonic() - self.updated_at < self.ttl
+
+    async def snapshot(self) -> Dict[str, dict]:
+        """Cached results, refreshed inline only when missing or expired"""
+        if not self.is_fresh():
+            if self._lock.locked():
+                # Another caller is already probing, wait for its results
+                async with self._lock:
+                    pass
+            if not self.is_fresh():
+                await self.refresh()
+        return self.results
+
+    def age(self) -> Optional[float]:
+        if self.updated_at is None:
+            return None
+        return round(time.monotonic() - self.updated_at, 3)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Health refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start the background refresher"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
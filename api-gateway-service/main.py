@@ -5,6 +5,18 @@ import httpx
 import os
 import uvicorn
 
+import proxy
+from batch import BATCH_MAX_REQUESTS, BatchExecutor, BatchRequest
+from breaker import CircuitOpenError
+from deals import DealAggregator
+from cache import CACHE_EVENTS, response_cache, subscribe_to_invalidation_events
+from health import HealthMonitor
+from routing import RouteTable, load_routes
+from shared.auth import AuthUtils, token_cache
+from shared.models import UserRole
+from ratelimit import RATE_LIMIT_ENABLED, rate_limiter
+from upstreams import UpstreamSaturatedError, upstreams
+
 app = FastAPI(
     title="API Gateway", 
     description="Unified API Gateway for Autosalon microservices",
@@ -36,6 +48,97 @@ NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://notific
 REPORTING_SERVICE_URL = os.getenv("REPORTING_SERVICE_URL", "http://reporting-analytics-service:8000")
 LOGGING_SERVICE_URL = os.getenv("LOGGING_SERVICE_URL", "http://logging-monitoring-service:8000")
 
+# One keep-alive connection pool per upstream service
+UPSTREAM_URLS = {
+    "auth-service": AUTH_SERVICE_URL,
+    "payment-service": PAYMENT_SERVICE_URL,
+    "financing-service": FINANCING_SERVICE_URL,
+    "insurance-service": INSURANCE_SERVICE_URL,
+    "customer-service": CUSTOMER_SERVICE_URL,
+    "vehicle-catalog-service": VEHICLE_SERVICE_URL,
+    "inventory-service": INVENTORY_SERVICE_URL,
+    "sales-service": SALES_SERVICE_URL,
+    "pricing-discount-service": PRICING_SERVICE_URL,
+    "admin-config-service": ADMIN_CONFIG_URL,
+    "service-booking-service": SERVICE_BOOKING_URL,
+    "notification-service": NOTIFICATION_SERVICE_URL,
+    "reporting-analytics-service": REPORTING_SERVICE_URL,
+    "logging-monitoring-service": LOGGING_SERVICE_URL,
+}
+
+for upstream_name, upstream_url in UPSTREAM_URLS.items():
+    upstreams.register(upstream_name, upstream_url)
+
+def build_route_table() -> RouteTable:
+    """Compile the routing table, rejecting routes to unknown upstreams"""
+    routes = load_routes()
+    unknown = sorted({route.upstream for route in routes if upstreams.get(route.upstream) is None})
+    if unknown:
+        raise ValueError(f"Unknown upstream services in routes: {', '.join(unknown)}")
+    return RouteTable(routes)
+
+# Built once at startup, swapped atomically on reload
+route_table = build_route_table()
+
+# Cached upstream health, kept warm in the background
+health_monitor = HealthMonitor(upstreams)
+
+batch_executor = BatchExecutor(upstreams)
+
+deal_aggregator = DealAggregator(upstreams)
+
+def resolve_identity(request: Request):
+    """Verify the bearer token once here; services trust the signed identity headers"""
+    token = AuthUtils.extract_token_from_header(request.headers.get("authorization"))
+    if token:
+        payload = token_cache.get_payload(token)
+        if payload:
+            return AuthUtils.identity_headers(payload)
+    return None
+
+def require_admin(request: Request):
+    """Verified identity of an admin caller: 401 without a valid token, 403 for other roles"""
+    identity = resolve_identity(request)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not AuthUtils.validate_role_access(identity["x-user-role"], [UserRole.ADMIN.value]):
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return identity
+
+async def check_rate_limit(request: Request, identity, cost: float = 1.0):
+    """429 response if the client or user is over its rate limit, otherwise None"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    retry_after = await rate_limiter.check(
+        request.client.host if request.client else None,
+        identity["x-user-id"] if identity else None,
+        cost
+    )
+    if retry_after is None:
+        return None
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests"},
+        headers={"Retry-After": str(int(retry_after) + 1)}
+    )
+
+@app.on_event("startup")
+async def startup_event():
+    """Open upstream connection pools, start health probing and cache invalidation"""
+    upstreams.start()
+    health_monitor.start()
+    if CACHE_EVENTS:
+        # Consumers connect in the background, this does not delay startup
+        app.state.cache_broker = await subscribe_to_invalidation_events(response_cache)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop health probing and cache invalidation, close upstream connection pools"""
+    await health_monitor.stop()
+    if CACHE_EVENTS:
+        app.state.cache_broker.close()
+    await upstreams.close()
+
 @app.get("/")
 async def read_root():
     """Main endpoint"""
@@ -46,6 +149,8 @@ async def read_root():
         "endpoints": {
             "health": "/health",
             "services": "/services",
+            "batch": "/batch",
+            "deals": "/deals/{order_id}",
             "auth": "/auth/*",
             "customers": "/customers/*",
             "vehicles": "/vehicles/*",
@@ -66,51 +171,126 @@ async def health_check():
 @app.get("/services")
 async def list_services():
     """List all available services"""
-    services = {
-        "auth": AUTH_SERVICE_URL,
-        "payment": PAYMENT_SERVICE_URL,
-        "financing": FINANCING_SERVICE_URL,
-        "insurance": INSURANCE_SERVICE_URL,
-        "customers": CUSTOMER_SERVICE_URL,
-        "vehicles": VEHICLE_SERVICE_URL,
-        "inventory": INVENTORY_SERVICE_URL,
-        "sales": SALES_SERVICE_URL,
-        "pricing": PRICING_SERVICE_URL,
-<<<<<<< HEAD
-=======
-        "admin": ADMIN_CONFIG_URL,
-        "booking": SERVICE_BOOKING_URL,
-        "notifications": NOTIFICATION_SERVICE_URL,
-        "reports": REPORTING_SERVICE_URL,
-        "analytics": REPORTING_SERVICE_URL,
-        "logs": LOGGING_SERVICE_URL,
-        "monitoring": LOGGING_SERVICE_URL,
->>>>>>> feature-data-loading
-    }
-    
-    # Проверяем доступность сервисов
+    # Статус сервисов из кэша, который обновляется в фоне
+    health = await health_monitor.snapshot()
     service_status = {}
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        for name, url in services.items():
-            try:
-                response = await client.get(f"{url}/health")
-                service_status[name] = {
-                    "url": url,
-                    "status": "healthy" if response.status_code == 200 else "unhealthy",
-                    "port": url.split(":")[-1] if ":" in url else "8000"
-                }
-            except:
-                service_status[name] = {
-                    "url": url,
-                    "status": "unavailable",
-                    "port": url.split(":")[-1] if ":" in url else "8000"
-                }
+    for route in route_table.routes():
+        url = upstreams.get(route.upstream).base_url
+        result = health.get(route.upstream, {})
+        service_status[route.prefix] = {
+            "url": url,
+            "status": result.get("status", "unknown"),
+            "port": url.split(":")[-1] if ":" in url else "8000",
+            "latency_ms": result.get("latency_ms"),
+            "checked_at": result.get("checked_at")
+        }
     
     return {
         "gateway": "running",
-        "services": service_status
+        "services": service_status,
+        "health_age_seconds": health_monitor.age()
     }
 
+@app.get("/gateway/upstreams")
+async def upstream_stats():
+    """Connection pool usage and saturation per upstream service"""
+    return {"upstreams": upstreams.stats()}
+
+@app.get("/gateway/breakers")
+async def breaker_states():
+    """Circuit breaker state and adaptive timeout per upstream"""
+    return {"breakers": {name: upstream.breaker.stats() for name, upstream in upstreams.upstreams.items()}}
+
+@app.get("/gateway/rate-limits")
+async def rate_limit_stats():
+    """Rate limiter settings and counters"""
+    return {"enabled": RATE_LIMIT_ENABLED, "rate_limits": rate_limiter.stats()}
+
+@app.get("/gateway/auth")
+async def auth_stats():
+    """Decoded-token cache usage"""
+    return {"token_cache": token_cache.stats()}
+
+@app.get("/gateway/cache")
+async def cache_stats():
+    """Response cache usage"""
+    return {"cache": response_cache.stats()}
+
+@app.delete("/gateway/cache")
+async def purge_cache(request: Request, prefix: str = ""):
+    """Drop cached responses under a prefix, or all of them; admins only, a purge sends every
+    following read to the upstreams"""
+    require_admin(request)
+    return {"invalidated": response_cache.invalidate(prefix.strip("/"))}
+
+@app.get("/gateway/routes")
+async def list_routes():
+    """Compiled routing table with per-route overrides"""
+    return {"routes": [route.to_dict() for route in route_table.routes()]}
+
+@app.post("/gateway/routes/reload")
+async def reload_routes(request: Request):
+    """Rebuild the routing table from GATEWAY_ROUTES_FILE without a restart; admins only"""
+    global route_table
+    require_admin(request)
+    try:
+        new_table = build_route_table()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Route reload failed: {str(e)}")
+    route_table = new_table
+    return {"message": "Routes reloaded", "routes": len(route_table)}
+
+@app.post("/batch")
+async def batch_requests(batch: BatchRequest, request: Request):
+    """Run several API calls in one round trip.
+
+    Body: {"requests": [{"id": "order", "method": "GET", "path": "/orders/42"}, ...]}.
+    Sub-requests run concurrently; each result carries its own status.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_REQUESTS} requests")
+    
+    identity = resolve_identity(request)
+    limited = await check_rate_limit(request, identity, cost=len(batch.requests))
+    if limited is not None:
+        return limited
+    
+    return {"responses": await batch_executor.run(batch, route_table, identity)}
+
+@app.get("/deals/{order_id}")
+async def get_deal(order_id: int, request: Request):
+    """Order with its payments, financing applications and insurance policies.
+
+    The parts are fetched in parallel; failed parts are listed in "errors".
+    """
+    identity = resolve_identity(request)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    limited = await check_rate_limit(request, identity)
+    if limited is not None:
+        return limited
+    
+    status_code, deal = await deal_aggregator.get_deal(order_id, route_table, identity)
+    return JSONResponse(status_code=status_code, content=deal)
+
+@app.get("/gateway/deals")
+async def deal_stats():
+    """Deal read model cache usage"""
+    return {"deals": deal_aggregator.stats()}
+
+@app.delete("/gateway/deals")
+async def purge_deals(request: Request, order_id: int = None):
+    """Drop cached deals of one order, or all of them; admins only"""
+    require_admin(request)
+    return {"invalidated": deal_aggregator.invalidate(order_id)}
+
+@app.get("/gateway/batch")
+async def batch_stats():
+    """Batch endpoint usage"""
+    return {"batch": batch_executor.stats()}
+
 # Simple proxy endpoints
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_handler(request: Request, path: str):
@@ -123,73 +303,60 @@ async def proxy_handler(request: Request, path: str):
             content={"detail": f"Endpoint /{path} should be handled by gateway itself"}
         )
     
-    # Map to services
-    service_map = {
-        "auth": AUTH_SERVICE_URL,
-        "payment": PAYMENT_SERVICE_URL,
-        "financing": FINANCING_SERVICE_URL,
-        "insurance": INSURANCE_SERVICE_URL,
-        "customers": CUSTOMER_SERVICE_URL,
-        "vehicles": VEHICLE_SERVICE_URL,
-        "inventory": INVENTORY_SERVICE_URL,
-        "orders": SALES_SERVICE_URL,
-        "sales": SALES_SERVICE_URL,
-        "pricing": PRICING_SERVICE_URL,
-<<<<<<< HEAD
-=======
-        "admin": ADMIN_CONFIG_URL,
-        "booking": SERVICE_BOOKING_URL,
-        "notifications": NOTIFICATION_SERVICE_URL,
-        "reports": REPORTING_SERVICE_URL,
-        "analytics": REPORTING_SERVICE_URL,
-        "logs": LOGGING_SERVICE_URL,
-        "monitoring": LOGGING_SERVICE_URL,
->>>>>>> feature-data-loading
-    }
-    
     # Find service
-    target_service = None
-    target_path = path
-    
-    for prefix, url in service_map.items():
-        if path.startswith(prefix + "/") or path == prefix:
-            target_service = url
-            if path != prefix:
-                target_path = path[len(prefix)+1:]  # Remove prefix
-            else:
-                target_path = ""
-            break
+    route, target_path = route_table.match(path)
     
-    if not target_service:
+    if not route:
         return JSONResponse(
             status_code=404,
             content={"detail": f"No service found for path: {path}"}
         )
     
-    # Forward request
+    identity = resolve_identity(request)
+    
+    if route.auth_required and identity is None:
+        return JSONResponse(
+            status_code=401,
+            content={"detail": "Authentication required"}
+        )
+    
+    # Admission control per client IP and per JWT subject
+    limited = await check_rate_limit(request, identity)
+    if limited is not None:
+        return limited
+    
+    target_service = upstreams.get(route.upstream)
+    
+    # Stream the request and response through the upstream's keep-alive pool,
+    # idempotent catalog and pricing reads go through the response cache
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            target_url = f"{target_service}/{target_path}" if target_path else target_service
-            
-            # Prepare headers
-            headers = dict(request.headers)
-            headers.pop("host", None)
-            
-            # Forward
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                headers=headers,
-                content=await request.body(),
-                params=request.query_params
-            )
-            
-            return JSONResponse(
-                status_code=response.status_code,
-                content=response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text,
-                headers=dict(response.headers)
+        if request.method == "GET":
+            cached = await response_cache.serve(
+                request, path, identity,
+                lambda: proxy.fetch(target_service, request, target_path, route, identity, conditional=False)
             )
-            
+            if cached is not None:
+                return cached
+        return await proxy.forward(target_service, request, target_path, route, identity)
+    except CircuitOpenError as e:
+        # Fail fast instead of tying up a worker on a degraded upstream
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"Service temporarily unavailable: {route.upstream}"},
+            headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
+    except UpstreamSaturatedError:
+        # Shed load early rather than queueing on an exhausted upstream
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"Service overloaded: {route.upstream}"},
+            headers={"Retry-After": "1"}
+        )
+    except httpx.TimeoutException:
+        return JSONResponse(
+            status_code=504,
+            content={"detail": f"Service timeout: {route.upstream}"}
+        )
     except Exception as e:
         return JSONResponse(
             status_code=502,
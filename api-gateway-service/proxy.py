@@ -0,0 +1,177 @@
+import asyncio
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from routing import Route
+from shared.auth import IDENTITY_HEADERS
+from upstreams import Upstream
+
+# Stream bodies through as byte chunks; "false" buffers the raw upstream body instead
+STREAM_PROXY = os.getenv("GATEWAY_STREAM_PROXY", "true").lower() == "true"
+
+# Hop-by-hop headers (RFC 7230, section 6.1) are meaningful for a single
+# connection only and must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Set by the gateway's own server, forwarding them would duplicate the headers
+SERVER_HEADERS = {"date", "server"}
+
+# Client validators; a fetch shared between clients must not carry one client's
+CONDITIONAL_HEADERS = {
+    "if-match",
+    "if-none-match",
+    "if-modified-since",
+    "if-unmodified-since",
+    "if-range",
+}
+
+
+def _connection_tokens(values: List[str]) -> set:
+    """Extra hop-by-hop headers named in the Connection header"""
+    tokens = set()
+    for value in values:
+        tokens.update(token.strip().lower() for token in value.split(",") if token.strip())
+    return tokens
+
+
+def filter_request_headers(request: Request, identity: Optional[Dict[str, str]] = None,
+                           conditional: bool = True) -> List[Tuple[str, str]]:
+    """Headers to forward upstream: everything except Host and hop-by-hop headers.
+
+    Client-supplied identity headers are always dropped; only the gateway sets them.
+    conditional=False also drops the client's validators (If-None-Match, ...).
+    """
+    skip = HOP_BY_HOP_HEADERS | _connection_tokens(request.headers.getlist("connection")) | {"host"}
+    skip = skip | set(IDENTITY_HEADERS)
+    if not conditional:
+        skip = skip | CONDITIONAL_HEADERS
+    headers = [(key, value) for key, value in request.headers.items() if key.lower() not in skip]
+    if identity:
+        headers.extend(identity.items())
+    return headers
+
+
+def filter_response_headers(response: httpx.Response, buffered: bool = False) -> List[Tuple[str, str]]:
+    """Headers to return to the client.
+
+    The body is passed through raw (still content-encoded), so Content-Length
+    and Content-Encoding stay valid. Transfer-Encoding is dropped because the
+    gateway's server frames the body itself; a buffered body gets a fresh
+    Content-Length from the Response.
+    """
+    skip = HOP_BY_HOP_HEADERS | SERVER_HEADERS | _connection_tokens(response.headers.get_list("connection"))
+    if buffered:
+        skip = skip | {"content-length"}
+    return [(key, value) for key, value in response.headers.multi_items() if key.lower() not in skip]
+
+
+def request_body(request: Request) -> Optional[AsyncIterator[bytes]]:
+    """Request body as a chunk stream, or None when the request has no body"""
+    if "content-length" not in request.headers and "transfer-encoding" not in request.headers:
+        return None
+    if request.headers.get("content-length") == "0":
+        return None
+    return request.stream()
+
+
+def _apply_headers(response: Response, headers: List[Tuple[str, str]]) -> Response:
+    for key, value in headers:
+        response.headers.append(key, value)
+    return response
+
+
+async def _send(upstream: Upstream, request: Request, path: str, route: Optional[Route],
+                identity: Optional[Dict[str, str]], conditional: bool = True) -> httpx.Response:
+    """Send the request upstream, retrying per the route's retry policy.
+
+    Only requests without a body are retried, since a streamed body cannot be replayed.
+    """
+    content = request_body(request)
+    kwargs = {}
+    if route is not None and route.timeout is not None:
+        kwargs["timeout"] = route.timeout
+
+    retry = route.retry if route is not None else None
+    attempts = retry.attempts if retry and content is None and retry.applies_to(request.method) else 1
+
+    for attempt in range(1, attempts + 1):
+        try:
+            upstream_response = await upstream.send_stream(
+                method=request.method,
+                path=path,
+                headers=filter_request_headers(request, identity, conditional),
+                content=content,
+                params=request.query_params,
+                **kwargs
+            )
+        except httpx.TransportError:
+            if attempt == attempts:
+                raise
+        else:
+            if attempt == attempts or upstream_response.status_code not in retry.statuses:
+                return upstream_response
+            await upstream.close_stream(upstream_response)
+
+        await asyncio.sleep(retry.backoff * 2 ** (attempt - 1))
+
+
+async def fetch(upstream: Upstream, request: Request, path: str, route: Optional[Route] = None,
+                identity: Optional[Dict[str, str]] = None,
+                conditional: bool = True) -> Tuple[httpx.Response, List[Tuple[str, str]]]:
+    """Send the request and read the whole (decoded) body, for responses the gateway keeps.
+
+    Returns the upstream response and the headers to pass on to the client.
+    conditional=False fetches the full body whatever the client's validators,
+    for responses shared with other clients.
+    """
+    upstream_response = await _send(upstream, request, path, route, identity, conditional)
+    try:
+        await upstream_response.aread()
+    finally:
+        await upstream.close_stream(upstream_response)
+    return upstream_response, filter_response_headers(upstream_response, buffered=True)
+
+
+async def _stream_body(upstream: Upstream, upstream_response: httpx.Response) -> AsyncIterator[bytes]:
+    """Raw upstream body; the connection goes back to the pool even if the stream
+    fails or the client disconnects mid-body"""
+    try:
+        async for chunk in upstream_response.aiter_raw():
+            yield chunk
+    finally:
+        await upstream.close_stream(upstream_response)
+
+
+async def forward(upstream: Upstream, request: Request, path: str, route: Optional[Route] = None,
+                  identity: Optional[Dict[str, str]] = None) -> Response:
+    """Proxy the request to the upstream without parsing or re-encoding bodies"""
+    upstream_response = await _send(upstream, request, path, route, identity)
+
+    if not STREAM_PROXY:
+        try:
+            body = b"".join([chunk async for chunk in upstream_response.aiter_raw()])
+        finally:
+            await upstream.close_stream(upstream_response)
+        response = Response(content=body, status_code=upstream_response.status_code)
+        return _apply_headers(response, filter_response_headers(upstream_response, buffered=True))
+
+    response = StreamingResponse(
+        _stream_body(upstream, upstream_response),
+        status_code=upstream_response.status_code,
+    )
+    return _apply_headers(response, filter_response_headers(upstream_response))
@@ -0,0 +1,106 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+# Token buckets: sustained requests per second and burst size
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "50"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "100"))
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "20"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "40"))
+
+# Idle buckets beyond this are dropped, oldest first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RateLimitBackend(ABC):
+    """Storage for token buckets. Subclass to keep limiter state elsewhere (e.g. Redis)."""
+
+    @abstractmethod
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take `cost` tokens from the bucket.
+
+        Returns (allowed, retry_after) where retry_after is the wait in seconds
+        until enough tokens are available again.
+        """
+
+    def size(self) -> int:
+        return 0
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Token buckets in process memory; the clock is injectable for tests"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = self.clock()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+
+        if tokens >= cost:
+            allowed, retry_after = True, 0.0
+            tokens -= cost
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate if rate > 0 else float("inf")
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """Per client IP and per JWT subject admission control"""
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None,
+                 ip_rate: float = RATE_LIMIT_IP_RATE, ip_burst: float = RATE_LIMIT_IP_BURST,
+                 user_rate: float = RATE_LIMIT_USER_RATE, user_burst: float = RATE_LIMIT_USER_BURST):
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.allowed = 0
+        self.limited = 0
+
+    async def check(self, client_ip: Optional[str], user_id: Optional[str], cost: float = 1.0) -> Optional[float]:
+        """None if the request is admitted, otherwise seconds until it may be retried.
+
+        A batch of N sub-requests costs N tokens.
+        """
+        if client_ip:
+            allowed, retry_after = await self.backend.consume(f"ip:{client_ip}", self.ip_rate, self.ip_burst, cost)
+            if not allowed:
+                self.limited += 1
+                return retry_after
+        if user_id:
+            allowed, retry_after = await self.backend.consume(f"user:{user_id}", self.user_rate, self.user_burst, cost)
+            if not allowed:
+                self.limited += 1
+                return retry_after
+        self.allowed += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "ip": {"rate": self.ip_rate, "burst": self.ip_burst},
+            "user": {"rate": self.user_rate, "burst": self.user_burst},
+            "tracked_keys": self.backend.size(),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+# Global rate limiter
+rate_limiter = RateLimiter()
@@ -0,0 +1,144 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Optional JSON file with route overrides, re-read on POST /gateway/routes/reload
+ROUTES_FILE = os.getenv("GATEWAY_ROUTES_FILE")
+
+# Path prefix -> upstream service
+DEFAULT_ROUTES = [
+    ("auth", "auth-service"),
+    ("payment", "payment-service"),
+    ("financing", "financing-service"),
+    ("insurance", "insurance-service"),
+    ("customers", "customer-service"),
+    ("vehicles", "vehicle-catalog-service"),
+    ("inventory", "inventory-service"),
+    ("orders", "sales-service"),
+    ("sales", "sales-service"),
+    ("pricing", "pricing-discount-service"),
+    ("admin", "admin-config-service"),
+    ("booking", "service-booking-service"),
+    ("notifications", "notification-service"),
+    ("reports", "reporting-analytics-service"),
+    ("analytics", "reporting-analytics-service"),
+    ("logs", "logging-monitoring-service"),
+    ("monitoring", "logging-monitoring-service"),
+]
+
+
+class RetryPolicy:
+    """Retries for requests without a body that failed before reaching the upstream
+    or got a retryable status back"""
+
+    def __init__(self, attempts: int = 1, backoff: float = 0.1,
+                 methods: Tuple[str, ...] = ("GET",),
+                 statuses: Tuple[int, ...] = (502, 503, 504)):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.methods = tuple(method.upper() for method in methods)
+        self.statuses = tuple(statuses)
+
+    def applies_to(self, method: str) -> bool:
+        return self.attempts > 1 and method.upper() in self.methods
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "RetryPolicy":
+        if not data:
+            return cls()
+        return cls(
+            attempts=int(data.get("attempts", 1)),
+            backoff=float(data.get("backoff", 0.1)),
+            methods=tuple(data.get("methods", ("GET",))),
+            statuses=tuple(data.get("statuses", (502, 503, 504))),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "backoff": self.backoff,
+            "methods": list(self.methods),
+            "statuses": list(self.statuses),
+        }
+
+
+class Route:
+    """Gateway route with its per-route overrides"""
+
+    def __init__(self, prefix: str, upstream: str, timeout: Optional[float] = None,
+                 retry: Optional[RetryPolicy] = None, auth_required: bool = False):
+        self.prefix = prefix.strip("/")
+        self.upstream = upstream
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.auth_required = auth_required
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Route":
+        timeout = data.get("timeout")
+        return cls(
+            prefix=data["prefix"],
+            upstream=data["upstream"],
+            timeout=float(timeout) if timeout is not None else None,
+            retry=RetryPolicy.from_dict(data.get("retry")),
+            auth_required=bool(data.get("auth_required", False)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "prefix": self.prefix,
+            "upstream": self.upstream,
+            "timeout": self.timeout,
+            "retry": self.retry.to_dict(),
+            "auth_required": self.auth_required,
+        }
+
+
+class RouteTable:
+    """Longest-prefix-match routing table, built once and matched by path segments.
+
+    A lookup costs one dict probe per path segment (bounded by the deepest
+    prefix), so it does not grow with the number of routes.
+    """
+
+    def __init__(self, routes: List[Route]):
+        self._routes: Dict[str, Route] = {}
+        for route in routes:
+            self._routes[route.prefix] = route
+        self._max_depth = max((route.prefix.count("/") + 1 for route in routes), default=0)
+
+    def match(self, path: str) -> Tuple[Optional[Route], str]:
+        """Return the route for a path and the remaining upstream path.
+
+        Only the matched prefix is removed, so a trailing slash reaches the upstream.
+        """
+        segments = path.lstrip("/").split("/", self._max_depth)
+        for depth in range(min(len(segments), self._max_depth), 0, -1):
+            route = self._routes.get("/".join(segments[:depth]))
+            if route is not None:
+                return route, "/".join(segments[depth:])
+        return None, path
+
+    def routes(self) -> List[Route]:
+        return list(self._routes.values())
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+def load_routes(routes_file: Optional[str] = ROUTES_FILE) -> List[Route]:
+    """Default routes, updated and extended by the routes file if one is configured.
+
+    File format: {"routes": [{"prefix": "payment", "upstream": "payment-service",
+    "timeout": 10, "retry": {"attempts": 3}, "auth_required": true}, ...]}
+    """
+    routes = {prefix: Route(prefix, upstream) for prefix, upstream in DEFAULT_ROUTES}
+
+    if routes_file:
+        with open(routes_file, encoding="utf-8") as f:
+            config = json.load(f)
+        for data in config.get("routes", []):
+            route = Route.from_dict(data)
+            routes[route.prefix] = route
+
+    return list(routes.values())
@@ -1,8 +1,13 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import hashlib
+import hmac
+import json
 import os
+import time
 
 # JWT settings (должны совпадать с auth-service)
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
@@ -10,6 +15,14 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Identity headers passed to the services once the gateway has verified the token.
+# Signed with a secret shared with the services (see shared/auth.py verify_gateway_identity)
+GATEWAY_IDENTITY_SECRET = os.getenv("GATEWAY_IDENTITY_SECRET", SECRET_KEY)
+IDENTITY_HEADERS = ("x-user-id", "x-user-email", "x-user-role", "x-user-exp", "x-identity-signature")
+
+# Decoded-token cache
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
 class AuthUtils:
     """Authentication utilities for API Gateway (совместимо с auth-service)"""
     
@@ -97,4 +110,78 @@ class AuthUtils:
         if len(parts) != 2 or parts[0].lower() != "bearer":
             return None
             
-        return parts[1]
\ No newline at end of file
+        return parts[1]
+    
+    @staticmethod
+    def sign_identity(user_id: str, email: str, role: str, exp: str) -> str:
+        """
+        HMAC over the identity headers, checked by the services instead of decoding the JWT
+        """
+        # JSON keeps the fields apart: an email may itself contain any separator
+        message = json.dumps([user_id, email, role, exp])
+        return hmac.new(GATEWAY_IDENTITY_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def identity_headers(payload: dict) -> Dict[str, str]:
+        """
+        Trusted identity headers for a verified token payload
+        """
+        user_id = str(payload.get("sub") or payload.get("user_id") or "")
+        email = payload.get("email") or ""
+        role = payload.get("role") or ""
+        exp = str(payload.get("exp") or "")
+        return {
+            "x-user-id": user_id,
+            "x-user-email": email,
+            "x-user-role": role,
+            "x-user-exp": exp,
+            "x-identity-signature": AuthUtils.sign_identity(user_id, email, role, exp)
+        }
+
+
+class TokenCache:
+    """Bounded LRU of verified token payloads keyed by token hash, honoring exp"""
+    
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_payload(self, token: str) -> Optional[dict]:
+        """
+        Verified payload for the token, decoding it only on a cache miss
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        payload = self._entries.get(key)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            del self._entries[key]
+        
+        self.misses += 1
+        payload = AuthUtils.verify_token(token)
+        if payload is None or not payload.get("exp"):
+            # Tokens without exp are never cached
+            return payload
+        
+        self._entries[key] = payload
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return payload
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Global decoded-token cache
+token_cache = TokenCache()
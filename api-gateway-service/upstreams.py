@@ -0,0 +1,274 @@
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from breaker import FAILURE_STATUSES, CircuitBreaker
+
+# HTTP/2 requires the optional "h2" package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Default pool limits, can be overridden per upstream with
+# UPSTREAM_<NAME>_MAX_CONNECTIONS, UPSTREAM_<NAME>_HTTP2, etc.
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+DEFAULT_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+DEFAULT_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+DEFAULT_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+# Requests in flight per upstream before new ones are shed (0 = max_connections)
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "0"))
+
+
+class UpstreamSaturatedError(Exception):
+    """Raised instead of queueing a request on an upstream that is at its in-flight cap"""
+
+    def __init__(self, upstream: str, in_flight: int):
+        super().__init__(f"Upstream {upstream} is at its in-flight limit ({in_flight})")
+        self.upstream = upstream
+        self.in_flight = in_flight
+
+
+def _env_name(name: str, key: str) -> str:
+    """UPSTREAM_<NAME>_<KEY>, e.g. UPSTREAM_PAYMENT_SERVICE_MAX_CONNECTIONS"""
+    return f"UPSTREAM_{name.upper().replace('-', '_')}_{key}"
+
+
+class UpstreamLimits:
+    """Connection pool settings for one upstream service"""
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 http2: bool = DEFAULT_HTTP2,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 pool_timeout: float = DEFAULT_POOL_TIMEOUT,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = min(max_keepalive_connections, max_connections)
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.timeout = timeout
+        self.pool_timeout = pool_timeout
+        self.max_in_flight = max_in_flight or max_connections
+
+    @classmethod
+    def from_env(cls, name: str) -> "UpstreamLimits":
+        """Read per-upstream overrides from the environment"""
+        http2 = os.getenv(_env_name(name, "HTTP2"))
+        return cls(
+            max_connections=int(os.getenv(_env_name(name, "MAX_CONNECTIONS"), DEFAULT_MAX_CONNECTIONS)),
+            max_keepalive_connections=int(os.getenv(_env_name(name, "MAX_KEEPALIVE"), DEFAULT_MAX_KEEPALIVE)),
+            keepalive_expiry=float(os.getenv(_env_name(name, "KEEPALIVE_EXPIRY"), DEFAULT_KEEPALIVE_EXPIRY)),
+            http2=http2.lower() == "true" if http2 is not None else DEFAULT_HTTP2,
+            timeout=float(os.getenv(_env_name(name, "TIMEOUT"), DEFAULT_TIMEOUT)),
+            pool_timeout=float(os.getenv(_env_name(name, "POOL_TIMEOUT"), DEFAULT_POOL_TIMEOUT)),
+            max_in_flight=int(os.getenv(_env_name(name, "MAX_IN_FLIGHT"), DEFAULT_MAX_IN_FLIGHT)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "http2": self.http2,
+            "timeout": self.timeout,
+            "pool_timeout": self.pool_timeout,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+class Upstream:
+    """Long-lived keep-alive connection pool for a single upstream service"""
+
+    def __init__(self, name: str, base_url: str, limits: Optional[UpstreamLimits] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.limits = limits or UpstreamLimits.from_env(name)
+        # Custom transport (e.g. httpx.MockTransport in tests), None for the network
+        self.transport = transport
+        self.client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker(name, self.limits.timeout)
+
+        # Pool usage counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.failed_requests = 0
+        self.pool_timeouts = 0
+        self.shed_requests = 0
+        self.started_at: Optional[float] = None
+
+    def start(self):
+        """Create the pooled client"""
+        if self.client is not None:
+            return
+
+        http2 = self.limits.http2
+        if http2 and not HTTP2_AVAILABLE:
+            print(f"Upstream {self.name}: HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.limits.max_connections,
+                max_keepalive_connections=self.limits.max_keepalive_connections,
+                keepalive_expiry=self.limits.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.limits.timeout, pool=self.limits.pool_timeout),
+            transport=self.transport,
+        )
+        self.started_at = time.time()
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _acquire(self):
+        self.in_flight += 1
+        self.total_requests += 1
+        if self.in_flight > self.peak_in_flight:
+            self.peak_in_flight = self.in_flight
+
+    def _release(self):
+        self.in_flight -= 1
+
+    def _record_failure(self, error: Exception):
+        self.failed_requests += 1
+        if isinstance(error, httpx.PoolTimeout):
+            self.pool_timeouts += 1
+
+    @staticmethod
+    def _url(path: str) -> str:
+        return "/" + path.lstrip("/") if path else ""
+
+    def _guard(self, kwargs: dict):
+        """Shed load past the in-flight cap and fail fast on an open circuit,
+        otherwise apply the adaptive timeout"""
+        if self.in_flight >= self.limits.max_in_flight:
+            self.shed_requests += 1
+            raise UpstreamSaturatedError(self.name, self.in_flight)
+        self.breaker.before_call()
+        kwargs.setdefault("timeout", self.breaker.timeout())
+
+    def _record_outcome(self, status_code: int, started: float):
+        if status_code in FAILURE_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success(time.perf_counter() - started)
+
+    async def request(self, method: str, path: str = "", guarded: bool = True, **kwargs) -> httpx.Response:
+        """Send a request to the upstream over the shared pool.
+
+        Guarded requests go through the circuit breaker; health probes are not guarded.
+        """
+        if self.client is None:
+            self.start()
+        if guarded:
+            self._guard(kwargs)
+
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, self._url(path), **kwargs)
+        except Exception as e:
+            self._record_failure(e)
+            if guarded:
+                self.breaker.record_failure()
+            raise
+        finally:
+            self._release()
+
+        if guarded:
+            self._record_outcome(response.status_code, started)
+        return response
+
+    async def send_stream(self, method: str, path: str = "", guarded: bool = True, **kwargs) -> httpx.Response:
+        """Send a request and return the response with its body still unread.
+
+        The connection stays checked out of the pool until close_stream() is called.
+        """
+        if self.client is None:
+            self.start()
+        if guarded:
+            self._guard(kwargs)
+
+        request = self.client.build_request(method, self._url(path), **kwargs)
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await self.client.send(request, stream=True)
+        except Exception as e:
+            self._record_failure(e)
+            self._release()
+            if guarded:
+                self.breaker.record_failure()
+            raise
+
+        if guarded:
+            self._record_outcome(response.status_code, started)
+        return response
+
+    async def close_stream(self, response: httpx.Response):
+        """Return a streamed response's connection to the pool"""
+        try:
+            await response.aclose()
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        """Pool usage snapshot"""
+        return {
+            "url": self.base_url,
+            "limits": self.limits.to_dict(),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturation": round(self.in_flight / self.limits.max_connections, 3),
+            "peak_saturation": round(self.peak_in_flight / self.limits.max_connections, 3),
+            "total_requests": self.total_requests,
+            "failed_requests": self.failed_requests,
+            "pool_timeouts": self.pool_timeouts,
+            "shed_requests": self.shed_requests,
+            "started": self.client is not None,
+        }
+
+
+class UpstreamRegistry:
+    """All upstream pools of the gateway, created at startup and closed on shutdown"""
+
+    def __init__(self):
+        self.upstreams: Dict[str, Upstream] = {}
+
+    def register(self, name: str, base_url: str, limits: Optional[UpstreamLimits] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) -> Upstream:
+        upstream = Upstream(name, base_url, limits, transport)
+        self.upstreams[name] = upstream
+        return upstream
+
+    def get(self, name: str) -> Optional[Upstream]:
+        return self.upstreams.get(name)
+
+    def start(self):
+        for upstream in self.upstreams.values():
+            upstream.start()
+
+    async def close(self):
+        for upstream in self.upstreams.values():
+            await upstream.close()
+
+    def stats(self) -> dict:
+        return {name: upstream.stats() for name, upstream in self.upstreams.items()}
+
+
+# Global upstream registry
+upstreams = UpstreamRegistry()
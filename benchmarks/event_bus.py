@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк шины событий от издателя до потребителя.
+Издатели с заданной частотой шлют order.* (как publish_order_event сервиса
+продаж) и payment.* (MessageBroker.publish_event); потребители - настоящие
+обработчики: EventProcessor сервиса уведомлений и AnalyticsCRUD.track_event
+сервиса отчётов, каждый со своей БД (по умолчанию SQLite во временном каталоге).
+Транспорт: local (в процессе, без брокера) или rabbitmq (RABBITMQ_URL).
+Отчёт: задержка публикации, перцентили сквозной задержки (от времени в
+конверте события до конца обработки), загрузка и очередь потребителей.
+Результаты дописываются в benchmarks/results/event_bus.jsonl и сравниваются
+с прошлым прогоном с теми же параметрами.
+С --partitioned потребители разбирают события по партициям заказа/пользователя
+(порядок внутри заказа сохраняется), без него - общим пулом обработчиков.
+Запуск: python benchmarks/event_bus.py [--transport local|rabbitmq] [--rate 200] [--duration 10] [--partitioned]
+"""
+
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import pika
+
+from shared.messaging import (RABBITMQ_URL, LocalTransport, MessageBroker, RabbitMQTransport,
+                              partition_key, publisher_pool)
+
+NOTIFICATION_DIR = os.path.join(ROOT, "notification-service", "shared")
+REPORTING_DIR = os.path.join(ROOT, "reporting-analytics-service")
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "event_bus.jsonl")
+
+
+def load_service(directory, database_url):
+    """Импорт crud и database сервиса, который импортирует свои модули по плоским
+    именам (crud, models, database); имена освобождаются для следующего сервиса"""
+    os.environ["DATABASE_URL"] = database_url
+    directory = os.path.abspath(directory)
+    before = set(sys.modules)
+    sys.path.insert(0, directory)
+    try:
+        crud = importlib.import_module("crud")
+        database = importlib.import_module("database")
+        database.init_db()
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - before:
+            path = getattr(sys.modules[name], "__file__", None) or ""
+            if os.path.abspath(path).startswith(directory):
+                del sys.modules[name]
+    return crud, database
+
+
+def load_sales_messaging():
+    path = os.path.join(ROOT, "sales-service", "messaging.py")
+    spec = importlib.util.spec_from_file_location("sales_messaging", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"p50": round(pick(0.50), 2), "p95": round(pick(0.95), 2),
+            "p99": round(pick(0.99), 2), "max": round(values[-1], 2)}
+
+
+class ConsumerProbe:
+    """Оборачивает обработчик: сквозная задержка, время работы, ошибки"""
+
+    def __init__(self, name, handler, workers):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.lag_ms = []
+        self.busy = 0.0
+        self.failed = 0
+        self.max_backlog = 0
+        self.last_done = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        started = time.perf_counter()
+        try:
+            self.handler(event)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finished = time.time()
+        with self._lock:
+            self.busy += time.perf_counter() - started
+            self.lag_ms.append((finished - event.timestamp_us / 1_000_000) * 1000)
+            self.last_done = time.perf_counter()
+
+    @property
+    def handled(self):
+        return len(self.lag_ms)
+
+    def report(self, started, elapsed):
+        active = (self.last_done - started) if self.last_done else elapsed
+        return {
+            "handled": self.handled,
+            "failed": self.failed,
+            "throughput": round(self.handled / active, 1) if active > 0 else 0.0,
+            "lag_ms": percentiles(self.lag_ms),
+            # Доля времени, когда все обработчики заняты; около 1 - потребитель насыщен
+            "busy": round(self.busy / (self.workers * active), 3) if active > 0 else 0.0,
+            "max_backlog": self.max_backlog,
+        }
+
+
+def make_consumers(notification_db, reporting_db, workers):
+    notification_crud, notification_database = load_service(NOTIFICATION_DIR, notification_db)
+    reporting_crud, reporting_database = load_service(REPORTING_DIR, reporting_db)
+
+    def notify(event):
+        db = notification_database.SessionLocal()
+        try:
+            notification_crud.EventProcessor.process_event(db, event)
+        finally:
+            db.close()
+
+    def track(event):
+        db = reporting_database.SessionLocal()
+        try:
+            # Как handle_event в main.py сервиса отчётов
+            reporting_crud.AnalyticsCRUD.track_event(db, {
+                "event_type": event["event_type"],
+                "properties": event.get("payload", {}),
+                "context": {"source": "benchmark", "timestamp": datetime.utcnow().isoformat()},
+            })
+        finally:
+            db.close()
+
+    return [ConsumerProbe("notification", notify, workers), ConsumerProbe("reporting", track, workers)]
+
+
+def publisher(broker, sales, rate, duration, payment_share, index, count, latencies_ms, behind):
+    """Шлёт события по расписанию rate/count в секунду; опоздания копятся в behind"""
+    interval = count / rate
+    started = time.perf_counter()
+    next_at = started + index * interval / count
+    i = index
+    while next_at - started < duration:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -interval:
+            behind[index] += 1
+        sent = time.perf_counter()
+        # payment_share событий - платежи, равномерно вперемешку с заказами
+        if int((i + 1) * payment_share) > int(i * payment_share):
+            broker.publish_event("autosalon", "payment.completed", {
+                "payment_id": i, "order_id": i, "user_id": 1 + i % 100,
+                "amount": 1500000.0, "status": "completed",
+            })
+        elif isinstance(broker.transport, RabbitMQTransport):
+            sales.publish_order_event("CREATED", i, 1 + i % 100, 1 + i % 50, 1500000.0)
+        else:
+            # То же, что publish_order_event, но в локальную шину
+            broker.transport.publish(*sales.order_event_message("CREATED", i, 1 + i % 100, 1 + i % 50, 1500000.0))
+        latencies_ms.append((time.perf_counter() - sent) * 1000)
+        i += count
+        next_at += interval
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="event-bus-")
+    probes = make_consumers(args.notification_db or f"sqlite:///{workdir}/notification.db",
+                            args.reporting_db or f"sqlite:///{workdir}/reporting.db", args.workers)
+    sales = load_sales_messaging()
+    transport = LocalTransport() if args.transport == "local" else RabbitMQTransport()
+    broker = MessageBroker(transport=transport)
+    partition_by = partition_key("order_id", "user_id") if args.partitioned else None
+    consumers = [broker.subscribe_to_events("*", ["*.*"], probe, workers=args.workers,
+                                            prefetch=args.workers * 10, partition_by=partition_by)
+                 for probe in probes]
+    if any(consumer is None for consumer in consumers):
+        sys.exit("Could not subscribe")
+    await asyncio.sleep(0.5 if args.transport == "rabbitmq" else 0)
+
+    latencies_ms = []
+    behind = [0] * args.publishers
+    started = time.perf_counter()
+    publishers = [
+        asyncio.to_thread(publisher, broker, sales, args.rate, args.duration, args.payment_share,
+                          index, args.publishers, latencies_ms, behind)
+        for index in range(args.publishers)
+    ]
+
+    async def sample_backlog():
+        while True:
+            for probe, consumer in zip(probes, consumers):
+                stats = consumer.stats()
+                probe.max_backlog = max(probe.max_backlog, stats.get("queued", stats.get("in_flight", 0)))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_backlog())
+    await asyncio.gather(*publishers)
+    publish_elapsed = time.perf_counter() - started
+    published = len(latencies_ms)
+
+    # Ждём, пока потребители догонят
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline and any(p.handled + p.failed < published for p in probes):
+        await asyncio.sleep(0.05)
+    drained_after = time.perf_counter() - started - publish_elapsed
+    sampler.cancel()
+    broker.close()
+    publisher_pool.close()
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "label": args.label,
+        "transport": args.transport,
+        "rate": args.rate,
+        "duration": args.duration,
+        "publishers": args.publishers,
+        "workers": args.workers,
+        "partitioned": args.partitioned,
+        "published": published,
+        "publish_rate": round(published / publish_elapsed, 1),
+        "publishers_behind": sum(behind),
+        "publish_latency_ms": percentiles(latencies_ms),
+        "drain_seconds": round(drained_after, 2),
+        "consumers": {probe.name: probe.report(started, time.perf_counter() - started) for probe in probes},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def previous_result(path, result):
+    """Последний сохранённый прогон с теми же параметрами"""
+    if not os.path.exists(path):
+        return None
+    keys = ("transport", "rate", "duration", "publishers", "workers")
+    match = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if (all(record.get(key) == result[key] for key in keys)
+                    and record.get("partitioned", False) == result["partitioned"]):
+                match = record
+    return match
+
+
+def print_result(result, previous):
+    def delta(current, old):
+        if old in (None, 0) or current is None:
+            return ""
+        return f" ({(current - old) / old * 100:+.0f}%)"
+
+    old = previous or {}
+    print(f"{result['transport']}: {result['published']} events at {result['publish_rate']}/s "
+          f"(target {result['rate']}/s, {result['publishers_behind']} late sends)")
+    latency = result["publish_latency_ms"]
+    old_latency = old.get("publish_latency_ms", {})
+    print(f"  publish latency ms: p50 {latency.get('p50')} p99 {latency.get('p99')}"
+          f"{delta(latency.get('p99'), old_latency.get('p99'))} max {latency.get('max')}")
+    print(f"  drained {result['drain_seconds']}s after the last publish")
+    print(f"{'consumer':>14} {'handled':>8} {'failed':>7} {'events/s':>9} {'lag p50':>8} {'lag p95':>8} "
+          f"{'lag p99':>8} {'busy':>6} {'backlog':>8}")
+    for name, stats in result["consumers"].items():
+        lag = stats["lag_ms"]
+        old_stats = old.get("consumers", {}).get(name, {})
+        print(f"{name:>14} {stats['handled']:>8} {stats['failed']:>7} {stats['throughput']:>9} "
+              f"{lag.get('p50', '-'):>8} {lag.get('p95', '-'):>8} {lag.get('p99', '-'):>8} "
+              f"{stats['busy']:>6} {stats['max_backlog']:>8}"
+              f"{delta(lag.get('p95'), old_stats.get('lag_ms', {}).get('p95'))}")
+    if previous:
+        print(f"  compared with {previous.get('commit')} {previous.get('label') or ''} "
+              f"from {previous['timestamp']} (change of publish p99 and lag p95)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event bus throughput and latency benchmark")
+    parser.add_argument("--transport", choices=("local", "rabbitmq"), default="local")
+    parser.add_argument("--rate", type=float, default=200, help="events per second, all publishers together")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of publishing")
+    parser.add_argument("--publishers", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=4, help="handler threads per consumer")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="partition consumers by order_id/user_id, one thread per partition")
+    parser.add_argument("--payment-share", type=float, default=0.5, help="share of payment.* among the events")
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--notification-db", help="database URL, SQLite in a temp dir by default")
+    parser.add_argument("--reporting-db", help="database URL, SQLite in a temp dir by default")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSONL file results are appended to")
+    parser.add_argument("--label", default="", help="note stored with the result")
+    args = parser.parse_args()
+
+    if args.transport == "rabbitmq":
+        try:
+            pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL)).close()
+        except pika.exceptions.AMQPError as e:
+            print(f"RabbitMQ is not reachable at {RABBITMQ_URL}: {e!r}")
+            sys.exit(1)
+
+    result = asyncio.run(run(args))
+    previous = previous_result(args.results, result)
+    print_result(result, previous)
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конверта событий: прежний JSON (json.dumps/json.loads всего события)
+против конверта shared.envelope в JSON и msgpack. Размер сообщения, время
+кодирования и декодирования для PaymentEvent, FinancingEvent и InsuranceEvent;
+"header only" - потребитель читает только тип события (как кэш шлюза).
+Запуск: python benchmarks/event_envelope.py [событий]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from shared.envelope import JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, decode_event, encode_event, msgpack
+from shared.models import FinancingEvent, InsuranceEvent, PaymentEvent
+
+NOW = datetime(2024, 5, 1, 12, 30)
+
+# Полезная нагрузка в том виде, в каком её публикуют CRUD сервисов
+EVENTS = {
+    PaymentEvent: ("payment_events", "payment.completed", {
+        "payment_id": 1042, "order_id": 517, "customer_id": 88, "amount": 1500000.0,
+        "payment_method": "card", "status": "completed", "transaction_id": "TXN-7f3a9c21",
+        "timestamp": NOW,
+    }),
+    FinancingEvent: ("financing_events", "financing.approved", {
+        "application_id": 311, "order_id": 517, "customer_id": 88, "amount": 1200000.0,
+        "term_months": 36, "interest_rate": 12.5, "monthly_payment": 40141.9,
+        "status": "approved", "timestamp": NOW,
+    }),
+    InsuranceEvent: ("insurance_events", "insurance.policy_created", {
+        "policy_id": 76, "order_id": 517, "customer_id": 88, "vehicle_id": 12,
+        "policy_number": "POL-2024-000076", "insurance_type": "kasko", "premium": 85000.0,
+        "coverage_amount": 1500000.0, "start_date": NOW, "end_date": NOW, "timestamp": NOW,
+    }),
+}
+
+
+def legacy_encode(exchange, routing_key, payload):
+    """Прежний MessageBroker.build_event"""
+    return json.dumps({
+        "event_id": f"{exchange}.{routing_key}.{datetime.utcnow().timestamp()}",
+        "event_type": routing_key,
+        "timestamp": datetime.utcnow().isoformat(),
+        "payload": payload,
+    }, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+
+
+def timed(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1_000_000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codecs = [JSON_CONTENT_TYPE] + ([MSGPACK_CONTENT_TYPE] if msgpack else [])
+    if msgpack is None:
+        print("msgpack is not installed, only JSON is measured")
+
+    print(f"{n} events per case, times in microseconds per event")
+    print(f"{'event':>16} {'codec':>20} {'bytes':>6} {'encode':>8} {'decode':>8} {'header only':>12}")
+    for model, (exchange, routing_key, payload) in EVENTS.items():
+        body = legacy_encode(exchange, routing_key, payload)
+        # Прежний потребитель разбирал всё сообщение, даже если нужен только тип
+        decode = timed(lambda: json.loads(body), n)
+        encode = timed(lambda: legacy_encode(exchange, routing_key, payload), n)
+        print(f"{model.__name__:>16} {'legacy json':>20} {len(body):>6} {encode:>8.2f} {decode:>8.2f} {decode:>12.2f}")
+
+        for content_type in codecs:
+            body, properties = encode_event(exchange, routing_key, payload, content_type)
+            # Конверт читается моделями shared.models без изменений
+            model.model_validate(dict(decode_event(body, content_type)))
+            encode = timed(lambda: encode_event(exchange, routing_key, payload, content_type), n)
+            decode = timed(lambda: decode_event(body, content_type).payload, n)
+            header = timed(lambda: decode_event(body, content_type)["event_type"], n)
+            print(f"{model.__name__:>16} {content_type:>20} {len(body):>6} {encode:>8.2f} {decode:>8.2f} {header:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
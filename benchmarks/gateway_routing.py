@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк маршрутизации API Gateway: стоимость поиска маршрута
+в RouteTable и в прежнем линейном переборе service_map с ростом числа маршрутов.
+Запуск: python benchmarks/gateway_routing.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api-gateway-service"))
+
+from routing import DEFAULT_ROUTES, Route, RouteTable
+
+ROUTE_COUNTS = [17, 100, 1000, 10000]
+LOOKUPS = 20000
+
+def build_routes(count):
+    """Стандартные маршруты плюс синтетические до нужного количества"""
+    routes = [Route(prefix, upstream) for prefix, upstream in DEFAULT_ROUTES]
+    for i in range(count - len(routes)):
+        routes.append(Route(f"synthetic{i}/v{i % 3}", "sales-service"))
+    return routes
+
+def linear_match(service_map, path):
+    """Прежний алгоритм из proxy_handler"""
+    for prefix, upstream in service_map.items():
+        if path.startswith(prefix + "/") or path == prefix:
+            return upstream, path[len(prefix) + 1:] if path != prefix else ""
+    return None, path
+
+def main():
+    # Худший случай для перебора: маршрут, добавленный последним
+    print(f"{'routes':>8} {'RouteTable, us':>16} {'linear scan, us':>16}")
+    for count in ROUTE_COUNTS:
+        routes = build_routes(count)
+        table = RouteTable(routes)
+        service_map = {route.prefix: route.upstream for route in routes}
+        path = routes[-1].prefix + "/orders/42/payments"
+
+        assert table.match(path)[0] is routes[-1]
+        assert linear_match(service_map, path)[0] == routes[-1].upstream
+
+        table_time = timeit.timeit(lambda: table.match(path), number=LOOKUPS)
+        linear_time = timeit.timeit(lambda: linear_match(service_map, path), number=LOOKUPS)
+        print(f"{count:>8} {table_time / LOOKUPS * 1e6:>16.3f} {linear_time / LOOKUPS * 1e6:>16.3f}")
+
+if __name__ == "__main__":
+    main()
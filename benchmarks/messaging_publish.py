@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк публикации событий в RabbitMQ: соединение на каждое событие
+(прежний sales/inventory messaging), один канал с exchange_declare на каждую
+публикацию (прежний MessageBroker) и пул долгоживущих каналов PublisherPool.
+Нужен запущенный RabbitMQ (RABBITMQ_URL, по умолчанию localhost).
+Запуск: python benchmarks/messaging_publish.py [потоков] [событий на поток]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pika
+
+from shared.messaging import RABBITMQ_URL, PublisherPool
+
+EXCHANGE = "benchmark_events"
+ROUTING_KEY = "benchmark.published"
+PROPERTIES = pika.BasicProperties(delivery_mode=2)
+
+def event_body(i):
+    return json.dumps({"event_type": ROUTING_KEY, "payload": {"order_id": i, "amount": 1500000.0}})
+
+def connection_per_event(i):
+    """Прежний publish_order_event: TCP + AMQP handshake на каждое событие"""
+    connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+    channel = connection.channel()
+    channel.exchange_declare(exchange=EXCHANGE, exchange_type='topic', durable=True)
+    channel.basic_publish(exchange=EXCHANGE, routing_key=ROUTING_KEY, body=event_body(i), properties=PROPERTIES)
+    connection.close()
+
+def shared_channel():
+    """Прежний MessageBroker: один канал на процесс и declare на каждую публикацию.
+    Канал pika не потокобезопасен, поэтому здесь он под блокировкой."""
+    connection = pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL))
+    channel = connection.channel()
+    lock = threading.Lock()
+
+    def publish(i):
+        with lock:
+            channel.exchange_declare(exchange=EXCHANGE, exchange_type='topic', durable=True)
+            channel.basic_publish(exchange=EXCHANGE, routing_key=ROUTING_KEY, body=event_body(i), properties=PROPERTIES)
+
+    return publish, connection.close
+
+def pooled(size):
+    pool = PublisherPool(size=size)
+
+    def publish(i):
+        pool.publish(EXCHANGE, ROUTING_KEY, event_body(i), PROPERTIES)
+
+    return publish, pool.close
+
+def run(publish, threads, events):
+    def worker():
+        for i in range(events):
+            publish(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return threads * events / (time.perf_counter() - started)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    try:
+        pika.BlockingConnection(pika.URLParameters(RABBITMQ_URL)).close()
+    except pika.exceptions.AMQPError as e:
+        print(f"RabbitMQ is not reachable at {RABBITMQ_URL}: {e!r}")
+        sys.exit(1)
+
+    print(f"{threads} threads x {events} events")
+    print(f"{'strategy':>24} {'events/s':>10}")
+
+    # Соединение на событие на порядки медленнее, поэтому меньше событий
+    rate = run(connection_per_event, threads, max(1, events // 10))
+    print(f"{'connection per event':>24} {rate:>10.0f}")
+
+    publish, close = shared_channel()
+    rate = run(publish, threads, events)
+    close()
+    print(f"{'shared channel':>24} {rate:>10.0f}")
+
+    for size in (1, threads):
+        publish, close = pooled(size)
+        rate = run(publish, threads, events)
+        close()
+        print(f"{f'pool of {size}':>24} {rate:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк создания заказа в sales-service против заглушек inventory-service
+и pricing-service (HTTP-сервер в процессе с заданной задержкой ответа).
+Сравниваются прежний последовательный порядок вызовов (наличие, затем цена)
+и services.create_order, где оба запроса идут параллельно под общим сроком.
+Заказы пишутся в SQLite во временном каталоге; отчёт - перцентили задержки,
+пропускная способность, число INSERT в orders и коммитов на заказ.
+Клиенты берут соединения из общих пулов (clients/service_client.py); их
+гистограммы задержек печатаются в конце.
+Запуск: python benchmarks/order_create.py [--orders 200] [--concurrency 10] [--inventory-ms 40] [--pricing-ms 60]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SALES_DIR = os.path.join(ROOT, "sales-service")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stub_app(inventory_ms, pricing_ms, jitter):
+    """inventory-service и pricing-service в одном приложении"""
+    app = FastAPI()
+
+    async def pause(ms):
+        await asyncio.sleep(ms * random.uniform(1 - jitter, 1 + jitter) / 1000)
+
+    @app.get("/inventory/{vehicle_id}")
+    async def availability(vehicle_id: int):
+        await pause(inventory_ms)
+        return {"vehicle_id": vehicle_id, "available": True, "vin": f"VIN{vehicle_id:014d}"}
+
+    @app.post("/pricing/calculate")
+    async def calculate(request: dict):
+        await pause(pricing_ms)
+        return {"base_price": 2500000.0, "final_price": 2375000.0,
+                "applied_discounts": [{"code": "SPRING", "amount": 125000.0}], "currency": "RUB"}
+
+    return app
+
+
+def start_stub(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"p50": round(pick(0.50), 1), "p95": round(pick(0.95), 1),
+            "p99": round(pick(0.99), 1), "max": round(values[-1], 1)}
+
+
+def count_statements(engine):
+    """Счётчики INSERT в orders и коммитов"""
+    counts = {"order_inserts": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO ORDERS"):
+            counts["order_inserts"] += 1
+
+    @event.listens_for(engine, "commit")
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    return counts
+
+
+async def run(name, pipeline, session_factory, schemas, counts, args):
+    for key in counts:
+        counts[key] = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            db = session_factory()
+            try:
+                order = schemas.OrderCreate(customer_id=1 + i % 100, vehicle_id=1 + i % 50,
+                                            payment_method="credit_card")
+                started = time.perf_counter()
+                await pipeline(db, order)
+                latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                db.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.orders)))
+    elapsed = time.perf_counter() - started
+    stats = percentiles(latencies)
+    print(f"{name:>11} {stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8} {stats['max']:>8} "
+          f"{args.orders / elapsed:>9.1f} {counts['order_inserts'] / args.orders:>8.2f} "
+          f"{counts['commits'] / args.orders:>8.2f}")
+    return stats
+
+
+async def main_async(args):
+    port = free_port()
+    server = start_stub(stub_app(args.inventory_ms, args.pricing_ms, args.jitter), port)
+    # Адреса заглушек читаются клиентами при импорте
+    os.environ["INVENTORY_SERVICE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["PRICING_SERVICE_URL"] = f"http://127.0.0.1:{port}"
+    sys.path.insert(0, SALES_DIR)
+    import crud
+    import models
+    import schemas
+    import services
+    from clients import inventory_client, pricing_client
+    from clients.service_client import service_clients
+    from shared.outbox import OutboxBase
+
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp(prefix='order-create-')}/sales.db")
+    models.Base.metadata.create_all(bind=engine)
+    OutboxBase.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    counts = count_statements(engine)
+
+    async def sequential(db, order_data):
+        """Прежний порядок: наличие, затем цена"""
+        availability = await inventory_client.check_availability(order_data.vehicle_id)
+        if not availability.get("available", False):
+            raise Exception(f"Vehicle {order_data.vehicle_id} is not available")
+        price_calculation = await pricing_client.calculate_price(
+            vehicle_id=order_data.vehicle_id, customer_id=order_data.customer_id,
+            payment_method=order_data.payment_method, discount_code=order_data.discount_code)
+        return crud.create_order(
+            db, order_data, base_price=price_calculation["base_price"],
+            final_price=price_calculation["final_price"], vin=availability.get("vin", "UNKNOWN"),
+            event_type="OrderCreated")
+
+    async def concurrent(db, order_data):
+        return await services.create_order(db, order_data, None)
+
+    print(f"upstreams: inventory {args.inventory_ms} ms, pricing {args.pricing_ms} ms (±{args.jitter:.0%}); "
+          f"{args.orders} orders, {args.concurrency} at a time")
+    print(f"{'pipeline':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'orders/s':>9} "
+          f"{'inserts':>8} {'commits':>8}")
+    # Прогрев соединений и импорта
+    await run("warmup", concurrent, session_factory, schemas, counts,
+              argparse.Namespace(orders=args.concurrency, concurrency=args.concurrency))
+    before = await run("sequential", sequential, session_factory, schemas, counts, args)
+    after = await run("concurrent", concurrent, session_factory, schemas, counts, args)
+    print(f"p50 {before['p50'] / after['p50']:.2f}x faster, expected about "
+          f"{(args.inventory_ms + args.pricing_ms) / max(args.inventory_ms, args.pricing_ms):.2f}x "
+          f"from the upstream latencies")
+    for name, stats in service_clients.stats().items():
+        for operation, latency in stats["latency"].items():
+            print(f"  {name} {operation}: {latency['count']} calls, p50 {latency['p50_ms']} ms, "
+                  f"p99 {latency['p99_ms']} ms, retried {stats['retried']}")
+    await service_clients.close()
+    server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10, help="orders created at the same time")
+    parser.add_argument("--inventory-ms", type=float, default=40, help="inventory-service response time")
+    parser.add_argument("--pricing-ms", type=float, default=60, help="pricing-service response time")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative spread of the response times")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from typing import List, Optional
 from models import FinancingApplication, FinancingSchedule, FinancingStatus, FinancingType
 from shared.models import FinancingEvent
-from shared.messaging import message_broker
+from shared import outbox
 
 class FinancingCRUD:
     @staticmethod
@@ -55,14 +55,13 @@ class FinancingCRUD:
         )
 
         db.add(application)
-        db.commit()
-        db.refresh(application)
+        db.flush()
 
-        # Publish event
+        # Stage the event in the same transaction
         event = FinancingEvent(
             event_id=f"financing_{application.id}",
             event_type="financing.created",
-            timestamp=application.created_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "application_id": application.id,
                 "user_id": user_id,
@@ -71,7 +70,9 @@ class FinancingCRUD:
                 "status": FinancingStatus.DRAFT.value
             }
         )
-        message_broker.publish_event("autosalon", "financing.created", event.dict())
+        outbox.add_event(db, "autosalon", "financing.created", event.dict(), "financing_application", application.id)
+        db.commit()
+        db.refresh(application)
 
         return application
 
@@ -83,14 +84,12 @@ class FinancingCRUD:
             return None
 
         application.status = FinancingStatus.SUBMITTED
-        db.commit()
-        db.refresh(application)
 
-        # Publish event
+        # Stage the event in the same transaction
         event = FinancingEvent(
             event_id=f"financing_{application.id}_submitted",
             event_type="financing.submitted",
-            timestamp=application.updated_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "application_id": application.id,
                 "user_id": application.user_id,
@@ -99,7 +98,9 @@ class FinancingCRUD:
                 "status": FinancingStatus.SUBMITTED.value
             }
         )
-        message_broker.publish_event("autosalon", "financing.submitted", event.dict())
+        outbox.add_event(db, "autosalon", "financing.submitted", event.dict(), "financing_application", application.id)
+        db.commit()
+        db.refresh(application)
 
         return application
 
@@ -124,15 +125,12 @@ class FinancingCRUD:
         if notes:
             application.notes = notes
 
-        db.commit()
-        db.refresh(application)
-
-        # Publish event
+        # Stage the event in the same transaction
         event_type = "financing.approved" if approved else "financing.rejected"
         event = FinancingEvent(
             event_id=f"financing_{application.id}_{event_type}",
             event_type=event_type,
-            timestamp=application.updated_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "application_id": application.id,
                 "user_id": application.user_id,
@@ -141,7 +139,9 @@ class FinancingCRUD:
                 "status": application.status.value
             }
         )
-        message_broker.publish_event("autosalon", event_type, event.dict())
+        outbox.add_event(db, "autosalon", event_type, event.dict(), "financing_application", application.id)
+        db.commit()
+        db.refresh(application)
 
         return application
 
@@ -217,7 +217,8 @@ class FinancingCRUD:
             db.add(schedule_entry)
             remaining_balance -= principal_payment
 
-        db.commit()
+        # Committed together with the application status by the caller
+        db.flush()
 
     @staticmethod
     def get_financing_stats(db: Session) -> dict:
@@ -1,9 +1,13 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Mapping, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
+import hashlib
+import hmac
+import json
 import os
+import time
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
@@ -11,6 +15,10 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Identity headers set by the API gateway after it has verified the JWT,
+# signed with a secret shared between the gateway and the services
+GATEWAY_IDENTITY_SECRET = os.getenv("GATEWAY_IDENTITY_SECRET", SECRET_KEY)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class AuthUtils:
@@ -47,4 +55,33 @@ class AuthUtils:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             return payload
         except JWTError:
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def sign_identity(user_id: str, email: str, role: str, exp: str) -> str:
+        # JSON keeps the fields apart: an email may itself contain any separator
+        message = json.dumps([user_id, email, role, exp])
+        return hmac.new(GATEWAY_IDENTITY_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def verify_gateway_identity(headers: Mapping[str, str]) -> Optional[dict]:
+        """Token payload from the gateway identity headers, without decoding the JWT again.
+        Returns None if the headers are missing, forged or expired."""
+        user_id = headers.get("x-user-id")
+        signature = headers.get("x-identity-signature")
+        if not user_id or not signature:
+            return None
+
+        email = headers.get("x-user-email", "")
+        role = headers.get("x-user-role", "")
+        exp = headers.get("x-user-exp", "")
+        expected = AuthUtils.sign_identity(user_id, email, role, exp)
+        if not hmac.compare_digest(signature, expected):
+            return None
+        try:
+            if exp and float(exp) < time.time():
+                return None
+        except ValueError:
+            return None
+
+        return {"sub": user_id, "email": email or None, "role": role or None, "exp": exp}
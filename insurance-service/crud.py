@@ -5,7 +5,7 @@ import uuid
 import json
 from models import InsurancePolicy, InsuranceClaim, InsuranceStatus, InsuranceType
 from shared.models import InsuranceEvent
-from shared.messaging import message_broker
+from shared import outbox
 
 class InsuranceCRUD:
     @staticmethod
@@ -92,10 +92,8 @@ class InsuranceCRUD:
 
         policy.status = InsuranceStatus.PURCHASED
         policy.purchased_at = datetime.utcnow()
-        db.commit()
-        db.refresh(policy)
 
-        # Publish event
+        # Stage the event in the same transaction
         event = InsuranceEvent(
             event_id=f"insurance_{policy.id}",
             event_type="insurance.purchased",
@@ -109,7 +107,9 @@ class InsuranceCRUD:
                 "status": InsuranceStatus.PURCHASED.value
             }
         )
-        message_broker.publish_event("autosalon", "insurance.purchased", event.dict())
+        outbox.add_event(db, "autosalon", "insurance.purchased", event.dict(), "insurance_policy", policy.id)
+        db.commit()
+        db.refresh(policy)
 
         return policy
 
@@ -123,10 +123,8 @@ class InsuranceCRUD:
         policy.status = InsuranceStatus.ACTIVE
         policy.is_paid = True
         policy.payment_date = datetime.utcnow()
-        db.commit()
-        db.refresh(policy)
 
-        # Publish event
+        # Stage the event in the same transaction
         event = InsuranceEvent(
             event_id=f"insurance_{policy.id}_activated",
             event_type="insurance.activated",
@@ -139,7 +137,9 @@ class InsuranceCRUD:
                 "status": InsuranceStatus.ACTIVE.value
             }
         )
-        message_broker.publish_event("autosalon", "insurance.activated", event.dict())
+        outbox.add_event(db, "autosalon", "insurance.activated", event.dict(), "insurance_policy", policy.id)
+        db.commit()
+        db.refresh(policy)
 
         return policy
 
@@ -183,14 +183,13 @@ class InsuranceCRUD:
         )
 
         db.add(claim)
-        db.commit()
-        db.refresh(claim)
+        db.flush()
 
-        # Publish event
+        # Stage the event in the same transaction
         event = InsuranceEvent(
             event_id=f"claim_{claim.id}",
             event_type="insurance.claim.submitted",
-            timestamp=claim.submitted_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "claim_id": claim.id,
                 "policy_id": policy_id,
@@ -199,7 +198,9 @@ class InsuranceCRUD:
                 "status": "submitted"
             }
         )
-        message_broker.publish_event("autosalon", "insurance.claim.submitted", event.dict())
+        outbox.add_event(db, "autosalon", "insurance.claim.submitted", event.dict(), "insurance_claim", claim.id)
+        db.commit()
+        db.refresh(claim)
 
         return claim
 
@@ -228,10 +229,7 @@ class InsuranceCRUD:
             claim.status = "rejected"
             claim.rejection_reason = rejection_reason
 
-        db.commit()
-        db.refresh(claim)
-
-        # Publish event
+        # Stage the event in the same transaction
         event_type = "insurance.claim.approved" if approved_amount > 0 else "insurance.claim.rejected"
         event = InsuranceEvent(
             event_id=f"claim_{claim.id}_processed",
@@ -245,7 +243,9 @@ class InsuranceCRUD:
                 "status": claim.status
             }
         )
-        message_broker.publish_event("autosalon", event_type, event.dict())
+        outbox.add_event(db, "autosalon", event_type, event.dict(), "insurance_claim", claim.id)
+        db.commit()
+        db.refresh(claim)
 
         return claim
 
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import pika
+
+try:
+    import msgpack
+except ImportError:  # JSON only
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# Version of the envelope layout (not of the payload schema)
+ENVELOPE_VERSION = 1
+
+# Codec for new events; consumers pick the decoder from each message's content_type
+EVENT_CONTENT_TYPE = os.getenv("EVENT_CONTENT_TYPE", MSGPACK_CONTENT_TYPE if msgpack else JSON_CONTENT_TYPE)
+
+# AMQP header with the event's partition key (its aggregate, e.g. "order:17")
+PARTITION_HEADER = "x-partition-key"
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+class _MonotonicClock:
+    """Wall-clock microseconds that never go backwards within the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def now_us(self) -> int:
+        with self._lock:
+            self._last = max(time.time_ns() // 1000, self._last + 1)
+            return self._last
+
+
+_clock = _MonotonicClock()
+
+
+def new_event_id(timestamp_us: Optional[int] = None) -> str:
+    """ULID: 48-bit millisecond timestamp and 80 random bits, sortable by creation time"""
+    if timestamp_us is None:
+        timestamp_us = _clock.now_us()
+    value = ((timestamp_us // 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    return "".join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    return str(value)
+
+
+class Event(Mapping):
+    """Decoded event envelope.
+
+    The header (id, type, timestamp, partition key) is available immediately;
+    the payload is decoded on first access, so routing, partitioning and
+    de-duplication on the header cost no payload decoding. Reads as the legacy dict too: event["event_type"],
+    event["event_id"], event["timestamp"], event.get("payload").
+    """
+
+    _KEYS = ("event_id", "event_type", "timestamp", "payload")
+
+    def __init__(self, event_id: str, event_type: str, timestamp_us: int, source: str = "",
+                 version: int = ENVELOPE_VERSION, payload: Any = None,
+                 raw_payload: Optional[bytes] = None, content_type: str = JSON_CONTENT_TYPE,
+                 fields: Optional[dict] = None, partition_key: Optional[str] = None):
+        self.id = event_id
+        self.type = event_type
+        self.timestamp_us = timestamp_us
+        self.source = source
+        self.version = version
+        self.content_type = content_type
+        # Events with the same key are consumed in publish order
+        self.partition_key = partition_key
+        self._payload = payload
+        self._raw_payload = raw_payload
+        # Top-level keys of a JSON message, for consumers of flat events
+        self._fields = fields or {}
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp_us / 1_000_000, tz=timezone.utc)
+
+    @property
+    def payload(self) -> Any:
+        if self._raw_payload is not None:
+            self._payload = msgpack.unpackb(self._raw_payload, raw=False)
+            self._raw_payload = None
+        return self._payload
+
+    def __getitem__(self, key: str):
+        if key == "event_id":
+            return self.id
+        if key == "event_type":
+            return self.type
+        if key == "timestamp":
+            return self.timestamp.replace(tzinfo=None).isoformat()
+        if key == "payload":
+            return self.payload
+        return self._fields[key]
+
+    def __iter__(self):
+        yield from self._KEYS
+        yield from (key for key in self._fields if key not in self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS) + sum(1 for key in self._fields if key not in self._KEYS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+
+def encode_event(exchange: str, event_type: str, payload: dict,
+                 content_type: str = EVENT_CONTENT_TYPE,
+                 partition_key: Optional[Any] = None) -> Tuple[bytes, pika.BasicProperties]:
+    """Serialize an event and the AMQP properties that describe it.
+
+    partition_key names the aggregate the event belongs to; partitioned
+    consumers handle events with the same key one at a time, in order.
+    """
+    timestamp_us = _clock.now_us()
+    event_id = new_event_id(timestamp_us)
+    if partition_key is not None:
+        partition_key = str(partition_key)
+
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        # The payload is packed separately so consumers can skip decoding it
+        header = {
+            "v": ENVELOPE_VERSION,
+            "id": event_id,
+            "type": event_type,
+            "ts": timestamp_us,
+            "src": exchange,
+            "p": msgpack.packb(payload, default=_default, use_bin_type=True),
+        }
+        if partition_key is not None:
+            header["k"] = partition_key
+        body = msgpack.packb(header, use_bin_type=True)
+    elif content_type == JSON_CONTENT_TYPE:
+        data = {
+            "event_id": event_id,
+            "event_type": event_type,
+            "timestamp": datetime.utcfromtimestamp(timestamp_us / 1_000_000).isoformat(),
+            "version": ENVELOPE_VERSION,
+            "source": exchange,
+            "payload": payload,
+        }
+        if partition_key is not None:
+            data["partition_key"] = partition_key
+        body = json.dumps(data, default=_default).encode("utf-8")
+    else:
+        raise ValueError(f"Unsupported event content type {content_type!r}")
+
+    properties = pika.BasicProperties(
+        delivery_mode=2,  # make message persistent
+        content_type=content_type,
+        message_id=event_id,
+        timestamp=timestamp_us // 1_000_000,
+        type=event_type,
+        headers={PARTITION_HEADER: partition_key} if partition_key is not None else None,
+    )
+    return body, properties
+
+
+def decode_event(body: bytes, content_type: Optional[str] = None) -> Event:
+    """Decode a message by its content type; untyped messages are treated as JSON"""
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        header = msgpack.unpackb(body, raw=False)
+        return Event(header["id"], header["type"], header["ts"], header.get("src", ""),
+                     header.get("v", ENVELOPE_VERSION), raw_payload=header["p"],
+                     content_type=MSGPACK_CONTENT_TYPE, partition_key=header.get("k"))
+
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Event must be a JSON object")
+    timestamp = data.get("timestamp")
+    try:
+        parsed = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        timestamp_us = 0
+    else:
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        timestamp_us = int(parsed.timestamp() * 1_000_000)
+    # Flat events without an envelope (e.g. older order events) are their own payload
+    payload = data.get("payload", data)
+    return Event(str(data.get("event_id", "")), data.get("event_type", ""), timestamp_us,
+                 data.get("source", ""), data.get("version", 0), payload=payload, fields=data,
+                 partition_key=data.get("partition_key"))
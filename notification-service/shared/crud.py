@@ -13,16 +13,13 @@ from models import (
     Notification, NotificationTemplate, EventHistory, UserNotificationSettings,
     NotificationType, NotificationStatus, NotificationChannel
 )
+from idempotency import IdempotencyGuard
+from messaging import message_broker
 
-# Заглушки вместо общего shared модуля
-class MessageBroker:
-    def publish_event(self, exchange, routing_key, event_data):
-        print(f"[STUB] Event: {exchange}.{routing_key} - {event_data}")
-    
-    def subscribe_to_events(self, exchange, routing_keys, callback):
-        print(f"[STUB] Subscribed to {exchange}: {routing_keys}")
+# История событий - журнал для админки, дедупликация идёт через idempotency_guard
+EVENT_HISTORY_RETENTION_DAYS = float(os.getenv("EVENT_HISTORY_RETENTION_DAYS", "30"))
 
-message_broker = MessageBroker()
+idempotency_guard = IdempotencyGuard("notification-service")
 
 # ==================== TEMPLATE OPERATIONS ====================
 class TemplateCRUD:
@@ -115,16 +112,23 @@ class NotificationCRUD:
 class EventProcessor:
     @staticmethod
     def process_event(db: Session, event_data: dict):
-        """Process incoming event from RabbitMQ"""
+        """Process incoming event from RabbitMQ; duplicates return None"""
+        return idempotency_guard.handle(db, event_data, EventProcessor._process)
+    
+    @staticmethod
+    def prune_history(db: Session) -> int:
+        """Delete processed ids past the dedupe window and old event history"""
+        cutoff = datetime.utcnow() - timedelta(days=EVENT_HISTORY_RETENTION_DAYS)
+        deleted = db.query(EventHistory).filter(EventHistory.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return deleted + idempotency_guard.prune(db)
+    
+    @staticmethod
+    def _process(db: Session, event_data: dict):
         event_id = event_data.get("event_id")
         event_type = event_data.get("event_type")
         payload = event_data.get("payload", {})
         
-        # Check if event already processed
-        existing = db.query(EventHistory).filter(EventHistory.event_id == event_id).first()
-        if existing:
-            return None
-        
         # Save event to history
         event_history = EventHistory(
             event_id=event_id,
@@ -150,7 +154,8 @@ class EventProcessor:
             event_history.processed = True
             event_history.processed_at = datetime.utcnow()
         
-        db.commit()
+        # Коммит вместе с отметкой idempotency_guard
+        db.flush()
         return notification
     
     @staticmethod
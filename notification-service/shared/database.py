@@ -16,5 +16,7 @@ def get_db():
 
 def init_db():
     from models import Base
+    from idempotency import IdempotencyBase
     Base.metadata.create_all(bind=engine)
+    IdempotencyBase.metadata.create_all(bind=engine)
     print("Database tables created for notification-service")
\ No newline at end of file
@@ -439,7 +439,8 @@ async def get_stats(
         "today_count": today_count,
         "failed_count": failed_count,
         "total_templates": db.query(models.NotificationTemplate).count(),
-        "total_events": db.query(models.EventHistory).count()
+        "total_events": db.query(models.EventHistory).count(),
+        "idempotency": crud.idempotency_guard.stats()
     }
 
 # Startup event
@@ -511,24 +512,55 @@ AutoSalon""",
     
     # Subscribe to all events
     from crud import message_broker
+    from messaging import partition_key
     
     def handle_event(event):
         print(f"Processing event: {event['event_type']}")
         db = next(get_db())
         try:
+            # Ошибка уходит в брокер: повтор через очередь задержки, затем DLQ
             crud.EventProcessor.process_event(db, event)
-        except Exception as e:
-            print(f"Error processing event: {e}")
         finally:
             db.close()
     
+    # Именованная очередь: реплики делят события, упавшие можно переиграть (python -m dlq).
+    # События одного заказа/пользователя обрабатываются по порядку, разные - параллельно
     message_broker.subscribe_to_events(
         exchange="*",  # Listen to all exchanges
         routing_keys=["*.*"],  # All events
-        callback=handle_event
+        callback=handle_event,
+        queue="notification-service",
+        partition_by=partition_key("order_id", "user_id")
     )
     
+    asyncio.create_task(prune_event_history())
+    
     print("Service ready")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    from crud import message_broker
+    message_broker.close()
+
+EVENT_HISTORY_PRUNE_INTERVAL = float(os.getenv("EVENT_HISTORY_PRUNE_INTERVAL", "3600"))
+
+async def prune_event_history():
+    """Periodically drop processed ids past the dedupe window and old event history"""
+    def prune():
+        db = next(get_db())
+        try:
+            return crud.EventProcessor.prune_history(db)
+        finally:
+            db.close()
+    
+    while True:
+        try:
+            deleted = await asyncio.to_thread(prune)
+            if deleted:
+                print(f"Pruned {deleted} old event records")
+        except Exception as e:
+            print(f"Error pruning event history: {e}")
+        await asyncio.sleep(EVENT_HISTORY_PRUNE_INTERVAL)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session
 from models import Payment, PaymentLog, PaymentStatus, PaymentMethod
 from shared.models import PaymentEvent
-from shared.messaging import message_broker
+from shared import outbox
 from typing import List, Optional
+from datetime import datetime
 import uuid
 
 class PaymentCRUD:
@@ -20,17 +21,13 @@ class PaymentCRUD:
             description=description
         )
         db.add(payment)
-        db.commit()
-        db.refresh(payment)
-
-        # Log creation
-        PaymentCRUD._log_payment_action(db, payment.id, "created", None, PaymentStatus.PENDING)
+        db.flush()
 
-        # Publish event
+        # Stage the event in the same transaction
         event = PaymentEvent(
             event_id=f"payment_{payment.id}",
             event_type="payment.created",
-            timestamp=payment.created_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "payment_id": payment.id,
                 "order_id": order_id,
@@ -39,7 +36,12 @@ class PaymentCRUD:
                 "status": PaymentStatus.PENDING.value
             }
         )
-        message_broker.publish_event("autosalon", "payment.created", event.dict())
+        outbox.add_event(db, "autosalon", "payment.created", event.dict(), "payment", payment.id)
+        db.commit()
+        db.refresh(payment)
+
+        # Log creation
+        PaymentCRUD._log_payment_action(db, payment.id, "created", None, PaymentStatus.PENDING)
 
         return payment
 
@@ -69,18 +71,13 @@ class PaymentCRUD:
         new_status = PaymentStatus.COMPLETED if success else PaymentStatus.FAILED
 
         payment.status = new_status
-        db.commit()
-        db.refresh(payment)
-
-        # Log status change
-        PaymentCRUD._log_payment_action(db, payment.id, "processed", old_status, new_status)
 
-        # Publish event
+        # Stage the event in the same transaction
         event_type = "payment.succeeded" if success else "payment.failed"
         event = PaymentEvent(
             event_id=f"payment_{payment.id}_{event_type}",
             event_type=event_type,
-            timestamp=payment.updated_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "payment_id": payment.id,
                 "order_id": payment.order_id,
@@ -89,7 +86,12 @@ class PaymentCRUD:
                 "status": new_status.value
             }
         )
-        message_broker.publish_event("autosalon", event_type, event.dict())
+        outbox.add_event(db, "autosalon", event_type, event.dict(), "payment", payment.id)
+        db.commit()
+        db.refresh(payment)
+
+        # Log status change
+        PaymentCRUD._log_payment_action(db, payment.id, "processed", old_status, new_status)
 
         return payment
 
@@ -102,17 +104,12 @@ class PaymentCRUD:
 
         old_status = payment.status
         payment.status = PaymentStatus.CANCELLED
-        db.commit()
-        db.refresh(payment)
 
-        # Log status change
-        PaymentCRUD._log_payment_action(db, payment.id, "cancelled", old_status, PaymentStatus.CANCELLED)
-
-        # Publish event
+        # Stage the event in the same transaction
         event = PaymentEvent(
             event_id=f"payment_{payment.id}_cancelled",
             event_type="payment.cancelled",
-            timestamp=payment.updated_at,
+            timestamp=datetime.utcnow(),
             payload={
                 "payment_id": payment.id,
                 "order_id": payment.order_id,
@@ -121,7 +118,12 @@ class PaymentCRUD:
                 "status": PaymentStatus.CANCELLED.value
             }
         )
-        message_broker.publish_event("autosalon", "payment.cancelled", event.dict())
+        outbox.add_event(db, "autosalon", "payment.cancelled", event.dict(), "payment", payment.id)
+        db.commit()
+        db.refresh(payment)
+
+        # Log status change
+        PaymentCRUD._log_payment_action(db, payment.id, "cancelled", old_status, PaymentStatus.CANCELLED)
 
         return payment
 
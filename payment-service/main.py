@@ -1,11 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Header
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Header, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import asyncio
 import time
 
-from shared.database import get_db, Base, engine
+from shared.database import get_db, Base, engine, SessionLocal
 from shared.auth import AuthUtils
+from shared.outbox import OutboxBase, OutboxRelay
 from shared.models import TokenData
 from models import Payment, PaymentStatus, PaymentMethod
 from crud import PaymentCRUD
@@ -26,9 +27,23 @@ else:
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+OutboxBase.metadata.create_all(bind=engine)
+
+# Publishes events committed to the outbox table
+outbox_relay = OutboxRelay(SessionLocal)
 
 app = FastAPI(title="Payment Service", description="Payment processing service for Autosalon")
 
+@app.on_event("startup")
+async def startup_event():
+    """Start relaying committed outbox events to RabbitMQ"""
+    outbox_relay.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the outbox relay before exit"""
+    await outbox_relay.stop()
+
 @app.get("/")
 def read_root(db: Session = Depends(get_db)):
     """Get Payment Service status with payment statistics"""
@@ -41,12 +56,15 @@ def read_root(db: Session = Depends(get_db)):
         "statistics": stats
     }
 
-def get_current_user(authorization: Optional[str] = Header(default=None)) -> Optional[TokenData]:
-    """Get current user from Authorization header (Bearer token)."""
-    if not authorization or not authorization.startswith("Bearer "):
-        return None
-    token = authorization.split(" ", 1)[1]
-    payload = AuthUtils.verify_token(token)
+def get_current_user(request: Request, authorization: Optional[str] = Header(default=None)) -> Optional[TokenData]:
+    """Get current user from gateway identity headers or Authorization header (Bearer token)."""
+    # Fast path: the API gateway has already verified the token
+    payload = AuthUtils.verify_gateway_identity(request.headers)
+    if payload is None:
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+        token = authorization.split(" ", 1)[1]
+        payload = AuthUtils.verify_token(token)
     if payload:
         return TokenData(
             user_id=int(payload.get("sub")),
@@ -465,6 +465,7 @@ async def startup_event():
     
     # Subscribe to events for analytics
     from crud import message_broker
+    from shared.messaging import partition_key
     
     def handle_event(event):
         print(f"Analytics event received: {event['event_type']}")
@@ -480,18 +481,25 @@ async def startup_event():
                 }
             }
             crud.AnalyticsCRUD.track_event(db, event_data)
-        except Exception as e:
-            print(f"Error tracking event: {e}")
         finally:
             db.close()
     
+    # Именованная очередь: события копятся, пока сервис перезапускается.
+    # Партиции по заказу/пользователю сохраняют порядок событий одного агрегата
     message_broker.subscribe_to_events(
         exchange="*",
         routing_keys=["*.*"],
-        callback=handle_event
+        callback=handle_event,
+        queue="reporting-analytics-service",
+        partition_by=partition_key("order_id", "user_id")
     )
     
     print("Service ready")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    from crud import message_broker
+    message_broker.close()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
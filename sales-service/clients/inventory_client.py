@@ -2,45 +2,51 @@ import httpx
 import os
 from typing import Dict, Any
 
+from clients.service_client import service_clients
+
 INVENTORY_SERVICE_URL = os.getenv("INVENTORY_SERVICE_URL", "http://localhost:8007")
 
+# Общий пул соединений с inventory-service, открывается при старте сервиса
+inventory = service_clients.register("inventory-service", INVENTORY_SERVICE_URL)
+
 async def reserve_vehicle(vehicle_id: int, order_id: int, quantity: int = 1) -> Dict[str, Any]:
     """
     Резервирует автомобиль через inventory-service
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            payload = {
-                "vehicle_id": vehicle_id,
-                "order_id": order_id,
-                "quantity": quantity
-            }
-            response = await client.post(
-                f"{INVENTORY_SERVICE_URL}/inventory/reserve",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+        payload = {
+            "vehicle_id": vehicle_id,
+            "order_id": order_id,
+            "quantity": quantity
+        }
+        response = await inventory.post(
+            "/inventory/reserve",
+            json=payload,
+            operation="reserve_vehicle"
+        )
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPError as e:
         print(f"Error reserving vehicle: {e}")
         raise Exception(f"Failed to reserve vehicle {vehicle_id}: {e}")
 
 async def release_vehicle(vehicle_id: int, quantity: int = 1) -> Dict[str, Any]:
     """
-    Освобождает резервирование автомобиля
+    Освобождает резервирование автомобиля. Склад не знает, чей это резерв:
+    вызывать только для заказа, резерв которого точно состоялся
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            payload = {
-                "vehicle_id": vehicle_id,
-                "quantity": quantity
-            }
-            response = await client.post(
-                f"{INVENTORY_SERVICE_URL}/inventory/release",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+        payload = {
+            "vehicle_id": vehicle_id,
+            "quantity": quantity
+        }
+        response = await inventory.post(
+            "/inventory/release",
+            json=payload,
+            operation="release_vehicle"
+        )
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPError as e:
         print(f"Error releasing vehicle: {e}")
         return {"status": "error", "message": str(e)}
@@ -50,18 +56,18 @@ async def mark_as_sold(vehicle_id: int, order_id: int, quantity: int = 1) -> Dic
     Отмечает автомобиль как проданный
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            payload = {
-                "vehicle_id": vehicle_id,
-                "order_id": order_id,
-                "quantity": quantity
-            }
-            response = await client.post(
-                f"{INVENTORY_SERVICE_URL}/inventory/sold",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+        payload = {
+            "vehicle_id": vehicle_id,
+            "order_id": order_id,
+            "quantity": quantity
+        }
+        response = await inventory.post(
+            "/inventory/sold",
+            json=payload,
+            operation="mark_as_sold"
+        )
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPError as e:
         print(f"Error marking vehicle as sold: {e}")
         raise Exception(f"Failed to mark vehicle {vehicle_id} as sold: {e}")
@@ -71,10 +77,9 @@ async def check_availability(vehicle_id: int) -> Dict[str, Any]:
     Проверяет наличие автомобиля
     """
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{INVENTORY_SERVICE_URL}/inventory/{vehicle_id}")
-            response.raise_for_status()
-            return response.json()
+        response = await inventory.get(f"/inventory/{vehicle_id}", operation="check_availability")
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPError as e:
         print(f"Error checking availability: {e}")
-        return {"available": False, "message": "Inventory service unavailable"}
\ No newline at end of file
+        return {"available": False, "message": "Inventory service unavailable"}
@@ -0,0 +1,250 @@
+import asyncio
+import bisect
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+# Defaults for every client, overridable per service with
+# CLIENT_<NAME>_TIMEOUT, CLIENT_<NAME>_RETRIES, etc. (e.g. CLIENT_INVENTORY_SERVICE_TIMEOUT)
+CLIENT_TIMEOUT = float(os.getenv("CLIENT_TIMEOUT", "10"))
+CLIENT_CONNECT_TIMEOUT = float(os.getenv("CLIENT_CONNECT_TIMEOUT", "2"))
+CLIENT_MAX_CONNECTIONS = int(os.getenv("CLIENT_MAX_CONNECTIONS", "50"))
+CLIENT_MAX_KEEPALIVE = int(os.getenv("CLIENT_MAX_KEEPALIVE", "20"))
+CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("CLIENT_KEEPALIVE_EXPIRY", "30"))
+# Retries of safe requests: full jitter, random(0, min(max, base * 2^attempt)) seconds
+CLIENT_RETRIES = int(os.getenv("CLIENT_RETRIES", "3"))
+CLIENT_BACKOFF_BASE = float(os.getenv("CLIENT_BACKOFF_BASE", "0.1"))
+CLIENT_BACKOFF_MAX = float(os.getenv("CLIENT_BACKOFF_MAX", "2"))
+
+# Methods that may be repeated; POST and PATCH are sent once
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Responses worth another attempt: throttled or the upstream (or a proxy) is down
+RETRY_STATUSES = {429, 502, 503, 504}
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _env_name(name: str, key: str) -> str:
+    return f"CLIENT_{name.upper().replace('-', '_')}_{key}"
+
+
+class LatencyHistogram:
+    """Call latencies in fixed millisecond buckets; quantiles are bucket upper bounds"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(min(bound, round(self.max_ms, 1)))
+        return round(self.max_ms, 1)
+
+    def to_dict(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds + ["inf"], self.counts):
+            cumulative += count
+            buckets[f"le_{bound}"] = cumulative
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": buckets,
+        }
+
+
+class ServiceClient:
+    """Long-lived keep-alive connection pool to one service, with retries.
+
+    GETs (and other idempotent methods) are retried on connection errors,
+    timeouts and 429/502/503/504 responses with jittered exponential backoff.
+    POSTs are never retried: a repeat could reserve a vehicle or use up a
+    discount twice. Each operation keeps a latency histogram of whole calls,
+    retries included.
+    """
+
+    def __init__(self, name: str, base_url: str, timeout: float = CLIENT_TIMEOUT,
+                 connect_timeout: float = CLIENT_CONNECT_TIMEOUT,
+                 max_connections: int = CLIENT_MAX_CONNECTIONS,
+                 max_keepalive: int = CLIENT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = CLIENT_KEEPALIVE_EXPIRY,
+                 retries: int = CLIENT_RETRIES, backoff_base: float = CLIENT_BACKOFF_BASE,
+                 backoff_max: float = CLIENT_BACKOFF_MAX,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = min(max_keepalive, max_connections)
+        self.keepalive_expiry = keepalive_expiry
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.transport = transport
+        self.client: Optional[httpx.AsyncClient] = None
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+        self.calls = 0
+        self.attempts = 0
+        self.retried = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @classmethod
+    def from_env(cls, name: str, base_url: str) -> "ServiceClient":
+        """Client with the CLIENT_<NAME>_* overrides from the environment"""
+        def setting(key, default, cast):
+            value = os.getenv(_env_name(name, key))
+            return cast(value) if value is not None else default
+
+        return cls(
+            name, base_url,
+            timeout=setting("TIMEOUT", CLIENT_TIMEOUT, float),
+            connect_timeout=setting("CONNECT_TIMEOUT", CLIENT_CONNECT_TIMEOUT, float),
+            max_connections=setting("MAX_CONNECTIONS", CLIENT_MAX_CONNECTIONS, int),
+            max_keepalive=setting("MAX_KEEPALIVE", CLIENT_MAX_KEEPALIVE, int),
+            retries=setting("RETRIES", CLIENT_RETRIES, int),
+        )
+
+    def start(self):
+        """Create the pooled client; called on startup, or lazily by the first request"""
+        if self.client is not None:
+            return
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            transport=self.transport,
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response: httpx.Response, attempt: int) -> float:
+        """Backoff, or the service's Retry-After when it asks for a longer pause (capped)"""
+        delay = self.backoff(attempt)
+        try:
+            return max(delay, min(self.backoff_max, float(response.headers.get("Retry-After", 0))))
+        except ValueError:
+            return delay
+
+    async def request(self, method: str, path: str, operation: Optional[str] = None,
+                      **kwargs) -> httpx.Response:
+        """Send a request over the pool, retrying it when that is safe.
+
+        The final response is returned whatever its status; the caller decides
+        (raise_for_status). Connection errors and timeouts of the last attempt
+        are raised.
+        """
+        if self.client is None:
+            self.start()
+        method = method.upper()
+        attempts = 1 + self.retries if method in IDEMPOTENT_METHODS else 1
+        histogram = self.histograms.setdefault(operation or f"{method} {path}", LatencyHistogram())
+
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                self.attempts += 1
+                last = attempt == attempts - 1
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                except httpx.TransportError:
+                    if last:
+                        self.failed += 1
+                        raise
+                    delay = self.backoff(attempt)
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        if response.is_error:
+                            self.failed += 1
+                        return response
+                    await response.aclose()
+                    delay = self._retry_after(response, attempt)
+                self.retried += 1
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+            histogram.observe((time.perf_counter() - started) * 1000)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.base_url,
+            "started": self.client is not None,
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "failed": self.failed,
+            "latency": {operation: histogram.to_dict() for operation, histogram in self.histograms.items()},
+        }
+
+
+class ServiceClients:
+    """Clients of the service, opened on startup and closed on shutdown"""
+
+    def __init__(self):
+        self.clients: List[ServiceClient] = []
+
+    def register(self, name: str, base_url: str) -> ServiceClient:
+        client = ServiceClient.from_env(name, base_url)
+        self.clients.append(client)
+        return client
+
+    def start(self):
+        for client in self.clients:
+            client.start()
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+
+    def stats(self) -> dict:
+        return {client.name: client.stats() for client in self.clients}
+
+
+# Global registry of the sales-service clients
+service_clients = ServiceClients()
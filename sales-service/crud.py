@@ -1,8 +1,10 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from datetime import datetime
 import models
 import schemas
-from typing import List, Optional
+import messaging
+import transitions
+from typing import Any, Dict, List, Optional
 
 def get_order(db: Session, order_id: int):
     return db.query(models.Order).filter(models.Order.id == order_id).first()
@@ -12,11 +14,23 @@ def get_customer_orders(db: Session, customer_id: int, skip: int = 0, limit: int
         models.Order.customer_id == customer_id
     ).offset(skip).limit(limit).all()
 
-def create_order(db: Session, order: schemas.OrderCreate):
-    db_order = models.Order(**order.model_dump())
+def create_order(db: Session, order: schemas.OrderCreate, base_price: float, final_price: float,
+                 vin: str, applied_discounts: Optional[str] = None, currency: str = "USD",
+                 event_type: Optional[str] = None):
+    """
+    Заказ с ценой и VIN одной вставкой; история и событие - в той же транзакции
+    """
+    db_order = models.Order(
+        **order.model_dump(),
+        vin=vin,
+        base_price=base_price,
+        final_price=final_price,
+        applied_discounts=applied_discounts,
+        currency=currency
+    )
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    # Id заказа нужен истории и событию; коммит один, в конце
+    db.flush()
     
     # Создаем запись в истории
     add_order_history(
@@ -25,103 +39,71 @@ def create_order(db: Session, order: schemas.OrderCreate):
         status=db_order.status,
         payment_status=db_order.payment_status,
         changed_by="system",
-        notes="Order created"
+        notes="Order created",
+        commit=False
     )
-    
-    return db_order
-
-def update_order(db: Session, order_id: int, order: schemas.OrderUpdate):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
-        return None
-    
-    update_data = order.model_dump(exclude_unset=True)
-    
-    # Логируем изменения статуса
-    if 'status' in update_data and update_data['status'] != db_order.status:
-        add_order_history(
-            db,
-            order_id=order_id,
-            status=update_data['status'],
-            changed_by="system",
-            notes=f"Status changed from {db_order.status} to {update_data['status']}"
-        )
-    
-    # Логируем изменения статуса оплаты
-    if 'payment_status' in update_data and update_data['payment_status'] != db_order.payment_status:
-        add_order_history(
-            db,
-            order_id=order_id,
-            status=db_order.status,
-            payment_status=update_data['payment_status'],
-            changed_by="system",
-            notes=f"Payment status changed from {db_order.payment_status} to {update_data['payment_status']}"
-        )
-    
-    # Обновляем временные метки при подтверждении/отмене
-    if update_data.get('status') == models.OrderStatus.CONFIRMED:
-        db_order.confirmed_at = datetime.utcnow()
-    elif update_data.get('status') == models.OrderStatus.CANCELLED:
-        db_order.cancelled_at = datetime.utcnow()
-    
-    for field, value in update_data.items():
-        setattr(db_order, field, value)
-    
-    db_order.updated_at = datetime.utcnow()
+    if event_type:
+        messaging.stage_order_event(db, db_order, event_type)
     db.commit()
     db.refresh(db_order)
     return db_order
 
-def update_order_status(db: Session, order_id: int, status: schemas.OrderStatus):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
-        return None
-    
-    # Логируем изменение статуса
-    add_order_history(
-        db,
-        order_id=order_id,
-        status=status,
-        changed_by="system",
-        notes=f"Status changed from {db_order.status} to {status}"
-    )
-    
-    # Обновляем временные метки
-    if status == models.OrderStatus.CONFIRMED:
-        db_order.confirmed_at = datetime.utcnow()
-    elif status == models.OrderStatus.CANCELLED:
-        db_order.cancelled_at = datetime.utcnow()
-    
-    db_order.status = status
-    db_order.updated_at = datetime.utcnow()
+def create_orders(db: Session, rows: List[Dict[str, Any]], event_type: Optional[str] = None):
+    """
+    Пакет заказов (словари полей Order, уже с ценой и VIN): один многострочный
+    INSERT ... RETURNING, история одной вставкой, события в outbox, один коммит.
+    Заказы возвращаются в порядке rows
+    """
+    if not rows:
+        return []
+    orders = list(db.scalars(
+        insert(models.Order).returning(models.Order, sort_by_parameter_order=True), rows
+    ))
+    db.execute(insert(models.OrderHistory), [
+        {"order_id": order.id, "status": order.status, "payment_status": order.payment_status,
+         "changed_by": "system", "notes": "Order created"}
+        for order in orders
+    ])
+    if event_type:
+        for order in orders:
+            messaging.stage_order_event(db, order, event_type)
+    db.flush()
+    # Все поля уже пришли из RETURNING, после коммита заказы не перечитываются
+    for order in orders:
+        db.expunge(order)
     db.commit()
-    db.refresh(db_order)
-    return db_order
+    return orders
 
-def update_payment_status(db: Session, order_id: int, payment_status: schemas.PaymentStatus):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
-        return None
-    
-    # Логируем изменение статуса оплаты
-    add_order_history(
-        db,
-        order_id=order_id,
-        status=db_order.status,
-        payment_status=payment_status,
-        changed_by="system",
-        notes=f"Payment status changed from {db_order.payment_status} to {payment_status}"
+def update_order(db: Session, order_id: int, order: schemas.OrderUpdate, event_type: Optional[str] = None):
+    """
+    Изменения заказа одной транзакцией; смена статусов проходит проверку переходов
+    """
+    update_data = order.model_dump(exclude_unset=True)
+    return transitions.transition(
+        db, order_id,
+        status=update_data.pop('status', None),
+        payment_status=update_data.pop('payment_status', None),
+        event_type=event_type,
+        values=update_data
     )
-    
-    db_order.payment_status = payment_status
-    db_order.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+
+def update_order_status(db: Session, order_id: int, status: schemas.OrderStatus,
+                        event_type: Optional[str] = None):
+    return transitions.transition(db, order_id, status=status, event_type=event_type)
+
+def update_payment_status(db: Session, order_id: int, payment_status: schemas.PaymentStatus):
+    return transitions.transition(db, order_id, payment_status=payment_status)
+
+def update_orders_status(db: Session, order_ids: List[int], status: schemas.OrderStatus,
+                         event_type: Optional[str] = None):
+    """
+    Массовая смена статуса одним UPDATE; возвращает (изменённые заказы, id отклонённых)
+    """
+    return transitions.transition_many(db, order_ids, status=status, event_type=event_type)
 
 def add_order_history(db: Session, order_id: int, status: schemas.OrderStatus, 
                      changed_by: str = "system", notes: str = None,
-                     payment_status: Optional[schemas.PaymentStatus] = None):
+                     payment_status: Optional[schemas.PaymentStatus] = None, commit: bool = True):
     history = models.OrderHistory(
         order_id=order_id,
         status=status,
@@ -130,7 +112,8 @@ def add_order_history(db: Session, order_id: int, status: schemas.OrderStatus,
         notes=notes
     )
     db.add(history)
-    db.commit()
+    if commit:
+        db.commit()
     return history
 
 def get_order_history(db: Session, order_id: int):
@@ -1,8 +1,89 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+import json
 import uvicorn
 
+import crud
+import models
+import saga
+import schemas
+import services
+import transitions
+from clients.service_client import service_clients
+from database import SessionLocal, get_db, init_db
+from shared.messaging import message_broker
+from shared.outbox import OutboxRelay
+
+NDJSON = "application/x-ndjson"
+
+# Publishes events committed to the outbox table
+outbox_relay = OutboxRelay(SessionLocal)
+# Runs the reserve -> pay -> sell sagas of confirmed orders in the background
+saga_orchestrator = saga.SagaOrchestrator(SessionLocal)
+
 app = FastAPI(title="sales-service")
 
+@app.on_event("startup")
+async def startup_event():
+    """Open the connection pools to inventory-service and pricing-service"""
+    init_db()
+    # Importing the client modules registers their pools
+    from clients import inventory_client, pricing_client  # noqa: F401
+    service_clients.start()
+    outbox_relay.start()
+    saga_orchestrator.start()
+    # Итог оплаты от payment-service двигает саги, ждущие оплату
+    message_broker.subscribe_to_events(
+        exchange="autosalon",
+        routing_keys=list(saga.PAYMENT_RESULTS),
+        callback=saga_orchestrator.on_payment_event,
+        queue="sales-service.sagas"
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    message_broker.close()
+    await saga_orchestrator.stop()
+    await outbox_relay.stop()
+    await service_clients.close()
+
+def ndjson_stream(results):
+    """
+    Результаты массовой операции построчно (NDJSON), по мере готовности.
+    Сессия своя: поток читается уже после выхода из обработчика
+    """
+    async def stream():
+        db = SessionLocal()
+        try:
+            async for result in results(db):
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        finally:
+            db.close()
+    return StreamingResponse(stream(), media_type=NDJSON)
+
+async def read_bulk_orders(request: Request):
+    """Заказы из JSON {"orders": [...]} или из NDJSON, по заказу в строке"""
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(NDJSON):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        return schemas.BulkOrderCreate.model_validate_json(body).orders
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid bulk order body: {e}")
+
+def saga_accepted(order_saga: models.OrderSaga) -> JSONResponse:
+    """202: сага идёт в фоне, её состояние - по ссылке из Location"""
+    return JSONResponse(status_code=202,
+                        content=schemas.OrderSaga.model_validate(order_saga).model_dump(mode="json"),
+                        headers={"Location": f"/sagas/{order_saga.id}"})
+
+def check_bulk_size(count: int):
+    if count > services.BULK_MAX_ORDERS:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {services.BULK_MAX_ORDERS} orders per request, got {count}")
+
 @app.get("/")
 def read_root():
     return {"message": "sales-service is running"}
@@ -11,6 +92,82 @@ def read_root():
 def health_check():
     return {"status": "healthy", "service": "sales-service"}
 
+@app.get("/stats/clients")
+def client_stats():
+    """Pool usage, retries and per-call latency histograms of the upstream clients"""
+    return {"clients": service_clients.stats()}
+
+@app.get("/stats/sagas")
+def saga_stats():
+    """Sagas by status and orchestrator counters"""
+    return saga_orchestrator.stats()
+
+@app.get("/orders/{order_id}", response_model=schemas.Order)
+def read_order(order_id: int, db: Session = Depends(get_db)):
+    order = crud.get_order(db, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+@app.post("/orders/{order_id}/confirm", status_code=202, response_model=schemas.OrderSaga)
+def confirm_order(order_id: int, db: Session = Depends(get_db)):
+    """
+    Подтверждение заказа: резерв, оплата и продажа идут сагой в фоне.
+    Ответ 202 сразу, ход саги - GET /sagas/{id}
+    """
+    try:
+        order_saga = saga_orchestrator.start_saga(db, order_id)
+    except saga.SagaConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if order_saga is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return saga_accepted(order_saga)
+
+@app.post("/orders/{order_id}/cancel")
+def cancel_order(order_id: int, db: Session = Depends(get_db)):
+    """
+    Отмена заказа. Заказ без резерва отменяется сразу (200); иначе резерв
+    освобождает сага (202), как и выполненные шаги идущей саги
+    """
+    try:
+        result = saga_orchestrator.cancel(db, order_id)
+    except transitions.InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if isinstance(result, models.OrderSaga):
+        return saga_accepted(result)
+    return schemas.Order.model_validate(result)
+
+@app.get("/sagas/{saga_id}", response_model=schemas.OrderSaga)
+def get_saga(saga_id: int, db: Session = Depends(get_db)):
+    order_saga = db.get(models.OrderSaga, saga_id)
+    if order_saga is None:
+        raise HTTPException(status_code=404, detail="Saga not found")
+    return order_saga
+
+@app.post("/orders/bulk")
+async def create_orders_bulk(request: Request):
+    """
+    Массовое создание заказов. Ответ - NDJSON: строка на заказ
+    ({"index", "status": "created" | "failed", "order" | "error"}) и итоговая
+    строка {"summary": ...}
+    """
+    orders = await read_bulk_orders(request)
+    check_bulk_size(len(orders))
+    return ndjson_stream(lambda db: services.create_orders(db, orders))
+
+@app.post("/orders/bulk/status")
+async def update_orders_status_bulk(update: schemas.BulkOrderStatusUpdate):
+    """
+    Массовая смена статуса. Ответ - NDJSON: строка на заказ ({"order_id",
+    "status": "accepted" | "updated" | "rejected"}; accepted - сага
+    подтверждения, завершения или отмены идёт в фоне) и итоговая строка
+    """
+    check_bulk_size(len(update.order_ids))
+    return ndjson_stream(lambda db: services.change_orders_status(db, update.order_ids, update.status,
+                                                                  saga_orchestrator))
+
 #  
 @app.get("/test")
 def test():
@@ -23,6 +23,14 @@ class PaymentStatus(str, enum.Enum):
     REFUNDED = "refunded"
     PARTIALLY_REFUNDED = "partially_refunded"
 
+class SagaStatus(str, enum.Enum):
+    RUNNING = "running"            # шаг ждёт исполнителя
+    WAITING = "waiting"            # ждёт события (оплаты) или срока
+    COMPENSATING = "compensating"  # откатываются выполненные шаги
+    COMPLETED = "completed"
+    COMPENSATED = "compensated"
+    FAILED = "failed"              # компенсация не удалась, нужен человек
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -59,4 +67,34 @@ class OrderHistory(Base):
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    order = relationship("Order")
\ No newline at end of file
+    order = relationship("Order")
+
+class OrderSaga(Base):
+    """Состояние саги заказа: текущий шаг и его попытки, сохраняются после каждого шага"""
+    __tablename__ = "order_sagas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    # Шаг, который выполняется; при компенсации - шаг, который откатывается
+    step = Column(String(30), nullable=False)
+    status = Column(Enum(SagaStatus), nullable=False, default=SagaStatus.RUNNING, index=True)
+    # Итог оплаты из событий payment-service: "succeeded" / "failed"
+    payment_result = Column(String(20), nullable=True)
+    payment_id = Column(Integer, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    # Вызов другого сервиса в текущем шаге (при компенсации - в его откате) прошёл успешно
+    remote_done = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Когда исполнитель возьмёт сагу: время повтора, срок ожидания или аренда исполнителя
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    deadline_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    # Оптимистичная блокировка: два исполнителя не сохранят один шаг дважды
+    version = Column(Integer, nullable=False)
+
+    __mapper_args__ = {"version_id_col": version}
+
+    order = relationship("Order")
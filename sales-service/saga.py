@@ -0,0 +1,585 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+import crud
+import messaging
+import models
+import schemas
+import transitions
+from clients import inventory_client
+
+SAGA_POLL_INTERVAL = float(os.getenv("SAGA_POLL_INTERVAL", "1"))
+SAGA_BATCH_SIZE = int(os.getenv("SAGA_BATCH_SIZE", "20"))
+# Исполнитель берёт сагу в аренду: если он упал, сагу продолжит другой через это время
+SAGA_LEASE = float(os.getenv("SAGA_LEASE", "60"))
+SAGA_MAX_ATTEMPTS = int(os.getenv("SAGA_MAX_ATTEMPTS", "5"))
+SAGA_RETRY_DELAY = float(os.getenv("SAGA_RETRY_DELAY", "1"))
+SAGA_RETRY_DELAY_MAX = float(os.getenv("SAGA_RETRY_DELAY_MAX", "300"))
+# Сколько ждать оплату подтверждённого заказа, секунды
+SAGA_PAYMENT_TIMEOUT = float(os.getenv("SAGA_PAYMENT_TIMEOUT", "86400"))
+
+OrderSaga = models.OrderSaga
+SagaStatus = models.SagaStatus
+ACTIVE = (SagaStatus.RUNNING, SagaStatus.WAITING, SagaStatus.COMPENSATING)
+
+# События payment-service (exchange autosalon) -> итог оплаты в саге
+PAYMENT_RESULTS = {
+    "payment.succeeded": "succeeded",
+    "payment.failed": "failed",
+    "payment.cancelled": "failed",
+}
+
+# Статусы, в которых за заказом числится резерв автомобиля
+RESERVED_STATUSES = (models.OrderStatus.CONFIRMED, models.OrderStatus.PROCESSING, models.OrderStatus.SHIPPED)
+
+
+class SagaAborted(Exception):
+    """Шаг выполнить нельзя: без повторов, сразу к компенсации"""
+
+
+class SagaConflict(Exception):
+    """У заказа уже идёт сага, или из его статуса сагу не начать"""
+
+
+class StepAlreadyDone(Exception):
+    """Изменение заказа уже сделано прошлой попыткой шага"""
+
+
+class SagaStep:
+    """
+    Шаг саги. remote - вызов другого сервиса; его успех отмечается в саге
+    (remote_done) до local, и повтор шага вызов уже не повторяет. local -
+    изменение заказа, которое коммитится вместе с отметкой о выполнении шага.
+    ready - у шагов, которые ждут события: False, пока его нет (но не дольше
+    timeout секунд). compensation и compensation_local - откат шага, такие же
+    две части; откатываются только шаги, чьё выполнение отмечено в саге
+    """
+
+    def __init__(self, name: str, remote=None, local=None, ready=None, timeout: Optional[float] = None,
+                 compensation=None, compensation_local=None):
+        self.name = name
+        self.remote = remote
+        self.local = local
+        self.ready = ready
+        self.timeout = timeout
+        self.compensation = compensation
+        self.compensation_local = compensation_local
+
+    @property
+    def compensates(self) -> bool:
+        return self.compensation is not None or self.compensation_local is not None
+
+    def settled(self, saga) -> bool:
+        """Вызов шага без компенсации уже прошёл: отменять поздно, шаг доводится до конца"""
+        return saga.remote_done and not self.compensates
+
+
+def _move(db: Session, order: models.Order, status=None, payment_status=None, event_type: Optional[str] = None):
+    """Переход заказа от имени саги; повтор после сбоя находит заказ уже в нужном статусе"""
+    try:
+        moved = transitions.transition(db, order.id, status=status, payment_status=payment_status,
+                                       changed_by="saga", event_type=event_type)
+    except transitions.InvalidTransition as e:
+        if (status is None or e.current[0] == e.status) and \
+                (payment_status is None or e.current[1] == e.payment_status):
+            raise StepAlreadyDone()
+        raise SagaAborted(str(e))
+    if moved is None:
+        raise SagaAborted(f"Order {order.id} not found")
+
+
+async def _reserve(saga: OrderSaga, order: models.Order):
+    await inventory_client.reserve_vehicle(vehicle_id=order.vehicle_id, order_id=order.id)
+
+def _confirm(db: Session, saga: OrderSaga, order: models.Order):
+    _move(db, order, status=schemas.OrderStatus.CONFIRMED, event_type="OrderConfirmed")
+
+async def _release(saga: OrderSaga, order: models.Order):
+    result = await inventory_client.release_vehicle(vehicle_id=order.vehicle_id)
+    if result.get("status") == "error":
+        raise Exception(f"Failed to release vehicle {order.vehicle_id}: {result.get('message')}")
+
+def _cancel(db: Session, saga: OrderSaga, order: models.Order):
+    _move(db, order, status=schemas.OrderStatus.CANCELLED, event_type="OrderCancelled")
+
+def _payment_known(saga: OrderSaga) -> bool:
+    return saga.payment_result is not None
+
+def _pay(db: Session, saga: OrderSaga, order: models.Order):
+    if saga.payment_result != "succeeded":
+        raise SagaAborted(f"Payment {saga.payment_result}" +
+                          (f" (payment {saga.payment_id})" if saga.payment_id else ""))
+    _move(db, order, payment_status=schemas.PaymentStatus.PAID, event_type="OrderPaid")
+
+def _request_refund(db: Session, saga: OrderSaga, order: models.Order):
+    """Деньги возвращает payment-service по событию OrderRefundRequested"""
+    if saga.payment_result == "succeeded":
+        messaging.stage_order_event(db, order, "OrderRefundRequested")
+    db.commit()
+
+async def _sell(saga: OrderSaga, order: models.Order):
+    await inventory_client.mark_as_sold(vehicle_id=order.vehicle_id, order_id=order.id)
+
+def _complete(db: Session, saga: OrderSaga, order: models.Order):
+    _move(db, order, status=schemas.OrderStatus.DELIVERED, event_type="OrderCompleted")
+
+
+# Заказ -> резерв -> оплата -> продажа; компенсации идут в обратном порядке
+STEPS = [
+    SagaStep("reserve", remote=_reserve, local=_confirm, compensation=_release, compensation_local=_cancel),
+    SagaStep("payment", ready=_payment_known, local=_pay, timeout=SAGA_PAYMENT_TIMEOUT,
+             compensation_local=_request_refund),
+    SagaStep("sell", remote=_sell, local=_complete),
+]
+STEP_NAMES = [step.name for step in STEPS]
+
+
+class SagaOrchestrator:
+    """Persistent process manager for the order -> reserve -> pay -> sell flow.
+
+    A saga is a row in order_sagas: the API inserts it and returns at once,
+    a background task on the event loop runs its steps. After each step the
+    order change and the saga checkpoint are committed together, so a
+    restarted service resumes from the last finished step. A successful call
+    to another service is checkpointed (remote_done) before the order
+    change, so retrying the step does not call again. A call that failed
+    without an answer is simply repeated: inventory-service cannot tell a
+    repeat from a new request, so a timeout that did reserve, or a crash
+    between the call and its checkpoint, can reserve twice.
+    The payment step waits for payment.* events from payment-service.
+    Failed steps are retried with backoff; a step that cannot succeed
+    (payment failed, timeout, cancel request, retries exhausted) starts the
+    compensations of the steps recorded as done, newest first, and the
+    order is cancelled. A saga whose compensation keeps failing ends as
+    "failed" for a person to look at.
+    """
+
+    def __init__(self, session_factory: Callable[..., Session], poll_interval: float = SAGA_POLL_INTERVAL,
+                 batch_size: int = SAGA_BATCH_SIZE, lease: float = SAGA_LEASE,
+                 max_attempts: int = SAGA_MAX_ATTEMPTS, retry_delay: float = SAGA_RETRY_DELAY,
+                 retry_delay_max: float = SAGA_RETRY_DELAY_MAX):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_delay_max = retry_delay_max
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+        self.steps = 0
+        self.retries = 0
+        self.compensations = 0
+        self.failed = 0
+        self.conflicts = 0
+
+    # API: начать сагу и отменить заказ
+
+    def start_saga(self, db: Session, order_id: int) -> Optional[OrderSaga]:
+        """Сага подтверждения заказа; None - заказа нет. Шаги выполнит фоновая задача"""
+        return self._start(db, order_id, STEP_NAMES[0], models.OrderStatus.CONFIRMED, "confirmed")
+
+    def complete(self, db: Session, order_id: int) -> Optional[OrderSaga]:
+        """
+        Завершение заказа, подтверждённого без саги: продажа на складе и
+        DELIVERED - шагом sell, как в конце обычной саги. None - заказа нет
+        """
+        return self._start(db, order_id, "sell", models.OrderStatus.DELIVERED, "completed")
+
+    def _start(self, db: Session, order_id: int, step: str, target: models.OrderStatus,
+               action: str) -> Optional[OrderSaga]:
+        order = crud.get_order(db, order_id)
+        if order is None:
+            return None
+        active = self.active_saga(db, order_id)
+        if active is not None:
+            raise SagaConflict(f"Order {order_id} already has saga {active.id} in progress")
+        if order.status not in transitions.sources(transitions.ORDER_TRANSITIONS, target):
+            raise SagaConflict(f"Order {order_id} in status {order.status.value} cannot be {action}")
+        saga = OrderSaga(order_id=order_id, step=step, status=SagaStatus.RUNNING)
+        db.add(saga)
+        db.commit()
+        db.refresh(saga)
+        self.wake()
+        return saga
+
+    def cancel(self, db: Session, order_id: int):
+        """
+        Отмена заказа. Активная сага получает запрос на отмену и сама откатывает
+        сделанные шаги; у подтверждённого заказа без саги резерв освобождает
+        компенсирующая сага. Возвращает сагу - отмена идёт в фоне - или
+        отменённый заказ; None - заказа нет. InvalidTransition - отменять поздно,
+        в том числе когда сага уже продала автомобиль
+        """
+        saga = self.active_saga(db, order_id)
+        if saga is not None:
+            if saga.status != SagaStatus.COMPENSATING and STEPS[STEP_NAMES.index(saga.step)].settled(saga):
+                order = crud.get_order(db, order_id)
+                raise transitions.InvalidTransition(order_id, (order.status, order.payment_status),
+                                                    status=models.OrderStatus.CANCELLED)
+            db.execute(
+                update(OrderSaga)
+                .where(OrderSaga.id == saga.id, OrderSaga.status.in_(ACTIVE))
+                .values(cancel_requested=True, version=OrderSaga.version + 1,
+                        next_attempt_at=case((OrderSaga.status == SagaStatus.WAITING, datetime.utcnow()),
+                                             else_=OrderSaga.next_attempt_at))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            db.refresh(saga)
+            self.wake()
+            return saga
+        order = crud.get_order(db, order_id)
+        if order is None:
+            return None
+        if order.status in RESERVED_STATUSES:
+            saga = OrderSaga(order_id=order_id, step=STEP_NAMES[0], status=SagaStatus.COMPENSATING,
+                             cancel_requested=True, last_error="Cancelled by request")
+            db.add(saga)
+            db.commit()
+            db.refresh(saga)
+            self.wake()
+            return saga
+        # Резерва нет - достаточно сменить статус
+        return crud.update_order_status(db, order_id, schemas.OrderStatus.CANCELLED, event_type="OrderCancelled")
+
+    def active_saga(self, db: Session, order_id: int) -> Optional[OrderSaga]:
+        return db.query(OrderSaga).filter(OrderSaga.order_id == order_id, OrderSaga.status.in_(ACTIVE)).first()
+
+    def on_payment_event(self, event):
+        """Итог оплаты из payment.*: запоминается в саге заказа и будит ждущую сагу"""
+        result = PAYMENT_RESULTS.get(event["event_type"])
+        data = event.get("payload") or {}
+        # PaymentEvent целиком лежит в конверте: поля платежа - во вложенном payload
+        data = data.get("payload", data)
+        if result is None or data.get("order_id") is None:
+            return
+        db = self.session_factory()
+        try:
+            updated = db.execute(
+                update(OrderSaga)
+                .where(OrderSaga.order_id == int(data["order_id"]), OrderSaga.status.in_(ACTIVE),
+                       OrderSaga.payment_result.is_(None))
+                .values(payment_result=result, payment_id=data.get("payment_id"), version=OrderSaga.version + 1,
+                        next_attempt_at=case((OrderSaga.status == SagaStatus.WAITING, datetime.utcnow()),
+                                             else_=OrderSaga.next_attempt_at))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if updated:
+            self.wake()
+
+    # Исполнитель
+
+    def claim(self) -> List[int]:
+        """Саги, которым пора сделать шаг; аренда не даёт другим исполнителям взять их же"""
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            due = (select(OrderSaga.id)
+                   .where(OrderSaga.status.in_(ACTIVE), OrderSaga.next_attempt_at <= now)
+                   .order_by(OrderSaga.next_attempt_at)
+                   .limit(self.batch_size))
+            ids = list(db.execute(
+                update(OrderSaga)
+                .where(OrderSaga.id.in_(due), OrderSaga.next_attempt_at <= now)
+                .values(next_attempt_at=now + timedelta(seconds=self.lease))
+                .returning(OrderSaga.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            db.commit()
+            return ids
+        finally:
+            db.close()
+
+    async def run_once(self) -> int:
+        """Один проход: взять готовые саги и провести каждую, пока она может идти дальше"""
+        ids = await asyncio.to_thread(self.claim)
+        await asyncio.gather(*(self.run_saga(saga_id) for saga_id in ids))
+        return len(ids)
+
+    async def run_saga(self, saga_id: int):
+        """
+        Сессия синхронная: работа с базой идёт в потоке, на цикле событий -
+        только вызовы других сервисов. Атрибуты после коммита не сбрасываются,
+        чтобы цикл событий не читал их из базы; шаг начинается с перечитывания
+        """
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            saga = await asyncio.to_thread(db.get, OrderSaga, saga_id)
+            while saga is not None and saga.status in ACTIVE:
+                lease = saga.next_attempt_at
+                try:
+                    if not await self.advance(db, saga):
+                        break
+                except StaleDataError:
+                    saga = await asyncio.to_thread(self._reload, db, saga_id)
+                    if saga is None or saga.next_attempt_at != lease:
+                        # Шаг уже сохранил другой исполнитель (истекла аренда)
+                        self.conflicts += 1
+                        break
+                    # Аренда наша, сагу изменило событие оплаты или отмена: шаг повторяется с ними
+        except Exception as e:
+            await asyncio.to_thread(db.rollback)
+            print(f"Saga {saga_id} stopped ({type(e).__name__}: {e}), it is retried after the lease")
+        finally:
+            await asyncio.to_thread(db.close)
+
+    @staticmethod
+    def _reload(db: Session, saga_id: int) -> Optional[OrderSaga]:
+        db.rollback()
+        return db.get(OrderSaga, saga_id, populate_existing=True)
+
+    async def advance(self, db: Session, saga: OrderSaga) -> bool:
+        """Один шаг или одна компенсация; True - сагу можно вести дальше сразу"""
+        order, call, result = await asyncio.to_thread(self._begin_step, db, saga)
+        if result is not None:
+            return result
+        try:
+            if call is not None:
+                await call(saga, order)
+                await asyncio.to_thread(self._remote_done, db, saga)
+            return await asyncio.to_thread(self._end_step, db, saga, order)
+        except StaleDataError:
+            raise
+        except Exception as e:
+            return await asyncio.to_thread(self._step_failed, db, saga, order, e)
+
+    def _begin_step(self, db: Session, saga: OrderSaga):
+        """
+        (заказ, вызов другого сервиса или None, итог advance). Итог не None -
+        шаг уже решён здесь: заказа нет, отмена, ожидание события
+        """
+        db.expire_all()
+        order = crud.get_order(db, saga.order_id)
+        if order is None:
+            return None, None, self._fail(db, saga, f"Order {saga.order_id} not found")
+        step = STEPS[STEP_NAMES.index(saga.step)]
+        if saga.status == SagaStatus.COMPENSATING:
+            return order, None if saga.remote_done else step.compensation, None
+        if saga.cancel_requested and not step.settled(saga):
+            return order, None, self._abort(db, saga, order, "Cancelled by request")
+        if step.ready is not None and not step.ready(saga):
+            now = datetime.utcnow()
+            if saga.deadline_at is not None and now >= saga.deadline_at:
+                return order, None, self._abort(db, saga, order, f"No {step.name} within {step.timeout:.0f}s")
+            saga.status = SagaStatus.WAITING
+            saga.next_attempt_at = saga.deadline_at or now + timedelta(seconds=self.lease)
+            db.commit()
+            return order, None, False
+        return order, None if saga.remote_done else step.remote, None
+
+    def _end_step(self, db: Session, saga: OrderSaga, order: models.Order) -> bool:
+        step = STEPS[STEP_NAMES.index(saga.step)]
+        if saga.status == SagaStatus.COMPENSATING:
+            self._finish_step(db, saga, order, step.compensation_local, self._backward)
+        else:
+            self._finish_step(db, saga, order, step.local, self._forward)
+            self.steps += 1
+        return True
+
+    def _step_failed(self, db: Session, saga: OrderSaga, order: models.Order, error: Exception) -> bool:
+        """Шаг не удался: откат, если он невозможен; иначе повтор позже. Не удалась компенсация - сага падает"""
+        db.rollback()
+        if isinstance(error, SagaAborted):
+            if saga.status == SagaStatus.COMPENSATING:
+                return self._fail(db, saga, f"Compensation of {saga.step} impossible: {error}")
+            return self._abort(db, saga, order, str(error))
+        return self._retry(db, saga, order, error)
+
+    @staticmethod
+    def _remote_done(db: Session, saga: OrderSaga):
+        """
+        Вызов прошёл: повтор шага его не повторит, откат знает, что откатывать.
+        Отметка ставится, пока аренда наша, даже если во время вызова пришло
+        событие оплаты или отмена; затем сага перечитывается вместе с ними
+        """
+        done = db.execute(
+            update(OrderSaga)
+            .where(OrderSaga.id == saga.id, OrderSaga.next_attempt_at == saga.next_attempt_at)
+            .values(remote_done=True, version=OrderSaga.version + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if not done:
+            raise StaleDataError(f"Saga {saga.id} was taken over by another executor")
+        db.refresh(saga)
+
+    def _finish_step(self, db: Session, saga: OrderSaga, order: models.Order, local, checkpoint):
+        """Изменение заказа и отметка о шаге - одним коммитом"""
+        checkpoint(saga)
+        try:
+            if local is not None:
+                local(db, saga, order)
+            else:
+                db.commit()
+        except StepAlreadyDone:
+            # Переход откатил транзакцию вместе с отметкой: ставим её заново
+            checkpoint(saga)
+            db.commit()
+
+    def _forward(self, saga: OrderSaga):
+        now = datetime.utcnow()
+        index = STEP_NAMES.index(saga.step) + 1
+        if index < len(STEPS):
+            saga.step = STEP_NAMES[index]
+            saga.status = SagaStatus.RUNNING
+            saga.deadline_at = now + timedelta(seconds=STEPS[index].timeout) if STEPS[index].timeout else None
+            saga.next_attempt_at = now + timedelta(seconds=self.lease)
+        else:
+            saga.status = SagaStatus.COMPLETED
+            saga.completed_at = now
+        saga.remote_done = False
+        saga.attempts = 0
+        saga.last_error = None
+
+    def _backward(self, saga: OrderSaga):
+        index = self._compensation_from(STEP_NAMES.index(saga.step) - 1)
+        if index is None:
+            saga.status = SagaStatus.COMPENSATED
+            saga.completed_at = datetime.utcnow()
+        else:
+            saga.step = STEP_NAMES[index]
+            saga.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.lease)
+        saga.remote_done = False
+        saga.attempts = 0
+
+    def _compensation_from(self, index: int) -> Optional[int]:
+        """Ближайший с конца шаг с компенсацией, начиная с index"""
+        while index >= 0 and not STEPS[index].compensates:
+            index -= 1
+        return index if index >= 0 else None
+
+    def _abort(self, db: Session, saga: OrderSaga, order: models.Order, reason: str) -> bool:
+        """
+        Откат с последнего выполненного шага. Текущий шаг откатывается, только
+        если его вызов отмечен (remote_done) или его событие уже пришло (оплата
+        прошла - нужен возврат). Если откатывать нечего, заказ просто отменяется.
+        После продажи на складе откат невозможен: сага падает и ждёт человека
+        """
+        current = STEP_NAMES.index(saga.step)
+        step = STEPS[current]
+        if step.settled(saga):
+            # Автомобиль уже продан: освобождать резерв и отменять заказ нельзя
+            return self._fail(db, saga, f"Step {step.name} is done in inventory and cannot be undone: {reason}")
+        self.compensations += 1
+        started = saga.remote_done or (step.ready is not None and step.ready(saga))
+        index = self._compensation_from(current if started else current - 1)
+
+        def aborted(saga: OrderSaga):
+            saga.last_error = reason[:1000]
+            saga.attempts = 0
+            saga.remote_done = False
+            if index is None:
+                saga.status = SagaStatus.COMPENSATED
+                saga.completed_at = datetime.utcnow()
+            else:
+                saga.step = STEP_NAMES[index]
+                saga.status = SagaStatus.COMPENSATING
+                saga.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.lease)
+
+        if index is None:
+            try:
+                self._finish_step(db, saga, order, _cancel, aborted)
+            except SagaAborted:
+                # Заказ уже не отменить (например, его отменили или доставили без саги)
+                aborted(saga)
+                db.commit()
+        else:
+            aborted(saga)
+            db.commit()
+        print(f"Saga {saga.id} of order {saga.order_id} compensating: {reason}")
+        return saga.status == SagaStatus.COMPENSATING
+
+    def _retry(self, db: Session, saga: OrderSaga, order: models.Order, error: Exception) -> bool:
+        saga.attempts += 1
+        saga.last_error = f"{type(error).__name__}: {error}"[:1000]
+        if saga.attempts >= self.max_attempts:
+            if saga.status == SagaStatus.COMPENSATING:
+                return self._fail(db, saga, f"Compensation of {saga.step} failed: {saga.last_error}")
+            return self._abort(db, saga, order, f"Step {saga.step} failed after {saga.attempts} attempts: "
+                                                f"{saga.last_error}")
+        delay = min(self.retry_delay_max, self.retry_delay * 2 ** (saga.attempts - 1))
+        saga.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.commit()
+        self.retries += 1
+        return False
+
+    def _fail(self, db: Session, saga: OrderSaga, reason: str) -> bool:
+        saga.status = SagaStatus.FAILED
+        saga.last_error = reason[:1000]
+        saga.completed_at = datetime.utcnow()
+        db.commit()
+        self.failed += 1
+        print(f"Saga {saga.id} of order {saga.order_id} failed: {reason}")
+        return False
+
+    # Фоновая задача
+
+    def wake(self):
+        """Разбудить исполнителя; можно звать из потоков потребителя событий"""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        failures = 0
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.run_once()
+                failures = 0
+                if claimed == self.batch_size:
+                    continue
+                delay = self.poll_interval
+            except Exception as e:
+                failures += 1
+                delay = min(self.retry_delay_max, self.poll_interval * 2 ** failures)
+                print(f"Saga orchestrator failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Start the orchestrator on the running loop; call from a startup handler"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+
+    def stats(self) -> dict:
+        db = self.session_factory()
+        try:
+            sagas = {status.value: count for status, count in
+                     db.query(OrderSaga.status, func.count(OrderSaga.id)).group_by(OrderSaga.status)}
+        finally:
+            db.close()
+        return {
+            "running": self._task is not None,
+            "sagas": sagas,
+            "steps": self.steps,
+            "retries": self.retries,
+            "compensations": self.compensations,
+            "failed": self.failed,
+            "conflicts": self.conflicts,
+        }
@@ -56,6 +56,14 @@ class OrderStatusUpdate(BaseModel):
 class PaymentStatusUpdate(BaseModel):
     status: PaymentStatus
 
+class BulkOrderCreate(BaseModel):
+    # Заказы проверяются по одному: ошибка в одном не отклоняет остальные
+    orders: List[Dict[str, Any]] = Field(..., min_length=1)
+
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1)
+    status: OrderStatus
+
 class Order(OrderBase):
     id: int
     vin: str
@@ -85,4 +93,30 @@ class OrderHistory(OrderHistoryBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class SagaStatus(str, Enum):
+    RUNNING = "running"
+    WAITING = "waiting"
+    COMPENSATING = "compensating"
+    COMPLETED = "completed"
+    COMPENSATED = "compensated"
+    FAILED = "failed"
+
+class OrderSaga(BaseModel):
+    id: int
+    order_id: int
+    step: str
+    status: SagaStatus
+    payment_result: Optional[str] = None
+    payment_id: Optional[int] = None
+    cancel_requested: bool = False
+    remote_done: bool = False
+    attempts: int = 0
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
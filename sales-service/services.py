@@ -1,153 +1,290 @@
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from fastapi import BackgroundTasks
+from pydantic import ValidationError
 from datetime import datetime
+import asyncio
+import os
+import time
 import models
 import crud
+import saga
 import schemas
-import messaging
+import transitions
 from clients import pricing_client, inventory_client
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
-async def create_order(db: Session, order_data: schemas.OrderCreate, background_tasks: BackgroundTasks) -> models.Order:
+# Общий срок на проверку наличия и расчёт цены при создании заказа, секунды
+ORDER_QUOTE_DEADLINE = float(os.getenv("ORDER_QUOTE_DEADLINE", "5"))
+
+async def quote_order(order_data: schemas.OrderCreate, deadline: float = ORDER_QUOTE_DEADLINE):
     """
-    Создает новый заказ с интеграцией с другими сервисами
+    Проверка наличия и расчёт цены: запросы независимы, идут параллельно
+    под одним общим сроком. Если автомобиля нет, расчёт цены отменяется
     """
-    # 1. Проверяем наличие автомобиля
-    availability = await inventory_client.check_availability(order_data.vehicle_id)
-    if not availability.get("available", False):
-        raise Exception(f"Vehicle {order_data.vehicle_id} is not available")
-    
-    # 2. Рассчитываем цену через pricing-service
-    price_calculation = await pricing_client.calculate_price(
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+    availability_task = asyncio.create_task(inventory_client.check_availability(order_data.vehicle_id))
+    pricing_task = asyncio.create_task(pricing_client.calculate_price(
         vehicle_id=order_data.vehicle_id,
         customer_id=order_data.customer_id,
         payment_method=order_data.payment_method,
         discount_code=order_data.discount_code
-    )
+    ))
+    try:
+        availability = await asyncio.wait_for(availability_task, deadline_at - loop.time())
+        if not availability.get("available", False):
+            raise Exception(f"Vehicle {order_data.vehicle_id} is not available")
+        # Расчёт цены уже идёт, ждём его в остатке срока
+        price_calculation = await asyncio.wait_for(pricing_task, max(0.0, deadline_at - loop.time()))
+    except asyncio.TimeoutError:
+        raise Exception(f"Availability and price of vehicle {order_data.vehicle_id} "
+                        f"not received within {deadline}s")
+    finally:
+        pricing_task.cancel()
+    return availability, price_calculation
+
+async def create_order(db: Session, order_data: schemas.OrderCreate, background_tasks: BackgroundTasks) -> models.Order:
+    """
+    Создает новый заказ с интеграцией с другими сервисами
+    """
+    # 1. Наличие автомобиля и цена через inventory-service и pricing-service, параллельно
+    availability, price_calculation = await quote_order(order_data)
     
-    # 3. Резервируем автомобиль
+    # 2. Резервируем автомобиль
     # (резервирование отложим до подтверждения заказа)
     
-    # 4. Создаем заказ в БД
-    db_order = crud.create_order(db, order_data)
-    
-    # 5. Обновляем заказ с расчетными данными
-    update_data = schemas.OrderUpdate(
+    # 3. Заказ сразу с расчетными данными: одна вставка и один коммит вместе
+    # с историей и событием создания заказа в outbox
+    return crud.create_order(
+        db, order_data,
         base_price=price_calculation["base_price"],
         final_price=price_calculation["final_price"],
         applied_discounts=json.dumps(price_calculation.get("applied_discounts", [])),
-        vin=availability.get("vin", "UNKNOWN")  # Получаем VIN из inventory
+        vin=availability.get("vin", "UNKNOWN"),  # Получаем VIN из inventory
+        currency=price_calculation.get("currency", "USD"),
+        event_type="OrderCreated"
     )
-    
-    db_order = crud.update_order(db, db_order.id, update_data)
-    
-    # 6. Публикуем событие создания заказа
-    background_tasks.add_task(
-        messaging.publish_order_event,
-        event_type="OrderCreated",
-        order_id=db_order.id,
-        customer_id=db_order.customer_id,
-        vehicle_id=db_order.vehicle_id,
-        amount=db_order.final_price
-    )
-    
-    return db_order
 
-async def confirm_order(db: Session, order_id: int, background_tasks: BackgroundTasks) -> models.Order:
+# Массовые операции: размер пакета, параллельные запросы к сервисам и срок на расчёт всего пакета
+BULK_MAX_ORDERS = int(os.getenv("BULK_MAX_ORDERS", "500"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "100"))
+BULK_UPSTREAM_CONCURRENCY = int(os.getenv("BULK_UPSTREAM_CONCURRENCY", "20"))
+BULK_QUOTE_DEADLINE = float(os.getenv("BULK_QUOTE_DEADLINE", "30"))
+
+# Переходы, которые затрагивают склад: при массовой смене статуса их ведёт сага
+BULK_SAGA_STATUSES = (models.OrderStatus.CONFIRMED, models.OrderStatus.DELIVERED, models.OrderStatus.CANCELLED)
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _pricing_key(order_data: schemas.OrderCreate) -> Tuple:
+    return (order_data.vehicle_id, order_data.customer_id, order_data.payment_method, order_data.discount_code)
+
+async def quote_orders(orders: List[schemas.OrderCreate], deadline: float = BULK_QUOTE_DEADLINE,
+                       concurrency: int = BULK_UPSTREAM_CONCURRENCY) -> Tuple[Dict[int, Any], Dict[Tuple, Any]]:
     """
-    Подтверждает заказ
+    Наличие и цены для пакета заказов. У inventory-service и pricing-service нет
+    пакетных методов, поэтому одинаковые запросы объединяются (наличие - по
+    автомобилю, цена - по автомобилю, клиенту, способу оплаты и коду скидки),
+    а различные идут параллельно, не больше concurrency одновременно, через
+    общие пулы соединений. Расчёт цены автомобиля, которого нет, отменяется.
+    Возвращает словари результатов: значение - ответ сервиса или исключение
     """
-    # 1. Получаем заказ
-    order = crud.get_order(db, order_id)
-    if not order:
-        return None
-    
-    # 2. Резервируем автомобиль
-    try:
-        await inventory_client.reserve_vehicle(
-            vehicle_id=order.vehicle_id,
-            order_id=order.id
-        )
-    except Exception as e:
-        raise Exception(f"Failed to reserve vehicle: {e}")
-    
-    # 3. Обновляем статус заказа
-    order = crud.update_order_status(db, order_id, schemas.OrderStatus.CONFIRMED)
-    
-    # 4. Публикуем событие подтверждения заказа
-    background_tasks.add_task(
-        messaging.publish_order_event,
-        event_type="OrderConfirmed",
-        order_id=order.id,
-        customer_id=order.customer_id,
-        vehicle_id=order.vehicle_id,
-        amount=order.final_price
-    )
-    
-    return order
+    if not orders:
+        # Пустой пакет или все заказы не прошли проверку: asyncio.wait не примет пустой набор
+        return {}, {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(call):
+        async with semaphore:
+            return await call
 
-async def cancel_order(db: Session, order_id: int, background_tasks: BackgroundTasks) -> models.Order:
+    availability = {vehicle_id: asyncio.create_task(limited(inventory_client.check_availability(vehicle_id)))
+                    for vehicle_id in dict.fromkeys(order.vehicle_id for order in orders)}
+    prices = {}
+    for order in orders:
+        key = _pricing_key(order)
+        if key not in prices:
+            prices[key] = asyncio.create_task(limited(pricing_client.calculate_price(
+                vehicle_id=order.vehicle_id,
+                customer_id=order.customer_id,
+                payment_method=order.payment_method,
+                discount_code=order.discount_code
+            )))
+
+    def cancel_pricing(vehicle_id: int, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None or not task.result().get("available", False):
+            for key, pricing_task in prices.items():
+                if key[0] == vehicle_id:
+                    pricing_task.cancel()
+
+    for vehicle_id, task in availability.items():
+        task.add_done_callback(lambda task, vehicle_id=vehicle_id: cancel_pricing(vehicle_id, task))
+
+    tasks = list(availability.values()) + list(prices.values())
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    def outcome(task: asyncio.Task):
+        if task in pending:
+            return TimeoutError(f"not received within {deadline}s")
+        if task.cancelled():
+            return asyncio.CancelledError("vehicle is not available")
+        return task.exception() or task.result()
+
+    return ({vehicle_id: outcome(task) for vehicle_id, task in availability.items()},
+            {key: outcome(task) for key, task in prices.items()})
+
+async def create_orders(db: Session, items: List[Any], deadline: float = BULK_QUOTE_DEADLINE):
     """
-    Отменяет заказ
+    Массовое создание заказов. items - сырые словари заказов; результат по
+    каждому отдаётся сразу, как только он известен: ошибки проверки и расчёта -
+    до вставки, созданные заказы - после коммита своего пакета из BULK_CHUNK_SIZE
+    заказов (одна вставка заказов, одна - истории, один коммит на пакет)
     """
-    # 1. Получаем заказ
-    order = crud.get_order(db, order_id)
-    if not order:
-        return None
-    
-    # 2. Освобождаем резервирование автомобиля
-    try:
-        await inventory_client.release_vehicle(
-            vehicle_id=order.vehicle_id
-        )
-    except Exception as e:
-        print(f"Warning: Failed to release vehicle reservation: {e}")
-    
-    # 3. Обновляем статус заказа
-    order = crud.update_order_status(db, order_id, schemas.OrderStatus.CANCELLED)
-    
-    # 4. Публикуем событие отмены заказа
-    background_tasks.add_task(
-        messaging.publish_order_event,
-        event_type="OrderCancelled",
-        order_id=order.id,
-        customer_id=order.customer_id,
-        vehicle_id=order.vehicle_id,
-        amount=order.final_price
-    )
-    
-    return order
+    started = time.perf_counter()
+    created = failed = 0
+    orders = []
+    for index, item in enumerate(items):
+        try:
+            orders.append((index, schemas.OrderCreate.model_validate(item)))
+        except ValidationError as e:
+            failed += 1
+            yield {"index": index, "status": "failed", "error": e.errors(include_url=False)}
+
+    availability, prices = await quote_orders([order for _, order in orders], deadline)
+
+    accepted, vehicles = [], set()
+    for index, order_data in orders:
+        vehicle = availability[order_data.vehicle_id]
+        price_calculation = prices[_pricing_key(order_data)]
+        if isinstance(vehicle, BaseException):
+            error = f"Availability of vehicle {order_data.vehicle_id}: {vehicle}"
+        elif not vehicle.get("available", False):
+            error = f"Vehicle {order_data.vehicle_id} is not available"
+        elif order_data.vehicle_id in vehicles:
+            error = f"Vehicle {order_data.vehicle_id} is already ordered in this batch"
+        elif isinstance(price_calculation, BaseException):
+            error = f"Price of vehicle {order_data.vehicle_id}: {price_calculation}"
+        else:
+            vehicles.add(order_data.vehicle_id)
+            accepted.append((index, {
+                **order_data.model_dump(),
+                "vin": vehicle.get("vin", "UNKNOWN"),
+                "base_price": price_calculation["base_price"],
+                "final_price": price_calculation["final_price"],
+                "applied_discounts": json.dumps(price_calculation.get("applied_discounts", [])),
+                "currency": price_calculation.get("currency", "USD"),
+                "status": models.OrderStatus.DRAFT,
+                "payment_status": models.PaymentStatus.PENDING,
+            }))
+            continue
+        failed += 1
+        yield {"index": index, "status": "failed", "error": error}
+
+    for chunk in _chunks(accepted, BULK_CHUNK_SIZE):
+        try:
+            created_orders = crud.create_orders(db, [row for _, row in chunk], event_type="OrderCreated")
+        except SQLAlchemyError as e:
+            db.rollback()
+            failed += len(chunk)
+            for index, _ in chunk:
+                yield {"index": index, "status": "failed", "error": f"Database error: {e.__class__.__name__}"}
+            continue
+        created += len(created_orders)
+        for (index, _), order in zip(chunk, created_orders):
+            yield {"index": index, "status": "created",
+                   "order": schemas.Order.model_validate(order).model_dump(mode="json")}
 
-async def complete_order(db: Session, order_id: int, background_tasks: BackgroundTasks) -> models.Order:
+    yield {"summary": {"created": created, "failed": failed,
+                       "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}}
+
+def _saga_result(order_id: int, result) -> Dict[str, Any]:
+    """Итог подтверждения или отмены через сагу: сага идёт в фоне или заказ уже изменён"""
+    if result is None:
+        return {"order_id": order_id, "status": "rejected", "error": "Order not found"}
+    if isinstance(result, models.OrderSaga):
+        return {"order_id": order_id, "status": "accepted",
+                "saga": schemas.OrderSaga.model_validate(result).model_dump(mode="json")}
+    return {"order_id": order_id, "status": "updated",
+            "order": schemas.Order.model_validate(result).model_dump(mode="json")}
+
+def _saga_action(orchestrator: saga.SagaOrchestrator, db: Session, status: schemas.OrderStatus,
+                 order_id: int) -> Dict[str, Any]:
     """
-    Завершает заказ (автомобиль продан)
+    Подтверждение - сага резерва, оплаты и продажи; завершение - её шаг
+    продажи; отмена - как POST /orders/{id}/cancel: резерв освобождает
+    компенсирующая сага, заказ без резерва отменяется сразу
     """
-    # 1. Получаем заказ
-    order = crud.get_order(db, order_id)
-    if not order:
-        return None
-    
-    # 2. Отмечаем автомобиль как проданный
     try:
-        await inventory_client.mark_as_sold(
-            vehicle_id=order.vehicle_id,
-            order_id=order.id
-        )
-    except Exception as e:
-        raise Exception(f"Failed to mark vehicle as sold: {e}")
-    
-    # 3. Обновляем статус заказа
-    order = crud.update_order_status(db, order_id, schemas.OrderStatus.DELIVERED)
-    
-    # 4. Публикуем событие завершения заказа
-    background_tasks.add_task(
-        messaging.publish_order_event,
-        event_type="OrderCompleted",
-        order_id=order.id,
-        customer_id=order.customer_id,
-        vehicle_id=order.vehicle_id,
-        amount=order.final_price
-    )
-    
-    return order
\ No newline at end of file
+        if status == schemas.OrderStatus.CONFIRMED:
+            return _saga_result(order_id, orchestrator.start_saga(db, order_id))
+        if status == schemas.OrderStatus.DELIVERED:
+            return _saga_result(order_id, orchestrator.complete(db, order_id))
+        return _saga_result(order_id, orchestrator.cancel(db, order_id))
+    except (saga.SagaConflict, transitions.InvalidTransition) as e:
+        db.rollback()
+        return {"order_id": order_id, "status": "rejected", "error": str(e)}
+
+async def change_orders_status(db: Session, order_ids: List[int], status: schemas.OrderStatus,
+                               orchestrator: saga.SagaOrchestrator):
+    """
+    Массовая смена статуса пакетами по BULK_CHUNK_SIZE. На пакет: один SELECT
+    текущих статусов и активных саг; заказы с идущей сагой отклоняются.
+    Подтверждение, завершение и отмена затрагивают склад и идут через сагу
+    по заказу (резерв освобождается только у заказов, которые его держат).
+    Прочие статусы - один UPDATE с проверкой переходов и один коммит
+    """
+    started = time.perf_counter()
+    counts = {"accepted": 0, "updated": 0, "rejected": 0}
+    target = models.OrderStatus(status)
+    allowed = set(transitions.sources(transitions.ORDER_TRANSITIONS, target))
+
+    for chunk in _chunks(list(dict.fromkeys(order_ids)), BULK_CHUNK_SIZE):
+        current = {row.id: row for row in db.execute(
+            select(models.Order.id, models.Order.status)
+            .where(models.Order.id.in_(chunk))
+        )}
+        sagas = {row.order_id: row.id for row in db.execute(
+            select(models.OrderSaga.order_id, models.OrderSaga.id)
+            .where(models.OrderSaga.order_id.in_(chunk), models.OrderSaga.status.in_(saga.ACTIVE))
+        )}
+        db.rollback()
+        results, candidates = {}, []
+        for order_id in chunk:
+            row = current.get(order_id)
+            if row is None:
+                results[order_id] = {"order_id": order_id, "status": "rejected", "error": "Order not found"}
+            elif order_id in sagas:
+                results[order_id] = {"order_id": order_id, "status": "rejected",
+                                     "error": f"Order {order_id} already has saga {sagas[order_id]} in progress"}
+            elif row.status not in allowed:
+                results[order_id] = {"order_id": order_id, "status": "rejected",
+                                     "error": f"Order in status {row.status.value} cannot move to {target.value}"}
+            else:
+                candidates.append(order_id)
+
+        if target in BULK_SAGA_STATUSES:
+            for order_id in candidates:
+                results[order_id] = _saga_action(orchestrator, db, status, order_id)
+        else:
+            updated, rejected = crud.update_orders_status(db, candidates, status)
+            for order in updated:
+                results[order.id] = {"order_id": order.id, "status": "updated",
+                                     "order": schemas.Order.model_validate(order).model_dump(mode="json")}
+            for order_id in rejected:
+                results[order_id] = {"order_id": order_id, "status": "rejected",
+                                     "error": f"Order cannot move to {target.value}"}
+
+        for order_id in chunk:
+            counts[results[order_id]["status"]] += 1
+            yield results[order_id]
+
+    yield {"summary": dict(counts, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))}
@@ -0,0 +1,126 @@
+"""Dead-letter queue tooling for EventConsumer queues.
+
+    python -m shared.dlq stats notification-service
+    python -m shared.dlq peek notification-service --limit 5
+    python -m shared.dlq replay notification-service --rate 20 [--limit 1000]
+
+Replay moves messages from "<queue>.dlq" back into "<queue>" through the
+default exchange, so only the consumer that failed sees them again, not every
+service bound to the original exchange. The retry counter is reset; a message
+that still fails goes through the retries and back into the DLQ.
+"""
+
+import argparse
+import time
+from typing import List, Optional
+
+import pika
+
+try:
+    from shared.messaging import RABBITMQ_URL, RETRY_HEADER
+except ImportError:  # services that keep the shared modules next to main.py
+    from messaging import RABBITMQ_URL, RETRY_HEADER
+
+# Headers describing the failure, dropped when a message is replayed
+FAILURE_HEADERS = (RETRY_HEADER, "x-last-error", "x-dead-lettered-at", "x-death",
+                   "x-first-death-exchange", "x-first-death-queue", "x-first-death-reason")
+
+
+def _connect(url: str):
+    connection = pika.BlockingConnection(pika.URLParameters(url))
+    return connection, connection.channel()
+
+
+def stats(queue: str, url: str = RABBITMQ_URL) -> dict:
+    """Messages waiting in the queue and in its DLQ"""
+    connection, channel = _connect(url)
+    try:
+        counts = {}
+        for name in (queue, f"{queue}.dlq"):
+            counts[name] = channel.queue_declare(queue=name, passive=True).method.message_count
+        return counts
+    finally:
+        connection.close()
+
+
+def peek(queue: str, limit: int = 10, url: str = RABBITMQ_URL) -> List[dict]:
+    """Look at the oldest dead letters without removing them"""
+    connection, channel = _connect(url)
+    messages = []
+    try:
+        for _ in range(limit):
+            method, properties, body = channel.basic_get(f"{queue}.dlq", auto_ack=False)
+            if method is None:
+                break
+            headers = properties.headers or {}
+            messages.append({
+                "message_id": properties.message_id,
+                "type": properties.type,
+                "routing_key": headers.get("x-original-routing-key", method.routing_key),
+                "retries": headers.get(RETRY_HEADER, 0),
+                "error": headers.get("x-last-error"),
+                "size": len(body),
+            })
+        # Closing the channel returns the unacked messages to the DLQ in order
+        return messages
+    finally:
+        connection.close()
+
+
+def replay(queue: str, limit: Optional[int] = None, rate: float = 10.0,
+           url: str = RABBITMQ_URL) -> int:
+    """Move up to `limit` dead letters back into the queue, at most `rate` per second.
+
+    Each message is acked in the DLQ only after the broker confirmed the copy,
+    so an interrupted replay never loses one (at worst it is delivered twice).
+    """
+    connection, channel = _connect(url)
+    channel.confirm_delivery()
+    interval = 1.0 / rate if rate > 0 else 0.0
+    next_at = time.monotonic()
+    replayed = 0
+    try:
+        while limit is None or replayed < limit:
+            method, properties, body = channel.basic_get(f"{queue}.dlq", auto_ack=False)
+            if method is None:
+                break
+            headers = {key: value for key, value in (properties.headers or {}).items()
+                       if key not in FAILURE_HEADERS}
+            headers["x-replayed"] = int(headers.get("x-replayed", 0)) + 1
+            properties.headers = headers
+            channel.basic_publish(exchange="", routing_key=queue, body=body, properties=properties)
+            channel.basic_ack(method.delivery_tag)
+            replayed += 1
+
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return replayed
+    finally:
+        connection.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Inspect and replay dead-lettered events")
+    parser.add_argument("command", choices=("stats", "peek", "replay"))
+    parser.add_argument("queue", help="consumer queue name, without the .dlq suffix")
+    parser.add_argument("--limit", type=int, default=None, help="at most this many messages")
+    parser.add_argument("--rate", type=float, default=10.0, help="replayed messages per second, 0 for no limit")
+    parser.add_argument("--url", default=RABBITMQ_URL)
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        for name, count in stats(args.queue, args.url).items():
+            print(f"{name}: {count}")
+    elif args.command == "peek":
+        for message in peek(args.queue, args.limit or 10, args.url):
+            print(message)
+    else:
+        started = time.monotonic()
+        replayed = replay(args.queue, args.limit, args.rate, args.url)
+        print(f"Replayed {replayed} messages into {args.queue} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import pika
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+from shared.envelope import PARTITION_HEADER
+from shared.messaging import MessageBroker, PublisherPool
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "30"))
+# Published rows are kept this long, then deleted
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+OUTBOX_PRUNE_INTERVAL = float(os.getenv("OUTBOX_PRUNE_INTERVAL", "300"))
+
+
+# Own metadata, so any service can create the table next to its models:
+# OutboxBase.metadata.create_all(bind=engine)
+OutboxBase = declarative_base()
+
+
+class OutboxEvent(OutboxBase):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String(50), nullable=False)
+    aggregate_id = Column(String(100), nullable=False, index=True)
+    exchange = Column(String(100), nullable=False)
+    routing_key = Column(String(200), nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    content_type = Column(String(50), nullable=False, default="application/json")
+    # Envelope id, resent as message_id so consumers can spot redeliveries
+    message_id = Column(String(50), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    published_at = Column(DateTime, nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+
+
+def add_message(db: Session, exchange: str, routing_key: str, body,
+                aggregate_type: str, aggregate_id,
+                properties: Optional[pika.BasicProperties] = None) -> OutboxEvent:
+    """Stage a message in the caller's transaction; it is sent once the transaction commits"""
+    row = OutboxEvent(
+        aggregate_type=aggregate_type,
+        aggregate_id=str(aggregate_id),
+        exchange=exchange,
+        routing_key=routing_key,
+        payload=body.encode("utf-8") if isinstance(body, str) else body,
+        content_type=(properties.content_type if properties else None) or "application/json",
+        message_id=properties.message_id if properties else None,
+    )
+    db.add(row)
+    return row
+
+
+def add_event(db: Session, exchange: str, routing_key: str, event_data: dict,
+              aggregate_type: str, aggregate_id) -> OutboxEvent:
+    """Stage an event in the same envelope MessageBroker.publish_event sends, keyed by its aggregate"""
+    body, properties = MessageBroker.build_event(exchange, routing_key, event_data,
+                                                 partition_key=f"{aggregate_type}:{aggregate_id}")
+    return add_message(db, exchange, routing_key, body, aggregate_type, aggregate_id, properties)
+
+
+def _properties(row: OutboxEvent) -> pika.BasicProperties:
+    return pika.BasicProperties(
+        delivery_mode=2,  # make message persistent
+        content_type=row.content_type,
+        message_id=row.message_id,
+        type=row.routing_key,
+        timestamp=int(row.created_at.timestamp()) if row.created_at else None,
+        headers={PARTITION_HEADER: f"{row.aggregate_type}:{row.aggregate_id}"},
+    )
+
+
+class OutboxRelay:
+    """Drains the outbox table to RabbitMQ with at-least-once delivery.
+
+    Rows are sent in id order, so events of one aggregate keep their commit
+    order: if one fails, the aggregate's later events wait for the next pass.
+    A pass publishes its rows as one batch and marks each row published only
+    after the broker confirmed it; a crash in between re-sends it, consumers
+    must tolerate duplicates. The rows of a pass stay locked until it commits,
+    so relays of several replicas wait on the head of the table in turn
+    instead of sending one aggregate's events side by side.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], pool: Optional[PublisherPool] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 max_backoff: float = OUTBOX_MAX_BACKOFF, retention_hours: float = OUTBOX_RETENTION_HOURS):
+        self.session_factory = session_factory
+        # The relay retries on its own schedule; one reconnect per pass covers a stale connection
+        self.pool = pool or PublisherPool(size=1, reconnect_attempts=2)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.retention_hours = retention_hours
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = 0.0
+        self.published = 0
+        self.failures = 0
+
+    def relay_once(self) -> int:
+        """Send one batch of pending rows; returns how many were published"""
+        db = self.session_factory()
+        try:
+            rows = (db.query(OutboxEvent)
+                    .filter(OutboxEvent.published_at.is_(None))
+                    .order_by(OutboxEvent.id)
+                    .limit(self.batch_size)
+                    .with_for_update()
+                    .all())
+            published = 0
+            blocked = set()
+            try:
+                while rows:
+                    try:
+                        self.pool.publish_batch([(row.exchange, row.routing_key, row.payload, _properties(row))
+                                                 for row in rows], confirm=True)
+                        sent, error = len(rows), None
+                    except Exception as e:
+                        # The broker confirmed the messages before the failed one
+                        sent, error = getattr(e, "sent", 0), e
+                    published_at = datetime.utcnow()
+                    for row in rows[:sent]:
+                        row.published_at = published_at
+                    published += sent
+                    if error is None:
+                        break
+                    failed = rows[sent]
+                    failed.attempts = (failed.attempts or 0) + 1
+                    if isinstance(error, pika.exceptions.AMQPConnectionError):
+                        # Broker unreachable, nothing else in this batch can go out either
+                        failed.last_error = "broker unreachable"
+                        raise error
+                    failed.last_error = str(error)[:1000]
+                    blocked.add((failed.aggregate_type, failed.aggregate_id))
+                    self.failures += 1
+                    rows = [row for row in rows[sent + 1:] if (row.aggregate_type, row.aggregate_id) not in blocked]
+            finally:
+                # Keep the progress made before a failure
+                db.commit()
+                self.published += published
+            return published
+        finally:
+            db.close()
+
+    def prune(self) -> int:
+        """Delete rows published longer ago than the retention period"""
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        db = self.session_factory()
+        try:
+            deleted = (db.query(OutboxEvent)
+                       .filter(OutboxEvent.published_at.isnot(None), OutboxEvent.published_at < cutoff)
+                       .delete(synchronize_session=False))
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def pending(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).count()
+        finally:
+            db.close()
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                published = await asyncio.to_thread(self.relay_once)
+                failures = 0
+                loop_time = asyncio.get_running_loop().time()
+                if loop_time - self._last_prune >= OUTBOX_PRUNE_INTERVAL:
+                    self._last_prune = loop_time
+                    await asyncio.to_thread(self.prune)
+                if published == self.batch_size:
+                    continue
+                delay = self.poll_interval
+            except Exception as e:
+                failures += 1
+                self.failures += 1
+                delay = min(self.max_backoff, self.poll_interval * 2 ** failures)
+                print(f"Outbox relay failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """Start the relay on the running loop; call from a startup handler"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.pool.close()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "pending": self.pending(),
+            "published": self.published,
+            "failures": self.failures,
+        }
@@ -0,0 +1,154 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+import messaging
+import models
+
+OrderStatus = models.OrderStatus
+PaymentStatus = models.PaymentStatus
+
+# Допустимые переходы статуса заказа: текущий -> возможные следующие
+ORDER_TRANSITIONS = {
+    OrderStatus.DRAFT: {OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED,
+                            OrderStatus.CANCELLED},
+    OrderStatus.PROCESSING: {OrderStatus.SHIPPED, OrderStatus.DELIVERED, OrderStatus.CANCELLED},
+    OrderStatus.SHIPPED: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: {OrderStatus.REFUNDED},
+    OrderStatus.CANCELLED: set(),
+    OrderStatus.REFUNDED: set(),
+}
+
+PAYMENT_TRANSITIONS = {
+    PaymentStatus.PENDING: {PaymentStatus.PAID, PaymentStatus.FAILED},
+    PaymentStatus.FAILED: {PaymentStatus.PENDING, PaymentStatus.PAID},
+    PaymentStatus.PAID: {PaymentStatus.PARTIALLY_REFUNDED, PaymentStatus.REFUNDED},
+    PaymentStatus.PARTIALLY_REFUNDED: {PaymentStatus.PARTIALLY_REFUNDED, PaymentStatus.REFUNDED},
+    PaymentStatus.REFUNDED: set(),
+}
+
+# Отметки времени, которые ставит переход в статус
+STATUS_TIMESTAMPS = {
+    OrderStatus.CONFIRMED: "confirmed_at",
+    OrderStatus.CANCELLED: "cancelled_at",
+}
+
+
+class InvalidTransition(Exception):
+    """Заказ не может перейти в запрошенный статус из текущего"""
+
+    def __init__(self, order_id: int, current: Tuple[Any, Any], status=None, payment_status=None):
+        target = ", ".join(f"{name} {value.value}" for name, value in
+                           (("status", status), ("payment status", payment_status)) if value is not None)
+        super().__init__(f"Order {order_id} in status {current[0].value}/{current[1].value} cannot move to {target}")
+        self.order_id = order_id
+        self.current = current
+        self.status = status
+        self.payment_status = payment_status
+
+
+def sources(transitions: Dict[Any, set], target) -> List[Any]:
+    """Статусы, из которых разрешён переход в target"""
+    return [state for state, targets in transitions.items() if target in targets]
+
+
+def _states(status, payment_status):
+    """Статусы из схем API - в статусы моделей"""
+    return (OrderStatus(status) if status is not None else None,
+            PaymentStatus(payment_status) if payment_status is not None else None)
+
+
+def _update(order_ids: List[int], status: Optional[OrderStatus], payment_status: Optional[PaymentStatus],
+            values: Dict[str, Any]):
+    """UPDATE с проверкой перехода в WHERE: строки в недопустимом статусе не меняются"""
+    now = datetime.utcnow()
+    values = dict(values, updated_at=now)
+    statement = update(models.Order).where(models.Order.id.in_(order_ids))
+    if status is not None:
+        values["status"] = status
+        if status in STATUS_TIMESTAMPS:
+            values.setdefault(STATUS_TIMESTAMPS[status], now)
+        statement = statement.where(models.Order.status.in_(sources(ORDER_TRANSITIONS, status)))
+    if payment_status is not None:
+        values["payment_status"] = payment_status
+        statement = statement.where(models.Order.payment_status.in_(sources(PAYMENT_TRANSITIONS, payment_status)))
+    return (statement.values(**values)
+            .returning(models.Order)
+            .execution_options(synchronize_session="fetch"))
+
+
+def _history(orders: Iterable[models.Order], status: Optional[OrderStatus],
+             payment_status: Optional[PaymentStatus], changed_by: str, notes: Optional[str]) -> List[dict]:
+    rows = []
+    for order in orders:
+        if status is not None:
+            rows.append({"order_id": order.id, "status": order.status, "payment_status": None,
+                         "changed_by": changed_by, "notes": notes or f"Status changed to {status.value}"})
+        if payment_status is not None:
+            rows.append({"order_id": order.id, "status": order.status, "payment_status": payment_status,
+                         "changed_by": changed_by,
+                         "notes": notes or f"Payment status changed to {payment_status.value}"})
+    return rows
+
+
+def _finish(db: Session, orders: List[models.Order], status, payment_status, changed_by: str,
+            notes: Optional[str], event_type: Optional[str]):
+    """История одной многострочной вставкой, события в outbox, один коммит"""
+    rows = _history(orders, status, payment_status, changed_by, notes)
+    if rows:
+        db.execute(insert(models.OrderHistory), rows)
+    if event_type:
+        for order in orders:
+            messaging.stage_order_event(db, order, event_type)
+    db.flush()
+    # Значения уже пришли из RETURNING: отсоединённые заказы не перечитываются после коммита
+    for order in orders:
+        db.expunge(order)
+    db.commit()
+
+
+def transition(db: Session, order_id: int, status: Optional[OrderStatus] = None,
+               payment_status: Optional[PaymentStatus] = None, changed_by: str = "system",
+               notes: Optional[str] = None, event_type: Optional[str] = None,
+               values: Optional[Dict[str, Any]] = None) -> Optional[models.Order]:
+    """
+    Переводит заказ в новый статус и/или статус оплаты одной транзакцией:
+    UPDATE ... RETURNING с проверкой допустимости перехода в WHERE, строки
+    истории и событие в outbox, один коммит. None - заказа нет;
+    InvalidTransition - переход из текущего статуса не разрешён
+    """
+    status, payment_status = _states(status, payment_status)
+    order = db.execute(_update([order_id], status, payment_status, values or {})).scalars().first()
+    if order is None:
+        db.rollback()
+        current = db.execute(
+            select(models.Order.status, models.Order.payment_status).where(models.Order.id == order_id)
+        ).first()
+        if current is None:
+            return None
+        raise InvalidTransition(order_id, tuple(current), status, payment_status)
+    _finish(db, [order], status, payment_status, changed_by, notes, event_type)
+    return order
+
+
+def transition_many(db: Session, order_ids: Iterable[int], status: Optional[OrderStatus] = None,
+                    payment_status: Optional[PaymentStatus] = None, changed_by: str = "system",
+                    notes: Optional[str] = None, event_type: Optional[str] = None
+                    ) -> Tuple[List[models.Order], List[int]]:
+    """
+    Массовый переход одним UPDATE ... WHERE id IN (...) RETURNING. Заказы,
+    которым переход не разрешён (или которых нет), не меняются и возвращаются
+    вторым списком; остальные - первым, с историей и событиями в той же транзакции
+    """
+    status, payment_status = _states(status, payment_status)
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return [], []
+    orders = list(db.execute(_update(order_ids, status, payment_status, {})).scalars())
+    _finish(db, orders, status, payment_status, changed_by, notes, event_type)
+    moved = {order.id for order in orders}
+    return orders, [order_id for order_id in order_ids if order_id not in moved]
@@ -9,19 +9,12 @@ from models import (
     AppointmentType, AppointmentStatus, ServiceSlotStatus
 )
 
+from messaging import message_broker
+
 # Заглушки вместо общего shared модуля
 class BookingEvent:
     pass
 
-class MessageBroker:
-    def publish_event(self, exchange, routing_key, event_data):
-        print(f"[STUB] Event: {exchange}.{routing_key} - {event_data}")
-    
-    def subscribe_to_events(self, exchange, routing_keys, callback):
-        print(f"[STUB] Subscribed to {exchange}: {routing_keys}")
-
-message_broker = MessageBroker()
-
 # ==================== TECHNICIAN OPERATIONS ====================
 class TechnicianCRUD:
     @staticmethod
@@ -0,0 +1,46 @@
+"""Load a service's flat modules in the tests without leaking them into sys.modules.
+
+Every service is a flat directory (models, crud, proxy, ...) with its own copy of
+the shared package, so its modules are imported with the service directory first
+on sys.path, and sys.path and sys.modules are restored afterwards. The returned
+modules keep working; the next test file still sees the root shared package.
+"""
+import importlib
+import os
+import sys
+from types import ModuleType
+from typing import Set, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _top_level_names(directory: str) -> Set[str]:
+    """Modules and packages a service directory provides, shared included"""
+    names = {"shared"}
+    for entry in os.listdir(directory):
+        if entry.endswith(".py"):
+            names.add(entry[:-3])
+        elif os.path.isdir(os.path.join(directory, entry)) and entry.isidentifier():
+            names.add(entry)
+    return names
+
+
+def load_service_modules(service: str, *names: str) -> Tuple[ModuleType, ...]:
+    """Import `names` (e.g. "crud", "clients.inventory_client") from a service directory"""
+    directory = os.path.join(ROOT, service)
+    own = _top_level_names(directory)
+
+    def is_own(name: str) -> bool:
+        return name.split(".", 1)[0] in own
+
+    saved_path, saved_modules = list(sys.path), dict(sys.modules)
+    for name in [name for name in sys.modules if is_own(name)]:
+        del sys.modules[name]
+    sys.path.insert(0, directory)
+    try:
+        return tuple(importlib.import_module(name) for name in names)
+    finally:
+        sys.path[:] = saved_path
+        for name in [name for name in sys.modules if is_own(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved_modules)
@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Mapping, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Dedupe window: processed ids older than this are pruned from the store
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "72"))
+
+# Own metadata, like the outbox: IdempotencyBase.metadata.create_all(bind=engine)
+IdempotencyBase = declarative_base()
+
+
+class ProcessedEvent(IdempotencyBase):
+    __tablename__ = "processed_events"
+    __table_args__ = (UniqueConstraint("consumer", "event_id", name="uq_processed_events_consumer_event"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    consumer = Column(String(100), nullable=False)
+    event_id = Column(String(100), nullable=False)
+    processed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class IdempotencyGuard:
+    """Processes each event id at most once per consumer.
+
+    Ids handled recently by this process are answered from an in-memory LRU
+    without touching the database. Otherwise the id is claimed with a single
+    INSERT into processed_events in the handler's own transaction: the unique
+    (consumer, event_id) key rejects a duplicate, also one handled by another
+    replica, and if the handler fails the claim rolls back with its writes, so
+    a redelivery is processed again. Ids older than the TTL are pruned.
+    """
+
+    def __init__(self, consumer: str, cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+                 ttl_hours: float = IDEMPOTENCY_TTL_HOURS):
+        self.consumer = consumer
+        self.cache_size = cache_size
+        self.ttl_hours = ttl_hours
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.store_hits = 0
+        self.processed = 0
+
+    def _cached(self, event_id: str) -> bool:
+        with self._lock:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                return True
+            return False
+
+    def remember(self, event_id: Optional[str]):
+        """Record an id whose transaction committed"""
+        if not event_id:
+            return
+        with self._lock:
+            self._recent[event_id] = None
+            self._recent.move_to_end(event_id)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+    def claim(self, db: Session, event_id: Optional[str]) -> bool:
+        """Claim an id in the session's transaction; False for a duplicate.
+
+        Call it before the handler writes anything: a duplicate rolls the
+        session back. Events without an id cannot be deduplicated and are
+        always processed.
+        """
+        if not event_id:
+            return True
+        if self._cached(event_id):
+            self.cache_hits += 1
+            return False
+        db.add(ProcessedEvent(consumer=self.consumer, event_id=event_id))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            self.store_hits += 1
+            self.remember(event_id)
+            return False
+        return True
+
+    def handle(self, db: Session, event: Mapping, handler: Callable[[Session, Mapping], Any]):
+        """Run handler(db, event) once per event id and commit; returns None for duplicates"""
+        event_id = event.get("event_id")
+        if not self.claim(db, event_id):
+            return None
+        try:
+            result = handler(db, event)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        self.processed += 1
+        self.remember(event_id)
+        return result
+
+    def prune(self, db: Session) -> int:
+        """Delete ids older than the dedupe window"""
+        cutoff = datetime.utcnow() - timedelta(hours=self.ttl_hours)
+        deleted = (db.query(ProcessedEvent)
+                   .filter(ProcessedEvent.consumer == self.consumer, ProcessedEvent.processed_at < cutoff)
+                   .delete(synchronize_session=False))
+        db.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        duplicates = self.cache_hits + self.store_hits
+        seen = duplicates + self.processed
+        return {
+            "consumer": self.consumer,
+            "cached_ids": len(self._recent),
+            "processed": self.processed,
+            "duplicates": duplicates,
+            "cache_hits": self.cache_hits,
+            "store_hits": self.store_hits,
+            "dedupe_rate": round(duplicates / seen, 3) if seen else 0.0,
+            "cache_hit_rate": round(self.cache_hits / duplicates, 3) if duplicates else 0.0,
+        }
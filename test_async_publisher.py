@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from shared.messaging import AsyncPublisher
+
+
+class FakePool:
+    """Publisher pool stand-in; fails the first `failures` batches"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def publish_batch(self, messages, confirm=False):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker down")
+        self.batches.append(list(messages))
+
+    def backoff(self, attempt):
+        return 0
+
+
+async def test_full_queue_on_the_loop_raises_instead_of_publishing_inline():
+    pool = FakePool()
+    publisher = AsyncPublisher(pool, max_size=1, overflow="block")
+    publisher._loop = asyncio.get_running_loop()
+    publisher._queue = asyncio.Queue(maxsize=1)
+
+    publisher.publish_nowait("autosalon", "payment.created", b"1")
+    with pytest.raises(asyncio.QueueFull):
+        publisher.publish_nowait("autosalon", "payment.created", b"2")
+
+    assert pool.batches == []
+    assert publisher.stats()["enqueued"] == 1
+
+
+async def test_batch_is_given_up_after_max_attempts(tmp_path):
+    pool = FakePool(failures=100)
+    publisher = AsyncPublisher(pool, overflow="drop", max_attempts=3, spill_path=str(tmp_path / "none.jsonl"))
+    publisher.start()
+    publisher.publish_nowait("autosalon", "payment.created", b"1")
+    await asyncio.wait_for(publisher._queue.join(), 1)
+
+    stats = publisher.stats()
+    assert (stats["published"], stats["dropped"], stats["publish_errors"]) == (0, 1, 3)
+    await publisher.stop()
+
+    spilling = AsyncPublisher(FakePool(failures=2), overflow="spill", max_attempts=2,
+                              spill_path=str(tmp_path / "spill.jsonl"))
+    spilling.start()
+    spilling.publish_nowait("autosalon", "payment.created", b"2")
+    await asyncio.wait_for(spilling._queue.join(), 1)
+    await spilling.stop()
+    assert spilling.stats()["spilled"] == 1
+    assert (tmp_path / "spill.jsonl").exists()
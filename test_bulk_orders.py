@@ -0,0 +1,159 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from service_modules import load_service_modules
+
+crud, models, saga, schemas, services, inventory_client, pricing_client, outbox = load_service_modules(
+    "sales-service", "crud", "models", "saga", "schemas", "services", "clients.inventory_client",
+    "clients.pricing_client", "shared.outbox")
+OutboxBase, OutboxEvent = outbox.OutboxBase, outbox.OutboxEvent
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    OutboxBase.metadata.create_all(bind=engine)
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.commits = commits
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def orchestrator(db):
+    return saga.SagaOrchestrator(sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()),
+                                 retry_delay=0)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Inventory and pricing calls, recorded; vehicle 13 is sold out"""
+    calls = {"availability": [], "price": [], "inventory": []}
+
+    async def check_availability(vehicle_id):
+        calls["availability"].append(vehicle_id)
+        return {"available": vehicle_id != 13, "vin": f"VIN{vehicle_id}"}
+
+    async def calculate_price(vehicle_id, customer_id=None, payment_method="cash", discount_code=None):
+        calls["price"].append(vehicle_id)
+        return {"base_price": 100.0, "final_price": 90.0, "applied_discounts": [], "currency": "RUB"}
+
+    def inventory(action):
+        async def call(vehicle_id, **kwargs):
+            calls["inventory"].append((action, vehicle_id))
+            return {"status": "ok"}
+        return call
+
+    monkeypatch.setattr(inventory_client, "check_availability", check_availability)
+    monkeypatch.setattr(pricing_client, "calculate_price", calculate_price)
+    monkeypatch.setattr(inventory_client, "reserve_vehicle", inventory("reserve"))
+    monkeypatch.setattr(inventory_client, "release_vehicle", inventory("release"))
+    monkeypatch.setattr(inventory_client, "mark_as_sold", inventory("sold"))
+    return calls
+
+
+async def collect(results):
+    return [result async for result in results]
+
+
+async def test_bulk_create_streams_per_item_results(db, upstream, monkeypatch):
+    monkeypatch.setattr(services, "BULK_CHUNK_SIZE", 2)
+    items = [{"customer_id": 1, "vehicle_id": 1}, {"customer_id": 2, "vehicle_id": 13},
+             {"customer_id": 3}, {"customer_id": 4, "vehicle_id": 2}, {"customer_id": 5, "vehicle_id": 2},
+             {"customer_id": 6, "vehicle_id": 3}]
+
+    results = await collect(services.create_orders(db, items))
+
+    by_index = {result["index"]: result for result in results if "index" in result}
+    assert [by_index[i]["status"] for i in range(6)] == ["created", "failed", "failed", "created", "failed",
+                                                        "created"]
+    assert "not available" in by_index[1]["error"]
+    assert "already ordered" in by_index[4]["error"]
+    assert by_index[5]["order"]["vin"] == "VIN3"
+    assert results[-1]["summary"]["created"] == 3 and results[-1]["summary"]["failed"] == 3
+    # One availability lookup per vehicle; sold-out vehicle 13 may skip pricing
+    assert sorted(upstream["availability"]) == [1, 2, 3, 13]
+    # Three orders in chunks of two: a transaction per chunk, not per order
+    assert len(db.commits) == 2
+    assert db.query(models.OrderHistory).count() == 3
+    assert db.query(OutboxEvent).filter_by(routing_key="order.ordercreated").count() == 3
+
+
+async def test_bulk_create_without_valid_orders_still_ends_with_a_summary(db, upstream):
+    assert await collect(services.create_orders(db, [])) == [
+        {"summary": {"created": 0, "failed": 0, "elapsed_ms": pytest.approx(0, abs=1000)}}]
+
+    results = await collect(services.create_orders(db, [{"bad": 1}, {"customer_id": 2}]))
+
+    assert [result["status"] for result in results[:-1]] == ["failed", "failed"]
+    assert results[-1]["summary"]["created"] == 0 and results[-1]["summary"]["failed"] == 2
+    assert upstream["availability"] == [] and upstream["price"] == []
+
+
+async def test_bulk_status_confirms_through_the_saga_and_rejects_the_rest(db, upstream, orchestrator):
+    created = await collect(services.create_orders(db, [{"customer_id": 1, "vehicle_id": i} for i in range(3)]))
+    ids = [result["order"]["id"] for result in created if "order" in result]
+    await collect(services.change_orders_status(db, [ids[2]], schemas.OrderStatus.CANCELLED, orchestrator))
+
+    results = await collect(services.change_orders_status(db, ids + [999], schemas.OrderStatus.CONFIRMED,
+                                                          orchestrator))
+
+    assert [result["status"] for result in results[:-1]] == ["accepted", "accepted", "rejected", "rejected"]
+    assert results[0]["saga"]["step"] == "reserve"
+    assert results[-1]["summary"]["accepted"] == 2 and results[-1]["summary"]["rejected"] == 2
+    # The saga reserves in the background; a second request does not start another one
+    assert upstream["inventory"] == []
+    again = await collect(services.change_orders_status(db, [ids[0]], schemas.OrderStatus.CONFIRMED,
+                                                        orchestrator))
+    assert again[0]["status"] == "rejected" and "in progress" in again[0]["error"]
+
+    await orchestrator.run_once()
+    assert sorted(upstream["inventory"]) == [("reserve", 0), ("reserve", 1)]
+    assert db.query(OutboxEvent).filter_by(routing_key="order.orderconfirmed").count() == 2
+
+
+async def test_bulk_cancel_releases_only_reserved_orders(db, upstream, orchestrator):
+    created = await collect(services.create_orders(db, [{"customer_id": 1, "vehicle_id": i} for i in range(3)]))
+    ids = [result["order"]["id"] for result in created if "order" in result]
+    # Order 0 is in its saga, waiting for payment; order 1 was confirmed without one
+    orchestrator.start_saga(db, ids[0])
+    await orchestrator.run_once()
+    crud.update_order_status(db, ids[1], schemas.OrderStatus.CONFIRMED)
+    upstream["inventory"].clear()
+
+    results = await collect(services.change_orders_status(db, ids, schemas.OrderStatus.CANCELLED, orchestrator))
+
+    assert [result["status"] for result in results[:-1]] == ["rejected", "accepted", "updated"]
+    assert results[2]["order"]["status"] == "cancelled"
+    await orchestrator.run_once()
+    assert upstream["inventory"] == [("release", 1)]
+    db.expire_all()
+    assert [crud.get_order(db, order_id).status for order_id in ids] == [
+        models.OrderStatus.CONFIRMED, models.OrderStatus.CANCELLED, models.OrderStatus.CANCELLED]
+
+
+async def test_bulk_completion_sells_through_the_saga(db, upstream, orchestrator):
+    created = await collect(services.create_orders(db, [{"customer_id": 1, "vehicle_id": i} for i in range(3)]))
+    ids = [result["order"]["id"] for result in created if "order" in result]
+    crud.update_order_status(db, ids[0], schemas.OrderStatus.CONFIRMED)
+    crud.update_order_status(db, ids[1], schemas.OrderStatus.CONFIRMED)
+
+    results = await collect(services.change_orders_status(db, ids, schemas.OrderStatus.DELIVERED, orchestrator))
+
+    assert [result["status"] for result in results[:-1]] == ["accepted", "accepted", "rejected"]
+    assert results[0]["saga"]["step"] == "sell"
+    # The vehicle is sold by the saga, not before the order is known to move
+    assert upstream["inventory"] == []
+    # Order 1 is cancelled in the meantime: its saga fails for a person to look at
+    crud.update_order_status(db, ids[1], schemas.OrderStatus.CANCELLED)
+    await orchestrator.run_once()
+
+    db.expire_all()
+    assert crud.get_order(db, ids[0]).status == models.OrderStatus.DELIVERED
+    sagas = {row.order_id: row.status for row in db.query(models.OrderSaga)}
+    assert sagas == {ids[0]: models.SagaStatus.COMPLETED, ids[1]: models.SagaStatus.FAILED}
+    assert db.query(OutboxEvent).filter_by(routing_key="order.ordercompleted").count() == 1
@@ -0,0 +1,146 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pika
+
+from shared.envelope import PARTITION_HEADER, encode_event
+from shared.messaging import EventConsumer, partition_key
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+        self.published = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, dict(properties.headers)))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True, multiple=False):
+        self.nacks.append(delivery_tag)
+
+
+def make_consumer(ack_batch, **options):
+    consumer = EventConsumer("autosalon", ["#"], lambda event: None, ack_batch=ack_batch, **options)
+    consumer.channel = RecordingChannel()
+    return consumer
+
+
+def test_multi_ack_covers_only_contiguous_finished_tags():
+    consumer = make_consumer(ack_batch=3)
+    consumer._in_flight = {1, 2, 3, 4, 5}
+    generation = consumer._generation
+
+    # 2, 3 and 5 finish first; 1 is still running, so nothing can be acked yet
+    for tag in (2, 3, 5):
+        consumer._complete(generation, tag, True)
+    assert consumer.channel.acks == []
+
+    # Once 1 finishes, 1-3 go out in one frame; 5 waits behind 4
+    consumer._complete(generation, 1, True)
+    assert consumer.channel.acks == [(3, True)]
+
+    consumer._complete(generation, 4, True)
+    assert consumer.channel.acks == [(3, True), (5, True)]
+    assert consumer.acked == 5
+    assert consumer.ack_frames == 2
+
+
+def test_failed_message_is_nacked_alone():
+    consumer = make_consumer(ack_batch=10)
+    consumer._in_flight = {1, 2, 3}
+    generation = consumer._generation
+
+    consumer._complete(generation, 2, False)
+    consumer._complete(generation, 1, True)
+    consumer._complete(generation, 3, True)
+
+    assert consumer.channel.nacks == [2]
+    assert consumer.channel.acks == [(3, True)]
+    assert consumer.failed == 1
+
+
+def test_outcomes_from_a_previous_connection_are_ignored():
+    consumer = make_consumer(ack_batch=1)
+    consumer._in_flight = {1}
+    consumer._complete(consumer._generation - 1, 1, True)
+    assert consumer.channel.acks == []
+    assert consumer._in_flight == {1}
+
+
+def test_failures_of_a_named_queue_are_retried_then_dead_lettered():
+    consumer = make_consumer(ack_batch=1, queue="notifications", max_retries=2, retry_delay=1)
+    headers = None
+    for tag in (1, 2, 3):
+        consumer._in_flight = {tag}
+        consumer._messages[tag] = ("autosalon", "payment.completed", pika.BasicProperties(headers=headers), b"{}")
+        consumer._complete(consumer._generation, tag, False, ValueError("smtp down"))
+        headers = consumer.channel.published[-1][1]
+
+    assert [target for target, _ in consumer.channel.published] == [
+        "notifications.retry.1000", "notifications.retry.2000", "notifications.dlq"
+    ]
+    assert headers["x-retries"] == 2
+    assert headers["x-original-routing-key"] == "payment.completed"
+    assert "smtp down" in headers["x-last-error"]
+    # Re-sent messages are acked, not nacked
+    assert consumer.channel.nacks == []
+    assert [tag for tag, _ in consumer.channel.acks] == [1, 2, 3]
+    assert (consumer.retried, consumer.dead_lettered) == (2, 1)
+
+
+class QueuedConnection:
+    """Runs the callbacks workers hand to the connection thread when asked"""
+
+    is_open = False
+
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+
+def test_partitions_handle_each_key_in_delivery_order_on_one_thread():
+    handled = []
+
+    def handle(event):
+        time.sleep(0.001)
+        handled.append((event.partition_key, event["payload"]["step"], threading.current_thread().name))
+
+    consumer = EventConsumer("order_events", ["order.*"], handle, ack_batch=100, workers=4,
+                             partition_by=partition_key("order_id"))
+    consumer.channel = RecordingChannel()
+    consumer._run = lambda: None
+    consumer.start()
+    consumer.connection = QueuedConnection()
+
+    tag = 0
+    for step in range(5):
+        for order_id in range(6):
+            tag += 1
+            if order_id % 2:
+                body, properties = encode_event("order_events", "order.updated",
+                                                {"order_id": order_id, "step": step}, partition_key=f"order:{order_id}")
+            else:
+                # Key only in the AMQP header, as outbox rows staged before partitioning
+                body, properties = encode_event("order_events", "order.updated", {"order_id": order_id, "step": step})
+                properties.headers = {PARTITION_HEADER: f"order:{order_id}"}
+            consumer._on_message(consumer.channel, SimpleNamespace(delivery_tag=tag), properties, body)
+    for _ in range(200):
+        if len(consumer.connection.callbacks) == tag:
+            break
+        time.sleep(0.01)
+    for callback in consumer.connection.callbacks:
+        callback()
+    consumer.stop()
+
+    for order_id in range(6):
+        runs = [(step, thread) for key, step, thread in handled if key == f"order:{order_id}"]
+        assert [step for step, _ in runs] == list(range(5))
+        assert len({thread for _, thread in runs}) == 1
+    assert consumer.channel.acks == [(30, True)]
@@ -0,0 +1,75 @@
+from datetime import datetime
+from enum import Enum
+
+import pytest
+
+from shared import envelope
+from shared.envelope import JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, decode_event, encode_event, new_event_id
+from shared.models import PaymentEvent
+
+
+class PaymentStatus(Enum):
+    COMPLETED = "completed"
+
+PAYLOAD = {
+    "payment_id": 7,
+    "order_id": 42,
+    "amount": 1500000.0,
+    "status": PaymentStatus.COMPLETED,
+    "created_at": datetime(2024, 5, 1, 12, 30),
+}
+
+
+@pytest.mark.parametrize("content_type", [JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE])
+def test_round_trip(content_type):
+    body, properties = encode_event("payment_events", "payment.completed", PAYLOAD, content_type)
+    assert properties.content_type == content_type
+    assert properties.type == "payment.completed"
+
+    event = decode_event(body, properties.content_type)
+    assert event.id == properties.message_id
+    assert event["event_type"] == "payment.completed"
+    assert event["payload"] == dict(PAYLOAD, status="completed", created_at="2024-05-01T12:30:00")
+    assert event.source == "payment_events"
+    # Reads as the event models of shared.models
+    assert PaymentEvent.model_validate(dict(event)).payload["order_id"] == 42
+
+
+@pytest.mark.parametrize("content_type", [JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE])
+def test_partition_key_travels_in_the_header(content_type):
+    body, properties = encode_event("order_events", "order.confirmed", PAYLOAD, content_type,
+                                    partition_key="order:42")
+    assert properties.headers == {envelope.PARTITION_HEADER: "order:42"}
+    assert decode_event(body, content_type).partition_key == "order:42"
+
+    body, properties = encode_event("order_events", "order.confirmed", PAYLOAD, content_type)
+    assert properties.headers is None
+    assert decode_event(body, content_type).partition_key is None
+
+
+def test_msgpack_is_smaller_and_payload_is_decoded_lazily():
+    json_body, _ = encode_event("payment_events", "payment.completed", PAYLOAD, JSON_CONTENT_TYPE)
+    body, properties = encode_event("payment_events", "payment.completed", PAYLOAD, MSGPACK_CONTENT_TYPE)
+    assert len(body) < len(json_body)
+
+    event = decode_event(body, properties.content_type)
+    assert event._raw_payload is not None
+    assert event.type == "payment.completed"
+    assert event._raw_payload is not None
+    assert event.payload["order_id"] == 42
+    assert event._raw_payload is None
+
+
+def test_legacy_json_without_envelope_fields():
+    event = decode_event(b'{"event_type": "order.created", "order_id": 1}')
+    assert event["event_type"] == "order.created"
+    assert event["payload"]["order_id"] == 1
+    assert event["order_id"] == 1
+
+
+def test_ids_and_timestamps_are_ordered():
+    timestamps = [envelope._clock.now_us() for _ in range(1000)]
+    assert timestamps == sorted(set(timestamps))
+    ids = [new_event_id(ts * 1000) for ts in range(1000, 1010)]
+    assert ids == sorted(ids)
+    assert all(len(event_id) == 26 for event_id in ids)
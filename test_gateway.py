@@ -0,0 +1,482 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import Request
+
+from service_modules import load_service_modules
+
+batch, breaker, cache, deals, proxy, ratelimit, routing, upstreams = load_service_modules(
+    "api-gateway-service", "batch", "breaker", "cache", "deals", "proxy", "ratelimit", "routing", "upstreams")
+
+IDENTITY = {"x-user-id": "7", "x-user-email": "", "x-user-role": "client", "x-user-exp": "",
+            "x-identity-signature": "signed"}
+
+
+def make_request(method="GET", path="/", headers=(), query=b"", client="10.0.0.1"):
+    """Incoming gateway request without a body"""
+    return Request({
+        "type": "http", "method": method, "path": path, "query_string": query,
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers],
+        "client": (client, 50000),
+    })
+
+
+def make_upstream(handler, name="sales-service", **limits):
+    return upstreams.Upstream(name, f"http://{name}", upstreams.UpstreamLimits(**limits),
+                              transport=httpx.MockTransport(handler))
+
+
+def json_response(status_code, body, headers=None):
+    return httpx.Response(status_code, content=json.dumps(body).encode(),
+                          headers=dict({"content-type": "application/json"}, **(headers or {})))
+
+
+async def test_upstream_sheds_requests_past_the_in_flight_cap():
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200, json={"path": request.url.path})
+
+    upstream = make_upstream(handler, max_connections=4, max_in_flight=1)
+    first = asyncio.create_task(upstream.request("GET", "orders/1"))
+    await asyncio.sleep(0)
+    assert upstream.in_flight == 1
+
+    with pytest.raises(upstreams.UpstreamSaturatedError):
+        await upstream.request("GET", "orders/2")
+
+    release.set()
+    assert (await first).json() == {"path": "/orders/1"}
+    # A streamed response holds its slot until it is closed
+    response = await upstream.send_stream("GET", "orders/3")
+    assert upstream.in_flight == 1
+    await upstream.close_stream(response)
+
+    stats = upstream.stats()
+    assert (stats["in_flight"], stats["peak_in_flight"], stats["total_requests"], stats["shed_requests"]) == (0, 1, 2, 1)
+    await upstream.close()
+
+
+def test_request_headers_drop_hop_by_hop_and_client_identity():
+    request = make_request(headers=[
+        ("host", "gateway"), ("connection", "keep-alive, x-trace"), ("x-trace", "1"), ("te", "trailers"),
+        ("authorization", "Bearer token"), ("x-user-id", "1"), ("x-identity-signature", "forged"),
+        ("accept", "application/json"),
+    ])
+
+    headers = proxy.filter_request_headers(request, IDENTITY)
+
+    names = [key for key, _ in headers]
+    assert names == ["authorization", "accept"] + list(IDENTITY)
+    assert dict(headers)["x-user-id"] == "7"
+    assert proxy.filter_request_headers(request) == [("authorization", "Bearer token"),
+                                                     ("accept", "application/json")]
+
+
+def test_response_headers_drop_hop_by_hop_and_server_headers():
+    response = httpx.Response(200, headers=[
+        ("content-type", "application/json"), ("content-length", "2"), ("transfer-encoding", "chunked"),
+        ("date", "today"), ("server", "uvicorn"), ("set-cookie", "a=1"), ("set-cookie", "b=2"),
+    ])
+
+    assert proxy.filter_response_headers(response) == [
+        ("content-type", "application/json"), ("content-length", "2"), ("set-cookie", "a=1"), ("set-cookie", "b=2")]
+    assert ("content-length", "2") not in proxy.filter_response_headers(response, buffered=True)
+
+
+def test_route_table_matches_the_longest_prefix(tmp_path):
+    routes_file = tmp_path / "routes.json"
+    routes_file.write_text(json.dumps({"routes": [
+        {"prefix": "reports/quick", "upstream": "reporting-quick", "timeout": 2, "retry": {"attempts": 3}},
+        {"prefix": "/payment/", "upstream": "payment-service", "auth_required": True},
+    ]}))
+    table = routing.RouteTable(routing.load_routes(str(routes_file)))
+
+    route, path = table.match("reports/quick/daily")
+    assert (route.upstream, path, route.timeout, route.retry.attempts) == ("reporting-quick", "daily", 2, 3)
+    route, path = table.match("/reports/monthly/2024")
+    assert (route.upstream, path) == ("reporting-analytics-service", "monthly/2024")
+    route, path = table.match("payment")
+    assert (route.upstream, path, route.auth_required) == ("payment-service", "", True)
+    assert table.match("unknown/1") == (None, "unknown/1")
+    assert len(table) == len(routing.DEFAULT_ROUTES) + 1
+
+
+def test_route_table_keeps_the_trailing_slash():
+    table = routing.RouteTable(routing.load_routes(None) + [routing.Route("reports/quick", "reporting-quick")])
+
+    assert table.match("orders/42/")[1] == "42/"
+    assert table.match("orders/")[1] == ""
+    assert table.match("reports/quick/daily/")[1] == "daily/"
+    assert upstreams.Upstream._url(table.match("orders/42/")[1]) == "/42/"
+
+
+async def test_cache_serves_etag_revalidation_and_skips_uncacheable_paths():
+    response_cache = cache.ResponseCache(ttls={"vehicles": 60.0})
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        upstream_response = json_response(200, {"id": 1})
+        return upstream_response, list(upstream_response.headers.multi_items())
+
+    first = await response_cache.serve(make_request(path="/vehicles/1"), "vehicles/1", None, fetch)
+    assert (first.status_code, first.headers["x-cache"], first.body) == (200, "MISS", b'{"id": 1}')
+
+    etag = first.headers["etag"]
+    revalidated = await response_cache.serve(
+        make_request(path="/vehicles/1", headers=[("if-none-match", etag)]), "vehicles/1", None, fetch)
+    assert (revalidated.status_code, revalidated.headers["x-cache"], revalidated.body) == (304, "HIT", b"")
+
+    assert await response_cache.serve(make_request(path="/orders/1"), "orders/1", None, fetch) is None
+    assert response_cache.invalidate("vehicles") == 1
+    await response_cache.serve(make_request(path="/vehicles/1"), "vehicles/1", None, fetch)
+    assert len(calls) == 2
+
+
+async def test_cache_coalesces_concurrent_misses():
+    response_cache = cache.ResponseCache(ttls={"pricing": 30.0})
+    release = asyncio.Event()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await release.wait()
+        upstream_response = json_response(200, {"price": 90})
+        return upstream_response, list(upstream_response.headers.multi_items())
+
+    requests = [asyncio.create_task(response_cache.serve(make_request(path="/pricing/7"), "pricing/7", None, fetch))
+                for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*requests)
+
+    assert len(calls) == 1
+    assert [response.body for response in responses] == [b'{"price": 90}'] * 3
+    stats = response_cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 2)
+
+
+@pytest.fixture
+def gateway():
+    """The gateway app and a client for it; startup (pools, health probes, consumers) is not run"""
+    main, = load_service_modules("api-gateway-service", "main")
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://gateway")
+
+    def bearer(role):
+        return {"authorization": f"Bearer {main.AuthUtils.create_test_token(role=role)}"}
+
+    return main, client, bearer
+
+
+async def test_cache_purge_requires_the_admin_role(gateway):
+    main, client, bearer = gateway
+    async with client:
+        assert (await client.delete("/gateway/cache")).status_code == 401
+        assert (await client.delete("/gateway/cache", headers=bearer("client"))).status_code == 403
+        purged = await client.delete("/gateway/cache", headers=bearer("admin"))
+    assert (purged.status_code, purged.json()) == (200, {"invalidated": 0})
+
+
+async def test_route_reload_requires_the_admin_role(gateway):
+    main, client, bearer = gateway
+    async with client:
+        assert (await client.post("/gateway/routes/reload")).status_code == 401
+        assert (await client.post("/gateway/routes/reload", headers=bearer("manager"))).status_code == 403
+        reloaded = await client.post("/gateway/routes/reload", headers=bearer("admin"))
+    assert (reloaded.status_code, reloaded.json()["routes"]) == (200, len(main.route_table))
+
+
+async def test_deal_purge_requires_the_admin_role(gateway):
+    main, client, bearer = gateway
+    async with client:
+        assert (await client.delete("/gateway/deals", params={"order_id": 7})).status_code == 401
+        assert (await client.delete("/gateway/deals", headers=bearer("client"))).status_code == 403
+        purged = await client.delete("/gateway/deals", headers=bearer("admin"))
+    assert (purged.status_code, purged.json()) == (200, {"invalidated": 0})
+
+
+async def test_coalesced_miss_answers_each_callers_validator():
+    response_cache = cache.ResponseCache(ttls={"vehicles": 60.0})
+    release = asyncio.Event()
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("if-none-match"))
+        await release.wait()
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"etag": '"v1"'})
+        return json_response(200, {"id": 1}, {"etag": '"v1"'})
+
+    upstream = make_upstream(handler, "vehicle-catalog-service")
+
+    def serve(headers=()):
+        request = make_request(path="/vehicles/1", headers=headers)
+        return asyncio.create_task(response_cache.serve(
+            request, "vehicles/1", None,
+            lambda: proxy.fetch(upstream, request, "1", None, None, conditional=False)))
+
+    # The caller holding a validator starts the shared fetch
+    revalidating = serve([("if-none-match", '"v1"')])
+    await asyncio.sleep(0.01)
+    plain = serve()
+    await asyncio.sleep(0)
+    release.set()
+    revalidated, full = await asyncio.gather(revalidating, plain)
+
+    assert seen == [None]
+    assert (revalidated.status_code, revalidated.body) == (304, b"")
+    assert (full.status_code, full.body, full.headers["etag"]) == (200, b'{"id": 1}', '"v1"')
+    assert response_cache.stats()["coalesced"] == 1
+    await upstream.close()
+
+
+async def test_cache_is_invalidated_by_published_events():
+    response_cache = cache.ResponseCache(ttls={"vehicles": 60.0, "reports/quick": 30.0})
+
+    async def fetch():
+        upstream_response = json_response(200, [])
+        return upstream_response, list(upstream_response.headers.multi_items())
+
+    for path in ("vehicles/1", "reports/quick/sales"):
+        await response_cache.serve(make_request(path="/" + path), path, None, fetch)
+
+    # Envelope event_type is the routing key the service published with
+    response_cache.handle_event("autosalon", {"event_type": "inventory.vehiclereserved"})
+    assert response_cache.stats()["entries"] == 2
+    response_cache.handle_event("inventory_events", {"event_type": "inventory.vehiclereserved"})
+    assert response_cache.stats()["entries"] == 1
+    response_cache.handle_event("order_events", {"event_type": "order.orderconfirmed"})
+    assert response_cache.stats()["entries"] == 0
+
+
+async def test_breaker_opens_half_opens_and_closes():
+    circuit = breaker.CircuitBreaker("payment-service", 10.0, failure_threshold=2, open_seconds=60,
+                                     half_open_calls=1)
+    circuit.record_failure()
+    circuit.before_call()
+    circuit.record_failure()
+    assert circuit.state == breaker.OPEN
+    with pytest.raises(breaker.CircuitOpenError):
+        circuit.before_call()
+
+    # Open period over: one trial call, a failure opens the circuit again
+    circuit.opened_at -= 60
+    circuit.before_call()
+    assert circuit.state == breaker.HALF_OPEN
+    with pytest.raises(breaker.CircuitOpenError):
+        circuit.before_call()
+    circuit.record_failure()
+    assert circuit.state == breaker.OPEN
+
+    circuit.opened_at -= 60
+    circuit.before_call()
+    circuit.record_success(0.01)
+    assert circuit.state == breaker.CLOSED
+    assert (circuit.stats()["times_opened"], circuit.stats()["rejected"]) == (2, 2)
+
+
+async def test_upstream_failures_open_the_breaker():
+    upstream = make_upstream(lambda request: httpx.Response(503))
+    upstream.breaker = breaker.CircuitBreaker(upstream.name, 10.0, failure_threshold=2, open_seconds=60)
+
+    for _ in range(2):
+        assert (await upstream.request("GET", "orders/1")).status_code == 503
+    with pytest.raises(breaker.CircuitOpenError):
+        await upstream.request("GET", "orders/1")
+    assert upstream.stats()["total_requests"] == 2
+    await upstream.close()
+
+
+async def test_token_bucket_limits_by_ip_and_user():
+    now = [0.0]
+    backend = ratelimit.InMemoryRateLimitBackend(max_keys=2, clock=lambda: now[0])
+    limiter = ratelimit.RateLimiter(backend, ip_rate=1, ip_burst=2, user_rate=1, user_burst=3)
+
+    assert await limiter.check("10.0.0.1", None) is None
+    assert await limiter.check("10.0.0.1", None) is None
+    assert await limiter.check("10.0.0.1", None) == 1.0
+    now[0] += 1
+    assert await limiter.check("10.0.0.1", None) is None
+
+    # A batch costs one token per sub-request
+    assert await limiter.check("10.0.0.2", "7", cost=3) == 1.0
+    assert await limiter.check(None, "7", cost=3) is None
+    assert backend.size() == 2
+    assert (limiter.allowed, limiter.limited) == (4, 2)
+
+
+def test_rate_limit_backend_requires_consume():
+    with pytest.raises(TypeError):
+        ratelimit.RateLimitBackend()
+
+
+async def test_batch_fans_out_and_reports_each_result():
+    seen, active = [], {"now": 0, "peak": 0}
+
+    async def handler(request):
+        seen.append(request)
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if request.url.host == "payment-service":
+            raise httpx.ConnectError("refused")
+        return json_response(200, {"path": request.url.path, "query": request.url.query.decode()})
+
+    registry = upstreams.UpstreamRegistry()
+    for name in ("sales-service", "payment-service"):
+        registry.register(name, f"http://{name}", upstreams.UpstreamLimits(),
+                          transport=httpx.MockTransport(handler))
+    executor = batch.BatchExecutor(registry)
+    request = batch.BatchRequest(requests=[
+        {"id": "order", "path": "/orders/42?expand=items", "headers": {"x-user-id": "1", "x-trace": "abc"}},
+        {"id": "payment", "method": "POST", "path": "/payment/payments", "body": {"amount": 90}},
+        {"path": "/unknown/1"},
+        {"method": "TRACE", "path": "/orders/42"},
+    ])
+
+    results = await executor.run(request, routing.RouteTable(routing.load_routes(None)), IDENTITY)
+
+    assert [(result["id"], result["status"]) for result in results] == [
+        ("order", 200), ("payment", 502), ("2", 404), ("3", 405)]
+    assert results[0]["body"] == {"path": "/42", "query": "expand=items"}
+    assert active["peak"] == 2
+    order_request = next(request for request in seen if request.url.host == "sales-service")
+    assert (order_request.headers["x-user-id"], order_request.headers["x-trace"]) == ("7", "abc")
+    assert executor.stats()["items"] == 4
+    await registry.close()
+
+
+class ChunkStream(httpx.AsyncByteStream):
+    """Upstream body sent in chunks, optionally failing after them"""
+
+    def __init__(self, *chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+async def test_forward_returns_the_connection_when_the_body_fails_mid_stream():
+    upstream = make_upstream(lambda request: httpx.Response(
+        200, stream=ChunkStream(b'{"id":', error=httpx.ReadError("connection reset"))))
+
+    response = await proxy.forward(upstream, make_request(path="/orders/1"), "1")
+    assert upstream.in_flight == 1
+    chunks = []
+    with pytest.raises(httpx.ReadError):
+        async for chunk in response.body_iterator:
+            chunks.append(chunk)
+
+    assert chunks == [b'{"id":']
+    assert upstream.in_flight == 0
+    await upstream.close()
+
+
+async def test_forward_streams_the_body_and_identity():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, stream=ChunkStream(b"[1, ", b"2]"), headers={"transfer-encoding": "chunked"})
+
+    upstream = make_upstream(handler)
+    request = make_request(path="/orders/42", headers=[("x-user-id", "1")], query=b"page=2")
+
+    response = await proxy.forward(upstream, request, "42", identity=IDENTITY)
+
+    assert b"".join([chunk async for chunk in response.body_iterator]) == b"[1, 2]"
+    assert "transfer-encoding" not in response.headers
+    assert (str(seen[0].url), seen[0].headers["x-user-id"]) == ("http://sales-service/42?page=2", "7")
+    assert upstream.in_flight == 0
+    await upstream.close()
+
+
+def deal_registry(handler):
+    registry = upstreams.UpstreamRegistry()
+    for name in ("sales-service", "payment-service", "financing-service", "insurance-service"):
+        registry.register(name, f"http://{name}", upstreams.UpstreamLimits(),
+                          transport=httpx.MockTransport(handler))
+    return registry
+
+
+async def test_deal_merges_the_parts_read_from_each_service():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, request.url.path))
+        if request.url.host == "sales-service":
+            return json_response(200, {"id": 42, "status": "confirmed"})
+        if request.url.host == "insurance-service":
+            return httpx.Response(503)
+        return json_response(200, [{"order_id": 42, "source": request.url.host}])
+
+    registry = deal_registry(handler)
+    aggregator = deals.DealAggregator(registry)
+    table = routing.RouteTable(routing.load_routes(None))
+
+    status, deal = await aggregator.get_deal(42, table, IDENTITY)
+
+    assert status == 200
+    assert sorted(seen) == [("financing-service", "/orders/42/applications"),
+                            ("insurance-service", "/orders/42/policies"),
+                            ("payment-service", "/orders/42/payments"),
+                            ("sales-service", "/orders/42")]
+    assert deal["order"] == {"id": 42, "status": "confirmed"}
+    assert deal["payments"] == [{"order_id": 42, "source": "payment-service"}]
+    assert deal["financing"] == [{"order_id": 42, "source": "financing-service"}]
+    assert (deal["insurance"], deal["errors"]["insurance"]["status"]) == ([], 503)
+    assert (deal["partial"], deal["cached"]) == (True, False)
+    await registry.close()
+
+
+async def test_deal_is_cached_and_missing_orders_are_404():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/orders/404":
+            return json_response(404, {"detail": "Order not found"})
+        return json_response(200, {"id": 1} if request.url.host == "sales-service" else [])
+
+    registry = deal_registry(handler)
+    aggregator = deals.DealAggregator(registry, ttl=60)
+    table = routing.RouteTable(routing.load_routes(None))
+
+    assert (await aggregator.get_deal(404, table, IDENTITY))[0] == 404
+    first = (await aggregator.get_deal(1, table, IDENTITY))[1]
+    second = (await aggregator.get_deal(1, table, IDENTITY))[1]
+
+    assert (first["partial"], first["cached"], second["cached"]) == (False, False, True)
+    assert len(calls) == 2 * len(deals.DEAL_SOURCES)
+    assert aggregator.invalidate(1) == 1
+    await registry.close()
+
+
+def test_identity_signature_keeps_the_fields_apart():
+    main, = load_service_modules("api-gateway-service", "main")
+    sign = main.AuthUtils.sign_identity
+
+    assert sign("7", "a@x.io|admin", "client", "") != sign("7", "a@x.io", "admin|client", "")
+    assert sign("7", "a@x.io", "client", "|1") != sign("7", "a@x.io|client", "", "1")
+
+
+def test_services_accept_the_gateways_identity_headers():
+    from shared.auth import AuthUtils
+
+    main, = load_service_modules("api-gateway-service", "main")
+    headers = main.AuthUtils.identity_headers({"sub": "7", "email": "a|b@x.io", "role": "client", "exp": 4102444800})
+
+    assert AuthUtils.verify_gateway_identity(headers) == {
+        "sub": "7", "email": "a|b@x.io", "role": "client", "exp": "4102444800"}
+    # The role cannot be moved into the email
+    forged = dict(headers, **{"x-user-email": "a", "x-user-role": "b@x.io|client"})
+    assert AuthUtils.verify_gateway_identity(forged) is None
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared.idempotency import IdempotencyBase, IdempotencyGuard, ProcessedEvent
+
+Base = declarative_base()
+
+
+class Notification(Base):
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String(100))
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'idempotency.db'}")
+    Base.metadata.create_all(bind=engine)
+    IdempotencyBase.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def notify(db, event):
+    notification = Notification(event_id=event["event_id"])
+    db.add(notification)
+    return notification
+
+
+def deliver(session_factory, guard, event, handler=notify):
+    db = session_factory()
+    try:
+        return guard.handle(db, event, handler)
+    finally:
+        db.close()
+
+
+def count(session_factory, model):
+    db = session_factory()
+    try:
+        return db.query(model).count()
+    finally:
+        db.close()
+
+
+def test_redelivery_is_skipped_from_memory(session_factory):
+    guard = IdempotencyGuard("notification-service")
+    event = {"event_id": "01HX", "event_type": "payment.completed"}
+
+    assert deliver(session_factory, guard, event) is not None
+    assert deliver(session_factory, guard, event) is None
+    assert count(session_factory, Notification) == 1
+    assert guard.stats()["cache_hits"] == 1
+    assert guard.stats()["dedupe_rate"] == 0.5
+
+
+def test_event_handled_by_another_replica_is_skipped_by_the_store(session_factory):
+    event = {"event_id": "01HY", "event_type": "payment.completed"}
+    deliver(session_factory, IdempotencyGuard("notification-service"), event)
+
+    replica = IdempotencyGuard("notification-service")
+    assert deliver(session_factory, replica, event) is None
+    assert replica.store_hits == 1
+    # The next redelivery is answered from memory
+    assert deliver(session_factory, replica, event) is None
+    assert replica.cache_hits == 1
+    # Another consumer processes the same event independently
+    assert deliver(session_factory, IdempotencyGuard("reporting-service"), event) is not None
+    assert count(session_factory, Notification) == 2
+
+
+def test_failed_handler_releases_the_claim(session_factory):
+    guard = IdempotencyGuard("notification-service")
+    event = {"event_id": "01HZ", "event_type": "payment.completed"}
+
+    def broken(db, event):
+        notify(db, event)
+        raise RuntimeError("smtp down")
+
+    with pytest.raises(RuntimeError):
+        deliver(session_factory, guard, event, broken)
+    assert count(session_factory, ProcessedEvent) == 0
+
+    assert deliver(session_factory, guard, event) is not None
+    assert count(session_factory, Notification) == 1
+
+
+def test_prune_drops_ids_past_the_window(session_factory):
+    guard = IdempotencyGuard("notification-service", ttl_hours=1)
+    db = session_factory()
+    db.add_all([
+        ProcessedEvent(consumer="notification-service", event_id="old",
+                       processed_at=datetime.utcnow() - timedelta(hours=2)),
+        ProcessedEvent(consumer="notification-service", event_id="new"),
+        ProcessedEvent(consumer="reporting-service", event_id="old",
+                       processed_at=datetime.utcnow() - timedelta(hours=2)),
+    ])
+    db.commit()
+
+    assert guard.prune(db) == 1
+    assert sorted((row.consumer, row.event_id) for row in db.query(ProcessedEvent)) == [
+        ("notification-service", "new"), ("reporting-service", "old")
+    ]
+    db.close()
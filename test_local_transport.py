@@ -0,0 +1,114 @@
+import asyncio
+
+from shared.messaging import HashRing, LocalTransport, MessageBroker, partition_key
+
+
+async def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+async def test_topic_routing_and_fan_out():
+    broker = MessageBroker(transport=LocalTransport())
+    payments, everything = [], []
+    broker.subscribe_to_events("autosalon", ["payment.*"], lambda event: payments.append(event["payload"]))
+    broker.subscribe_to_events("*", ["#"], lambda event: everything.append(event["event_type"]))
+
+    broker.publish_event("autosalon", "payment.completed", {"payment_id": 1})
+    broker.publish_event("autosalon", "insurance.purchased", {"policy_id": 2})
+    broker.publish_event("booking", "booking.created", {"appointment_id": 3})
+    await broker.transport.drain()
+
+    assert payments == [{"payment_id": 1}]
+    assert sorted(everything) == ["booking.created", "insurance.purchased", "payment.completed"]
+    broker.close()
+
+
+async def test_named_queue_is_shared_by_its_consumers():
+    broker = MessageBroker(transport=LocalTransport())
+    handled = {"a": 0, "b": 0}
+
+    async def replica(name):
+        async def handle(event):
+            handled[name] += 1
+            await asyncio.sleep(0.001)
+        return handle
+
+    for name in handled:
+        broker.subscribe_to_events("autosalon", ["#"], await replica(name), queue="notifications", workers=1)
+    for i in range(20):
+        broker.publish_event("autosalon", "payment.completed", {"payment_id": i})
+    await broker.transport.drain()
+
+    assert handled["a"] + handled["b"] == 20
+    assert handled["a"] and handled["b"]
+    broker.close()
+
+
+async def test_failures_are_retried_then_dead_lettered():
+    broker = MessageBroker(transport=LocalTransport())
+    attempts = []
+
+    def flaky(event):
+        attempts.append(event["payload"]["n"])
+        if event["payload"]["n"] == 2 or len(attempts) == 1:
+            raise RuntimeError("smtp down")
+
+    consumer = broker.subscribe_to_events("autosalon", ["#"], flaky, queue="q",
+                                          max_retries=2, retry_delay=0.01)
+    broker.publish_event("autosalon", "payment.completed", {"n": 1})
+    broker.publish_event("autosalon", "payment.completed", {"n": 2})
+    await wait_for(lambda: consumer.dead_lettered == 1)
+
+    assert attempts.count(1) == 2
+    assert attempts.count(2) == 3
+    assert consumer.acked == 1
+    assert len(broker.transport.queues["q"].dead_letters) == 1
+    broker.close()
+
+
+async def test_publish_from_a_worker_thread():
+    broker = MessageBroker(transport=LocalTransport())
+    received = []
+    broker.subscribe_to_events("config", ["config.*"], lambda event: received.append(event["event_type"]))
+    await asyncio.to_thread(broker.publish_event, "config", "config.updated", {"key": "vat"})
+    await wait_for(lambda: received == ["config.updated"])
+    broker.close()
+
+
+async def test_partitions_keep_the_order_of_each_key():
+    broker = MessageBroker(transport=LocalTransport())
+    handled = []
+
+    async def handle(event):
+        # Events of other orders may overtake a slow one, those of the same order may not
+        await asyncio.sleep(0.02 if event["payload"]["step"] == 0 else 0)
+        handled.append((event["payload"]["order_id"], event["payload"]["step"]))
+
+    consumer = broker.subscribe_to_events("order_events", ["order.*"], handle, queue="orders",
+                                          workers=4, partition_by=partition_key("order_id"))
+    for step in range(3):
+        for order_id in range(8):
+            broker.publish_event("order_events", "order.updated", {"order_id": order_id, "step": step},
+                                 partition_key=f"order:{order_id}" if order_id % 2 else None)
+    await broker.transport.drain()
+
+    assert len(handled) == 24
+    for order_id in range(8):
+        assert [step for key, step in handled if key == order_id] == [0, 1, 2]
+    assert consumer.stats()["partitioned"]
+    broker.close()
+
+
+def test_hash_ring_is_stable_and_moves_few_keys():
+    keys = [f"order:{i}" for i in range(2000)]
+    ring = HashRing(4)
+    assert [ring.partition(key) for key in keys] == [HashRing(4).partition(key) for key in keys]
+    assert set(ring.partition(key) for key in keys) == {0, 1, 2, 3}
+
+    bigger = HashRing(5)
+    moved = sum(ring.partition(key) != bigger.partition(key) for key in keys)
+    assert moved < len(keys) * 0.35
@@ -0,0 +1,338 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from service_modules import load_service_modules
+
+crud, models, saga, schemas, transitions, inventory_client, outbox = load_service_modules(
+    "sales-service", "crud", "models", "saga", "schemas", "transitions", "clients.inventory_client",
+    "shared.outbox")
+OutboxBase, OutboxEvent = outbox.OutboxBase, outbox.OutboxEvent
+
+SagaStatus = models.SagaStatus
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    OutboxBase.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def orchestrator(session_factory):
+    return saga.SagaOrchestrator(session_factory, retry_delay=0, max_attempts=2)
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    """Inventory calls by vehicle, recorded; set inventory["fail"] to make a call raise"""
+    calls = {"log": [], "fail": set()}
+
+    def action(name):
+        async def call(vehicle_id, **kwargs):
+            calls["log"].append((name, vehicle_id))
+            if name in calls["fail"]:
+                raise Exception(f"{name} failed")
+            return {"status": "ok"}
+        return call
+
+    for name in ("reserve_vehicle", "release_vehicle", "mark_as_sold"):
+        monkeypatch.setattr(inventory_client, name, action(name))
+    return calls
+
+
+def create_order(db):
+    order = crud.create_order(db, schemas.OrderCreate(customer_id=1, vehicle_id=7), base_price=100.0,
+                              final_price=90.0, vin="VIN7")
+    return order.id
+
+
+def payment_event(order_id, event_type="payment.succeeded"):
+    # Same shape as payment-service's PaymentEvent inside the envelope
+    return {"event_type": event_type, "payload": {"event_id": "payment_1", "event_type": event_type,
+                                                  "payload": {"payment_id": 1, "order_id": order_id}}}
+
+
+def state(db, saga_id):
+    db.expire_all()
+    order_saga = db.get(models.OrderSaga, saga_id)
+    return order_saga.step, order_saga.status
+
+
+def due(db, saga_id, **values):
+    """Make a saga due now, as if its retry delay had passed"""
+    db.expire_all()
+    order_saga = db.get(models.OrderSaga, saga_id)
+    for key, value in dict(values, next_attempt_at=datetime.utcnow()).items():
+        setattr(order_saga, key, value)
+    db.commit()
+
+
+def events(db):
+    return [row.routing_key for row in db.query(OutboxEvent).order_by(OutboxEvent.id)]
+
+
+async def test_saga_reserves_waits_for_payment_and_sells(db, orchestrator, inventory):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    assert order_saga.status == SagaStatus.RUNNING
+
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("payment", SagaStatus.WAITING)
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CONFIRMED
+    # Waiting for the payment, nothing is due
+    assert await orchestrator.run_once() == 0
+
+    orchestrator.on_payment_event(payment_event(order_id))
+    orchestrator.on_payment_event(payment_event(order_id))  # redelivery changes nothing
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("sell", SagaStatus.COMPLETED)
+    order = crud.get_order(db, order_id)
+    assert (order.status, order.payment_status) == (models.OrderStatus.DELIVERED, models.PaymentStatus.PAID)
+    assert inventory["log"] == [("reserve_vehicle", 7), ("mark_as_sold", 7)]
+    assert events(db) == ["order.orderconfirmed", "order.orderpaid", "order.ordercompleted"]
+
+
+async def test_failed_payment_releases_the_reservation(db, orchestrator, inventory):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    await orchestrator.run_once()
+
+    orchestrator.on_payment_event(payment_event(order_id, "payment.failed"))
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.COMPENSATED)
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CANCELLED
+    assert inventory["log"][-1] == ("release_vehicle", 7)
+    assert events(db) == ["order.orderconfirmed", "order.ordercancelled"]
+
+
+async def test_reservation_is_released_when_the_order_step_fails(db, orchestrator, inventory):
+    """The order changes after the call to inventory-service; the reservation must not leak"""
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    # The order moves on its own between the start and the step
+    crud.update_order_status(db, order_id, schemas.OrderStatus.CANCELLED)
+
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.COMPENSATED)
+    assert inventory["log"] == [("reserve_vehicle", 7), ("release_vehicle", 7)]
+
+
+async def test_retry_after_the_order_step_does_not_reserve_again(db, orchestrator, inventory, monkeypatch):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    transition = transitions.transition
+
+    def fail_once(*args, **kwargs):
+        monkeypatch.setattr(transitions, "transition", transition)
+        raise Exception("database is locked")
+
+    monkeypatch.setattr(transitions, "transition", fail_once)
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.RUNNING)
+    assert db.get(models.OrderSaga, order_saga.id).remote_done
+
+    due(db, order_saga.id)
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("payment", SagaStatus.WAITING)
+    assert inventory["log"] == [("reserve_vehicle", 7)]
+
+
+async def test_step_is_retried_then_compensated(db, orchestrator, inventory):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    inventory["fail"].add("reserve_vehicle")
+
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.RUNNING)
+    assert db.get(models.OrderSaga, order_saga.id).attempts == 1
+
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.COMPENSATED)
+    assert "failed after 2 attempts" in db.get(models.OrderSaga, order_saga.id).last_error
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CANCELLED
+    # The reservation never went through: nothing to release
+    assert inventory["log"] == [("reserve_vehicle", 7), ("reserve_vehicle", 7)]
+    assert events(db) == ["order.ordercancelled"]
+
+
+async def test_payment_timeout_and_failing_compensation(db, orchestrator, inventory):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    await orchestrator.run_once()
+    # The payment deadline has passed and inventory-service is down
+    due(db, order_saga.id, deadline_at=datetime.utcnow() - timedelta(seconds=1))
+    inventory["fail"].add("release_vehicle")
+
+    await orchestrator.run_once()
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.FAILED)
+    assert "Compensation of reserve failed" in db.get(models.OrderSaga, order_saga.id).last_error
+    # The order keeps its reservation until someone looks at it
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CONFIRMED
+
+
+async def test_cancel_request_compensates_a_paid_saga(db, orchestrator, inventory):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    await orchestrator.run_once()
+    orchestrator.on_payment_event(payment_event(order_id))
+    inventory["fail"].add("mark_as_sold")
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("sell", SagaStatus.RUNNING)
+
+    assert orchestrator.cancel(db, order_id).id == order_saga.id
+    due(db, order_saga.id)
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.COMPENSATED)
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CANCELLED
+    assert events(db)[-2:] == ["order.orderrefundrequested", "order.ordercancelled"]
+
+
+async def test_cancel_after_the_sale_is_rejected_and_the_order_completes(db, orchestrator, inventory, monkeypatch):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    await orchestrator.run_once()
+    orchestrator.on_payment_event(payment_event(order_id))
+    transition = transitions.transition
+
+    def fail_delivery_once(*args, status=None, **kwargs):
+        if status != schemas.OrderStatus.DELIVERED:
+            return transition(*args, status=status, **kwargs)
+        monkeypatch.setattr(transitions, "transition", transition)
+        raise Exception("database is locked")
+
+    # inventory-service sells the vehicle, then the order update fails
+    monkeypatch.setattr(transitions, "transition", fail_delivery_once)
+    await orchestrator.run_once()
+    assert state(db, order_saga.id) == ("sell", SagaStatus.RUNNING)
+    assert db.get(models.OrderSaga, order_saga.id).remote_done
+
+    with pytest.raises(transitions.InvalidTransition):
+        orchestrator.cancel(db, order_id)
+    # A cancel request that slipped in before the sale does not undo it either
+    due(db, order_saga.id, cancel_requested=True)
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("sell", SagaStatus.COMPLETED)
+    assert crud.get_order(db, order_id).status == models.OrderStatus.DELIVERED
+    assert inventory["log"] == [("reserve_vehicle", 7), ("mark_as_sold", 7)]
+
+
+@pytest.fixture
+def interrupt(monkeypatch):
+    """Run `action` once, right after the executor checks whether the payment is known"""
+    def install(action):
+        step = saga.STEPS[saga.STEP_NAMES.index("payment")]
+        ready = step.ready
+
+        def check(order_saga):
+            known = ready(order_saga)
+            monkeypatch.setattr(step, "ready", ready)
+            action()
+            return known
+        monkeypatch.setattr(step, "ready", check)
+    return install
+
+
+async def test_payment_arriving_while_the_executor_parks_the_saga_is_not_lost(db, orchestrator, inventory,
+                                                                              interrupt):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    interrupt(lambda: orchestrator.on_payment_event(payment_event(order_id)))
+
+    await orchestrator.run_once()
+
+    # The stale "waiting until the payment deadline" is not saved; the saga goes on at once
+    assert state(db, order_saga.id) == ("sell", SagaStatus.COMPLETED)
+    assert inventory["log"] == [("reserve_vehicle", 7), ("mark_as_sold", 7)]
+
+
+async def test_cancel_arriving_while_the_executor_parks_the_saga_is_not_lost(db, orchestrator, inventory,
+                                                                             interrupt):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+    interrupt(lambda: orchestrator.cancel(db, order_id))
+
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("reserve", SagaStatus.COMPENSATED)
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CANCELLED
+    assert inventory["log"] == [("reserve_vehicle", 7), ("release_vehicle", 7)]
+
+
+async def test_payment_arriving_during_a_call_keeps_the_call_checkpointed(db, orchestrator, inventory,
+                                                                          monkeypatch):
+    order_id = create_order(db)
+    order_saga = orchestrator.start_saga(db, order_id)
+
+    async def reserve(vehicle_id, **kwargs):
+        inventory["log"].append(("reserve_vehicle", vehicle_id))
+        orchestrator.on_payment_event(payment_event(order_id))
+        return {"status": "ok"}
+    monkeypatch.setattr(inventory_client, "reserve_vehicle", reserve)
+
+    await orchestrator.run_once()
+
+    assert state(db, order_saga.id) == ("sell", SagaStatus.COMPLETED)
+    assert inventory["log"] == [("reserve_vehicle", 7), ("mark_as_sold", 7)]
+
+
+async def test_executor_keeps_the_event_loop_free_while_it_uses_the_database(db, orchestrator, inventory,
+                                                                             monkeypatch):
+    order_id = create_order(db)
+    orchestrator.start_saga(db, order_id)
+    get_order = crud.get_order
+
+    def slow_get_order(*args, **kwargs):
+        time.sleep(0.05)
+        return get_order(*args, **kwargs)
+    monkeypatch.setattr(crud, "get_order", slow_get_order)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await orchestrator.run_once()
+    task.cancel()
+
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CONFIRMED
+    assert ticks >= 5
+
+
+async def test_start_and_cancel_without_a_saga(db, orchestrator, inventory):
+    order_id = create_order(db)
+    orchestrator.start_saga(db, order_id)
+    with pytest.raises(saga.SagaConflict):
+        orchestrator.start_saga(db, order_id)
+    assert orchestrator.start_saga(db, 999) is None
+
+    # No reservation yet: cancelled at once
+    other_id = create_order(db)
+    assert orchestrator.cancel(db, other_id).status == models.OrderStatus.CANCELLED
+    with pytest.raises(transitions.InvalidTransition):
+        orchestrator.cancel(db, other_id)
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from service_modules import load_service_modules
+
+crud, models, schemas, transitions, outbox = load_service_modules(
+    "sales-service", "crud", "models", "schemas", "transitions", "shared.outbox")
+OutboxBase, OutboxEvent = outbox.OutboxBase, outbox.OutboxEvent
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    OutboxBase.metadata.create_all(bind=engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper()))
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.statements = statements
+    yield session
+    session.close()
+
+
+def create(db, count=1):
+    """Ids of new orders; the session starts empty, as in a request"""
+    ids = [crud.create_order(db, schemas.OrderCreate(customer_id=1, vehicle_id=i), base_price=100.0,
+                             final_price=90.0, vin=f"VIN{i}").id for i in range(count)]
+    db.expunge_all()
+    db.statements.clear()
+    return ids
+
+
+def test_transition_is_one_update_with_history_and_event(db):
+    order_id = create(db)[0]
+    confirmed = crud.update_order_status(db, order_id, schemas.OrderStatus.CONFIRMED, event_type="OrderConfirmed")
+
+    assert confirmed.status == models.OrderStatus.CONFIRMED
+    assert confirmed.confirmed_at is not None
+    # UPDATE ... RETURNING, history, outbox; nothing is read back after the commit
+    assert db.statements == ["UPDATE", "INSERT", "INSERT"]
+    assert [row.notes for row in crud.get_order_history(db, order_id)][0] == "Status changed to confirmed"
+    assert db.query(OutboxEvent).filter_by(routing_key="order.orderconfirmed").count() == 1
+
+
+def test_invalid_transition_changes_nothing(db):
+    order_id = create(db)[0]
+    crud.update_order_status(db, order_id, schemas.OrderStatus.CANCELLED)
+
+    with pytest.raises(transitions.InvalidTransition):
+        crud.update_order_status(db, order_id, schemas.OrderStatus.CONFIRMED, event_type="OrderConfirmed")
+    assert crud.get_order(db, order_id).status == models.OrderStatus.CANCELLED
+    assert len(crud.get_order_history(db, order_id)) == 2
+    assert crud.update_order_status(db, 404, schemas.OrderStatus.CONFIRMED) is None
+
+
+def test_bulk_transition_skips_orders_that_cannot_move(db):
+    order_ids = create(db, 4)
+    crud.update_payment_status(db, order_ids[0], schemas.PaymentStatus.PAID)
+    db.statements.clear()
+
+    paid, rejected = transitions.transition_many(db, order_ids + [404], payment_status=models.PaymentStatus.PAID)
+    assert sorted(order.id for order in paid) == order_ids[1:]
+    assert rejected == [order_ids[0], 404]
+    assert db.statements == ["UPDATE", "INSERT"]
+    assert db.query(models.OrderHistory).filter_by(notes="Payment status changed to paid").count() == 4
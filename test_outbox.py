@@ -0,0 +1,178 @@
+import asyncio
+
+import pika
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared import outbox
+from shared.envelope import decode_event
+from shared.outbox import OutboxBase, OutboxEvent, OutboxRelay
+
+Base = declarative_base()
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20))
+
+
+class FlakyBroker:
+    """Publisher pool stand-in that can be taken down and brought back"""
+
+    def __init__(self):
+        self.down = False
+        self.nack_keys = set()
+        self.messages = []
+        self.batches = []
+
+    def publish_batch(self, messages, confirm=False):
+        self.batches.append(len(messages))
+        if self.down:
+            error = pika.exceptions.AMQPConnectionError("broker down")
+            error.sent = 0
+            raise error
+        for sent, (exchange, routing_key, body, properties) in enumerate(messages):
+            if routing_key in self.nack_keys:
+                error = pika.exceptions.NackError([])
+                error.sent = sent
+                raise error
+            self.messages.append((routing_key, decode_event(body, properties.content_type)))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+    Base.metadata.create_all(bind=engine)
+    OutboxBase.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def change_order(session_factory, order_id, status, commit=True):
+    """Business write and its event in one transaction"""
+    db = session_factory()
+    order = db.get(Order, order_id)
+    if order is None:
+        order = Order(id=order_id)
+        db.add(order)
+    order.status = status
+    outbox.add_event(db, "autosalon", f"order.{status}", {"order_id": order_id}, "order", order_id)
+    if commit:
+        db.commit()
+    else:
+        db.rollback()
+    db.close()
+
+
+def test_event_is_written_only_with_its_transaction(session_factory):
+    change_order(session_factory, 1, "created")
+    change_order(session_factory, 2, "created", commit=False)
+
+    db = session_factory()
+    assert db.query(Order).count() == 1
+    assert [row.aggregate_id for row in db.query(OutboxEvent).all()] == ["1"]
+    db.close()
+
+
+def test_relay_publishes_in_commit_order(session_factory):
+    broker = FlakyBroker()
+    relay = OutboxRelay(session_factory, pool=broker)
+    for status in ("created", "confirmed", "delivered"):
+        change_order(session_factory, 1, status)
+
+    assert relay.relay_once() == 3
+    assert [key for key, _ in broker.messages] == ["order.created", "order.confirmed", "order.delivered"]
+    assert broker.messages[0][1]["payload"] == {"order_id": 1}
+    assert relay.pending() == 0
+    # One batch, confirmed once
+    assert broker.batches == [3]
+    # Nothing is sent twice
+    assert relay.relay_once() == 0
+
+
+def test_events_survive_broker_downtime(session_factory):
+    broker = FlakyBroker()
+    relay = OutboxRelay(session_factory, pool=broker)
+    broker.down = True
+    change_order(session_factory, 1, "created")
+    change_order(session_factory, 2, "created")
+
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        relay.relay_once()
+    assert relay.pending() == 2
+    db = session_factory()
+    assert db.query(OutboxEvent).order_by(OutboxEvent.id).first().attempts == 1
+    db.close()
+
+    broker.down = False
+    change_order(session_factory, 1, "confirmed")
+    assert relay.relay_once() == 3
+    assert [(key, body["payload"]["order_id"]) for key, body in broker.messages] == [
+        ("order.created", 1), ("order.created", 2), ("order.confirmed", 1)
+    ]
+
+
+def test_failed_event_holds_back_its_aggregate_only(session_factory):
+    broker = FlakyBroker()
+    relay = OutboxRelay(session_factory, pool=broker)
+    broker.nack_keys.add("order.created")
+    change_order(session_factory, 1, "created")
+    change_order(session_factory, 1, "confirmed")
+    change_order(session_factory, 2, "paid")
+
+    assert relay.relay_once() == 1
+    assert [key for key, _ in broker.messages] == ["order.paid"]
+
+    broker.nack_keys.clear()
+    assert relay.relay_once() == 2
+    assert [key for key, _ in broker.messages] == ["order.paid", "order.created", "order.confirmed"]
+
+
+def test_failure_mid_batch_keeps_the_confirmed_rows(session_factory):
+    broker = FlakyBroker()
+    relay = OutboxRelay(session_factory, pool=broker)
+    broker.nack_keys.add("order.confirmed")
+    change_order(session_factory, 1, "created")
+    change_order(session_factory, 2, "created")
+    change_order(session_factory, 1, "confirmed")
+    change_order(session_factory, 2, "paid")
+    change_order(session_factory, 1, "delivered")
+    change_order(session_factory, 2, "delivered")
+
+    assert relay.relay_once() == 4
+    # The rest of the batch goes out once the failed aggregate is set aside
+    assert broker.batches == [6, 2]
+    assert [(key, body["payload"]["order_id"]) for key, body in broker.messages] == [
+        ("order.created", 1), ("order.created", 2), ("order.paid", 2), ("order.delivered", 2)
+    ]
+    db = session_factory()
+    failed = db.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).order_by(OutboxEvent.id).all()
+    assert [(row.routing_key, row.attempts) for row in failed] == [("order.confirmed", 1), ("order.delivered", 0)]
+    db.close()
+
+
+async def test_background_relay_recovers_after_outage(session_factory):
+    broker = FlakyBroker()
+    relay = OutboxRelay(session_factory, pool=broker, poll_interval=0.01, max_backoff=0.05)
+    broker.down = True
+    change_order(session_factory, 1, "created")
+    relay.start()
+    try:
+        await asyncio.sleep(0.2)
+        assert broker.messages == []
+        assert relay.failures > 0
+
+        broker.down = False
+        for _ in range(100):
+            if relay.pending() == 0:
+                break
+            await asyncio.sleep(0.02)
+        assert [key for key, _ in broker.messages] == ["order.created"]
+    finally:
+        await relay.stop()
@@ -0,0 +1,75 @@
+import importlib.util
+import os
+
+import httpx
+import pytest
+
+spec = importlib.util.spec_from_file_location(
+    "service_client", os.path.join(os.path.dirname(__file__), "sales-service", "clients", "service_client.py"))
+service_client = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(service_client)
+
+
+def make_client(responses, **options):
+    """Client whose upstream answers with `responses` in turn; an exception is raised as is"""
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        response = responses[min(len(seen), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return httpx.Response(response, json={"n": len(seen)})
+
+    options.setdefault("backoff_base", 0)
+    client = service_client.ServiceClient("inventory-service", "http://inventory",
+                                          transport=httpx.MockTransport(handler), **options)
+    return client, seen
+
+
+async def test_get_is_retried_on_unavailable_and_connection_errors():
+    client, seen = make_client([503, httpx.ConnectError("refused"), 200])
+    response = await client.get("/inventory/7", operation="check_availability")
+
+    assert response.status_code == 200
+    assert len(seen) == 3
+    stats = client.stats()
+    assert (stats["calls"], stats["attempts"], stats["retried"], stats["failed"]) == (1, 3, 2, 0)
+    assert stats["latency"]["check_availability"]["count"] == 1
+    await client.close()
+
+
+async def test_post_is_never_retried():
+    client, seen = make_client([503, 200])
+    response = await client.post("/inventory/reserve", json={"vehicle_id": 7})
+    assert response.status_code == 503
+    assert len(seen) == 1
+
+    client, seen = make_client([httpx.ConnectError("refused"), 200])
+    with pytest.raises(httpx.ConnectError):
+        await client.post("/inventory/reserve", json={"vehicle_id": 7})
+    assert len(seen) == 1
+    assert client.stats()["retried"] == 0
+    await client.close()
+
+
+async def test_retries_are_bounded():
+    client, seen = make_client([httpx.ConnectError("refused")], retries=2)
+    with pytest.raises(httpx.ConnectError):
+        await client.get("/inventory/7")
+    assert len(seen) == 3
+    assert client.failed == 1
+
+    client, seen = make_client([404])
+    assert (await client.get("/inventory/7")).status_code == 404
+    assert len(seen) == 1
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = service_client.LatencyHistogram()
+    for ms in [3] * 90 + [40] * 9 + [700]:
+        histogram.observe(ms)
+    stats = histogram.to_dict()
+    assert (stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]) == (5, 50, 50, 700)
+    assert stats["buckets"]["le_5"] == 90
+    assert stats["buckets"]["le_inf"] == 100